@@ -1,17 +1,20 @@
 from flask import Flask
-from app.routes.hello import hello_bp
-from app.routes.simulate import simulate_bp
-from app.routes.stocks import stocks_bp
-from app.routes.optimize import optimize_bp
-from app.routes.backtest import backtest_bp
-from app.routes.fetch import fetch_bp
-from app.routes.agentic_rag import agentic_rag_bp
 
 
 def create_app():
     """
     Application factory function to create and configure the Flask app.
     """
+    # Imported here so process-pool workers (app.workers), which import
+    # app.* modules by reference, do not load every blueprint
+    from app.routes.hello import hello_bp
+    from app.routes.simulate import simulate_bp
+    from app.routes.stocks import stocks_bp
+    from app.routes.optimize import optimize_bp
+    from app.routes.backtest import backtest_bp
+    from app.routes.fetch import fetch_bp
+    from app.routes.agentic_rag import agentic_rag_bp
+
     app = Flask(__name__)
 
     # Register Blueprints
@@ -0,0 +1,272 @@
+"""
+Covariance estimators with a cross-request cache.
+
+Estimators (ESTIMATORS):
+- "sample": unbiased sample covariance (same as DataFrame.cov())
+- "ledoit_wolf": Ledoit-Wolf shrinkage towards a scaled identity
+- "ewma": exponentially weighted covariance (halflife in trading days)
+- "factor": statistical factor model (PCA with K factors plus diagonal
+  specific variance), returned as a FactorCovariance that is never
+  materialized as an N x N matrix
+
+Estimates are cached keyed by (sorted ticker set, window, estimator, last
+data date). A request for a sub-basket of a cached basket over the same
+dates is answered by slicing the cached matrix, which is exact for the
+sample and EWMA estimators (every entry only depends on its own pair of
+columns). Ledoit-Wolf shrinkage and PCA factors depend on the whole basket,
+so they are only served from exact-key hits.
+
+Configuration (environment):
+- COV_CACHE_SIZE: maximum number of cached matrices (default 64)
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+COV_CACHE_SIZE = int(os.environ.get("COV_CACHE_SIZE", "64"))
+DEFAULT_HALFLIFE = 63
+DEFAULT_FACTORS = 10
+
+
+# ----------------- Estimators -----------------
+
+
+def sample_covariance(X: np.ndarray) -> np.ndarray:
+    return np.cov(X, rowvar=False)
+
+
+def ledoit_wolf_covariance(X: np.ndarray) -> np.ndarray:
+    """Ledoit & Wolf (2004) shrinkage of the (biased) sample covariance"""
+    n_samples, n_features = X.shape
+    X = X - X.mean(axis=0)
+    emp_cov = X.T @ X / n_samples
+    mu = np.trace(emp_cov) / n_features
+
+    delta = np.sum((emp_cov - mu * np.eye(n_features)) ** 2) / n_features
+    X2 = X ** 2
+    beta = np.sum(X2.T @ X2 / n_samples - emp_cov ** 2) / (n_features * n_samples)
+    shrinkage = min(beta, delta) / delta if delta > 0 else 1.0
+
+    cov = (1 - shrinkage) * emp_cov
+    cov[np.diag_indices(n_features)] += shrinkage * mu
+    return cov
+
+
+def ewma_covariance(X: np.ndarray, halflife: float = DEFAULT_HALFLIFE) -> np.ndarray:
+    """Exponentially weighted covariance, most recent row weighted highest"""
+    n_samples = X.shape[0]
+    weights = 0.5 ** (np.arange(n_samples)[::-1] / halflife)
+    weights /= weights.sum()
+    X = X - weights @ X
+    return (X.T * weights) @ X
+
+
+class FactorCovariance:
+    """
+    Covariance in factored form: B B' + diag(d), with B the (N x K) factor
+    loadings scaled by the factor volatilities and d the specific variances.
+    Supports the operations the optimizers use (C @ x, x @ C, W @ C,
+    .diagonal(), scalar multiplication) at O(NK) time and memory, so it can
+    stand in for a dense matrix.
+    """
+
+    ndim = 2
+    # Make numpy defer `array @ FactorCovariance` to __rmatmul__
+    __array_ufunc__ = None
+
+    def __init__(self, loadings: np.ndarray, specific_var: np.ndarray, tickers=None):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific_var = np.asarray(specific_var, dtype=float)
+        self.tickers = list(tickers) if tickers is not None else None
+
+    @classmethod
+    def fit(cls, X: np.ndarray, n_factors: int = DEFAULT_FACTORS, tickers=None) -> "FactorCovariance":
+        """PCA of the (dates x assets) returns, keeping the top n_factors"""
+        n_samples, n_features = X.shape
+        k = max(1, min(n_factors, n_samples - 1, n_features - 1))
+        X = X - X.mean(axis=0)
+        # Thin SVD: cost O(T^2 N), never forms X'X
+        _, s, Vt = np.linalg.svd(X, full_matrices=False)
+        loadings = Vt[:k].T * (s[:k] / np.sqrt(n_samples - 1))
+        total_var = np.einsum('ij,ij->j', X, X) / (n_samples - 1)
+        # Floor keeps the matrix positive definite when a factor explains a stock fully
+        specific_var = np.maximum(total_var - np.einsum('ij,ij->i', loadings, loadings), 1e-4 * total_var)
+        return cls(loadings, specific_var, tickers)
+
+    @property
+    def shape(self):
+        n = len(self.specific_var)
+        return (n, n)
+
+    @property
+    def T(self):
+        return self
+
+    @property
+    def n_factors(self):
+        return self.loadings.shape[1]
+
+    def diagonal(self) -> np.ndarray:
+        return np.einsum('ij,ij->i', self.loadings, self.loadings) + self.specific_var
+
+    def __matmul__(self, x):
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1:
+            return self.loadings @ (self.loadings.T @ x) + self.specific_var * x
+        return self.loadings @ (self.loadings.T @ x) + self.specific_var[:, None] * x
+
+    def __rmatmul__(self, x):
+        # Symmetric: x @ C == (C @ x')'
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1:
+            return self @ x
+        return (x @ self.loadings) @ self.loadings.T + x * self.specific_var
+
+    def __mul__(self, scalar):
+        return FactorCovariance(self.loadings * np.sqrt(scalar), self.specific_var * scalar, self.tickers)
+
+    __rmul__ = __mul__
+
+    def padded(self, n: int) -> "FactorCovariance":
+        """Same covariance over the first assets of an n-variable problem (zeros elsewhere)"""
+        extra = n - len(self.specific_var)
+        return FactorCovariance(
+            np.vstack([self.loadings, np.zeros((extra, self.n_factors))]),
+            np.concatenate([self.specific_var, np.zeros(extra)]),
+        )
+
+    def select(self, tickers) -> "FactorCovariance":
+        index = {t: i for i, t in enumerate(self.tickers)}
+        rows = [index[t] for t in tickers]
+        return FactorCovariance(self.loadings[rows], self.specific_var[rows], tickers)
+
+    def to_dense(self) -> np.ndarray:
+        cov = self.loadings @ self.loadings.T
+        cov[np.diag_indices_from(cov)] += self.specific_var
+        return cov
+
+
+ESTIMATORS = {
+    "sample": sample_covariance,
+    "ledoit_wolf": ledoit_wolf_covariance,
+    "ewma": ewma_covariance,
+    "factor": FactorCovariance.fit,
+}
+
+# Estimators whose entries only depend on their own two columns
+SLICEABLE = {"sample", "ewma"}
+
+
+def _select(cov, tickers):
+    if isinstance(cov, FactorCovariance):
+        return cov.select(tickers)
+    return cov.loc[tickers, tickers]
+
+
+def cov_to_corr(cov):
+    """
+    Correlation matrix as a DataFrame; a FactorCovariance stays factored,
+    as the correlation L L' + diag(s) with unit diagonal (O(NK))
+    """
+    if isinstance(cov, FactorCovariance):
+        std = np.sqrt(cov.diagonal())
+        return FactorCovariance(cov.loadings / std[:, None], cov.specific_var / std ** 2, cov.tickers)
+    std = np.sqrt(np.diag(cov.values))
+    corr = np.clip(cov.values / np.outer(std, std), -1, 1)
+    np.fill_diagonal(corr, 1.0)
+    return pd.DataFrame(corr, index=cov.index, columns=cov.columns)
+
+
+# ----------------- Cache -----------------
+
+
+class CovarianceCache:
+    """Thread-safe LRU cache of covariance matrices"""
+
+    def __init__(self, max_entries: int = COV_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.slices = 0
+        self.misses = 0
+
+    def get(self, tickers, window, estimator, dates) -> Tuple[Optional[pd.DataFrame], str]:
+        """
+        Cached covariance for `tickers` (in that order) estimated over exactly
+        `dates`, and how it was found
+        """
+        key = (frozenset(tickers), window, estimator, dates[-1])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["dates"].equals(dates):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _select(entry["cov"], tickers), "hit"
+
+            if estimator.split(":")[0] in SLICEABLE:
+                wanted = set(tickers)
+                for (names, w, est, last), entry in reversed(self._entries.items()):
+                    if (w == window and est == estimator and last == dates[-1]
+                            and wanted <= names and entry["dates"].equals(dates)):
+                        self._entries.move_to_end((names, w, est, last))
+                        self.slices += 1
+                        return _select(entry["cov"], tickers), "slice"
+
+            self.misses += 1
+            return None, "miss"
+
+    def put(self, cov, window, estimator, dates):
+        names = cov.tickers if isinstance(cov, FactorCovariance) else cov.columns
+        key = (frozenset(names), window, estimator, dates[-1])
+        with self._lock:
+            self._entries[key] = {"cov": cov, "dates": dates}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "slices": self.slices, "misses": self.misses}
+
+
+_cache = CovarianceCache()
+
+
+def get_covariance(returns: pd.DataFrame, estimator: str = "sample", window: Optional[int] = None,
+                   halflife: float = DEFAULT_HALFLIFE, n_factors: int = DEFAULT_FACTORS):
+    """
+    Covariance of the daily returns frame (dates x tickers) over its last
+    `window` rows (all rows if None). Returns (covariance in the frame's
+    column order, "hit" | "slice" | "miss"). The covariance is a DataFrame,
+    or a FactorCovariance for the "factor" estimator.
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown covariance estimator: {estimator}. Choose from {sorted(ESTIMATORS)}")
+    if window is not None:
+        returns = returns.iloc[-window:]
+
+    tickers = returns.columns.tolist()
+    # Estimator parameters are part of what makes two estimates comparable
+    cache_name = {"ewma": f"ewma:{halflife}", "factor": f"factor:{n_factors}"}.get(estimator, estimator)
+
+    cov, source = _cache.get(tickers, window, cache_name, returns.index)
+    if cov is not None:
+        return cov, source
+
+    X = returns.values.astype(float)
+    if estimator == "factor":
+        cov = FactorCovariance.fit(X, n_factors, tickers)
+    else:
+        matrix = ewma_covariance(X, halflife) if estimator == "ewma" else ESTIMATORS[estimator](X)
+        cov = pd.DataFrame(matrix, index=tickers, columns=tickers)
+    _cache.put(cov, window, cache_name, returns.index)
+    return cov, "miss"
+
+
+def cache_stats():
+    return _cache.stats()
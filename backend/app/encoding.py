@@ -0,0 +1,236 @@
+"""
+Content negotiation for array-heavy responses.
+
+Routes hand encode_response a payload whose bulky parts are still numpy
+arrays (1-D numeric) or DataFrames, and it serializes them in the format
+the client asked for, via the Accept header or a ?format= override:
+
+- "json" (application/json, the default): the usual JSON document. Arrays
+  become lists and DataFrames lists of row records, with timestamps as HTTP
+  dates like Flask's encoder. orjson serializes it when installed (numpy
+  arrays natively), Flask's JSON provider otherwise.
+- "columnar" (application/vnd.columnar+json): the same document, but every
+  array is {"dtype", "shape", "data"} with `data` the base64 of its
+  little-endian bytes, ready for a typed array on the client. Floats are sent
+  as float32, integers as int32 (float64 if out of range), and timestamps
+  as float64 epoch milliseconds with "unit": "ms". A DataFrame becomes
+  {"length", "columns": {name: array}}.
+- "arrow" (application/vnd.apache.arrow.stream, needs pyarrow): Arrow IPC
+  streams written back to back, one record batch each, with the same dtypes
+  as "columnar". Each DataFrame of the payload is one table, and its 1-D
+  arrays make one table per distinct length, as columns named by their
+  dotted path. The "table" entry of each schema's metadata is the dotted
+  path of the frame (or of the arrays' common parent); the rest of the
+  payload is JSON in the "payload" entry of the first schema. Read streams
+  until the body ends (pyarrow: ipc.open_stream again on the same reader;
+  Arrow JS: RecordBatchReader.readAll).
+
+Bodies of COMPRESS_MIN_BYTES or more are compressed with zstd (with the
+zstandard package) or gzip when the Accept-Encoding header allows it.
+"""
+
+import base64
+import gzip
+import numpy as np
+import pandas as pd
+from flask import Response, current_app, request
+
+try:
+    import orjson
+except ImportError:  # Flask's JSON provider is the fallback
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON_TYPE = "application/json"
+COLUMNAR_TYPE = "application/vnd.columnar+json"
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+FORMATS = {"json": JSON_TYPE, "columnar": COLUMNAR_TYPE, "arrow": ARROW_TYPE}
+COMPRESS_MIN_BYTES = 1024
+HTTP_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+def negotiate_format():
+    """Requested response format name (?format= first, then Accept); None if it cannot be served"""
+    name = request.args.get("format")
+    if name is not None:
+        if name not in FORMATS or (name == "arrow" and pa is None):
+            return None
+        return name
+    offered = [JSON_TYPE, COLUMNAR_TYPE] + ([ARROW_TYPE] if pa is not None else [])
+    mimetype = request.accept_mimetypes.best_match(offered, default=JSON_TYPE)
+    return {v: k for k, v in FORMATS.items()}[mimetype]
+
+
+# ----------------- Arrays -----------------
+
+
+def _compact(values):
+    """Compact form of a 1-D column: (numpy array, extra JSON fields) or None for non-numeric data"""
+    if pd.api.types.is_datetime64_any_dtype(getattr(values, "dtype", None)):
+        index = pd.DatetimeIndex(values).as_unit("ms")
+        ms = index.asi8.astype("<f8")
+        ms[index.isna()] = np.nan
+        return ms, {"unit": "ms"}
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return values.astype("<f4"), {}
+    if values.dtype.kind in "iub":
+        if values.size == 0 or (values.min() >= -2**31 and values.max() < 2**31):
+            return values.astype("<i4"), {}
+        return values.astype("<f8"), {}
+    return None
+
+
+def _base64_array(values):
+    compact = _compact(values)
+    if compact is None:
+        return [None if pd.isna(v) else v for v in values]
+    array, extra = compact
+    return {"dtype": array.dtype.name, "shape": list(array.shape),
+            "data": base64.b64encode(array.tobytes()).decode("ascii"), **extra}
+
+
+def _column_values(series: pd.Series):
+    """JSON-ready values of a DataFrame column (HTTP dates for timestamps, None for NaN)"""
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        series = series.dt.tz_convert("UTC")
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return [None if pd.isna(v) else v for v in series.dt.strftime(HTTP_DATE_FORMAT)]
+    if series.dtype.kind in "iubf":
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _records(df: pd.DataFrame):
+    names = [str(c) for c in df.columns]
+    return [dict(zip(names, row)) for row in zip(*(_column_values(df[c]) for c in df.columns))]
+
+
+def _to_json_tree(node, columnar=False):
+    """Payload with arrays and DataFrames in their JSON or columnar form"""
+    if isinstance(node, dict):
+        return {k: _to_json_tree(v, columnar) for k, v in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_to_json_tree(v, columnar) for v in node]
+    if isinstance(node, pd.DataFrame):
+        if columnar:
+            return {"length": len(node), "columns": {str(c): _base64_array(node[c]) for c in node.columns}}
+        return _records(node)
+    if isinstance(node, np.ndarray):
+        if columnar:
+            return _base64_array(node)
+        # orjson writes contiguous numeric arrays itself
+        if orjson is not None and node.dtype.kind in "fiub":
+            return np.ascontiguousarray(node)
+        return node.tolist()
+    return node
+
+
+def dumps(payload) -> bytes:
+    """Fast JSON bytes of a JSON-ready payload (NaN becomes null with orjson)"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return current_app.json.dumps(payload).encode("utf-8")
+
+
+# ----------------- Arrow -----------------
+
+
+def _split_tables(payload):
+    """([(table path, columns {name: values})], rest of the payload) for the Arrow streams"""
+    leaves = []
+
+    def walk(node, path):
+        for key, value in node.items():
+            if isinstance(value, dict):
+                walk(value, path + [str(key)])
+            elif isinstance(value, (pd.DataFrame, np.ndarray)):
+                leaves.append((path + [str(key)], value))
+
+    walk(payload, [])
+    tables, taken = [], []
+    for path, df in leaves:
+        if isinstance(df, pd.DataFrame):
+            tables.append((".".join(path), {str(c): df[c] for c in df.columns}))
+            taken.append(path)
+    # 1-D arrays are grouped by length, in order of first appearance
+    groups = {}
+    for path, values in leaves:
+        if isinstance(values, np.ndarray) and values.ndim == 1:
+            groups.setdefault(len(values), []).append((path, values))
+            taken.append(path)
+    for arrays in groups.values():
+        paths = [p for p, _ in arrays]
+        common = 0
+        while all(len(p) > common + 1 and p[common] == paths[0][common] for p in paths):
+            common += 1
+        tables.append((".".join(paths[0][:common]), {".".join(p): v for p, v in arrays}))
+
+    def prune(node, prefix):
+        return {k: prune(v, prefix + [str(k)]) if isinstance(v, dict) else v
+                for k, v in node.items() if prefix + [str(k)] not in taken}
+
+    return tables or [("", {})], prune(payload, [])
+
+
+def _arrow_stream(payload) -> bytes:
+    tables, rest = _split_tables(payload)
+    sink = pa.BufferOutputStream()
+    for i, (table_path, columns) in enumerate(tables):
+        arrays = {}
+        for name, values in columns.items():
+            compact = _compact(values)
+            if compact is not None and "unit" in compact[1]:
+                arrays[name] = pa.array(pd.DatetimeIndex(values).as_unit("ms"))
+            elif compact is not None:
+                arrays[name] = pa.array(compact[0])
+            else:
+                arrays[name] = pa.array([None if pd.isna(v) else v for v in values])
+        metadata = {"table": table_path}
+        if i == 0:
+            metadata["payload"] = dumps(_to_json_tree(rest))
+        batch = pa.RecordBatch.from_pydict(arrays, metadata=metadata)
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+# ----------------- Response -----------------
+
+
+def _compress(body: bytes):
+    """(body, Content-Encoding or None) for the client's Accept-Encoding"""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = request.accept_encodings
+    if zstandard is not None and accepted["zstd"]:
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+
+def encode_response(payload, status: int = 200) -> Response:
+    """Flask response for a payload of JSON values, 1-D numpy arrays and DataFrames, in the negotiated format"""
+    fmt = negotiate_format()
+    if fmt is None:
+        available = [f for f in FORMATS if f != "arrow" or pa is not None]
+        body, fmt, status = dumps({"error": f"format must be one of {available}."}), "json", 406
+    elif fmt == "arrow":
+        body = _arrow_stream(payload)
+    else:
+        body = dumps(_to_json_tree(payload, columnar=fmt == "columnar"))
+
+    body, encoding = _compress(body)
+    response = Response(body, status=status, mimetype=FORMATS[fmt])
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(["Accept", "Accept-Encoding"])
+    return response
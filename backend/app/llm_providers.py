@@ -0,0 +1,275 @@
+"""
+LLM provider abstraction with hedged requests.
+
+A HedgedLLM sends a prompt to its primary provider and, if no usable answer
+has arrived after `hedge_delay` seconds, sends the same prompt to the next
+provider. The first response that passes validation wins; the slower call is
+cancelled if it has not started yet, otherwise its result is discarded.
+Every provider records its call latency in a LatencyHistogram.
+"""
+
+import os
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+
+# ----------------- Configuration -----------------
+
+HEDGE_DELAY = float(os.environ.get("LLM_HEDGE_DELAY", "8"))
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+GROQ_MODEL = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32, 64, float("inf"))
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+# ----------------- Latency Histograms -----------------
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, safe to update from worker threads"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool = True):
+        with self._lock:
+            for i, upper in enumerate(self.buckets):
+                if seconds <= upper:
+                    self.counts[i] += 1
+                    break
+            self.total += seconds
+            if not ok:
+                self.errors += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Bucket upper bound containing the q-th quantile"""
+        count = sum(self.counts)
+        if count == 0:
+            return None
+        target = q * count
+        seen = 0
+        for upper, c in zip(self.buckets, self.counts):
+            seen += c
+            if seen >= target:
+                return upper
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            count = sum(self.counts)
+            return {
+                "count": count,
+                "errors": self.errors,
+                "mean_s": round(self.total / count, 3) if count else None,
+                "p50_le_s": self.quantile(0.5),
+                "p99_le_s": self.quantile(0.99),
+                "buckets": {
+                    ("+inf" if upper == float("inf") else str(upper)): c
+                    for upper, c in zip(self.buckets, self.counts)
+                },
+            }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    with _histograms_lock:
+        if name not in _histograms:
+            _histograms[name] = LatencyHistogram()
+        return _histograms[name]
+
+
+def latency_stats() -> Dict[str, Dict]:
+    """Latency histogram snapshots for every provider used so far"""
+    with _histograms_lock:
+        names = list(_histograms)
+    return {name: get_histogram(name).snapshot() for name in names}
+
+
+# ----------------- Providers -----------------
+
+
+class LLMProvider(ABC):
+    """Base provider: subclasses implement _generate(prompt, timeout) -> str"""
+
+    name = "provider"
+
+    def generate(self, prompt: str, timeout: float = 60) -> str:
+        start = time.time()
+        ok = False
+        try:
+            text = self._generate(prompt, timeout)
+            ok = True
+            return text
+        finally:
+            get_histogram(self.name).record(time.time() - start, ok)
+
+    @abstractmethod
+    def _generate(self, prompt: str, timeout: float) -> str:
+        """Response text for the prompt, within `timeout` seconds"""
+
+
+class GeminiProvider(LLMProvider):
+    """Wraps a google.generativeai GenerativeModel"""
+
+    def __init__(self, model, name: str = "gemini"):
+        self.model = model
+        self.name = name
+
+    def _generate(self, prompt: str, timeout: float) -> str:
+        response = self.model.generate_content(
+            prompt, request_options={"timeout": timeout}
+        )
+        return response.text.strip()
+
+
+class GroqProvider(LLMProvider):
+    """Groq chat completions through its OpenAI-compatible endpoint"""
+
+    def __init__(self, api_key: str, model: str = GROQ_MODEL, name: str = "groq"):
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=api_key, base_url=GROQ_BASE_URL)
+        self.model = model
+        self.name = name
+
+    def _generate(self, prompt: str, timeout: float) -> str:
+        r = self.client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+            temperature=0.1,
+            max_tokens=4000,
+            timeout=timeout,
+        )
+        return r.choices[0].message.content.strip()
+
+
+_groq_providers: Dict[str, GroqProvider] = {}
+_groq_providers_lock = threading.Lock()
+
+
+def get_groq_provider() -> Optional[GroqProvider]:
+    """
+    Groq provider if GROQ_API_KEY is set, else None. The provider (and its
+    client's HTTP connection pool) is created once per key and shared.
+    """
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        return None
+    with _groq_providers_lock:
+        if api_key not in _groq_providers:
+            _groq_providers[api_key] = GroqProvider(api_key)
+        return _groq_providers[api_key]
+
+
+# ----------------- Hedged Requests -----------------
+
+
+class HedgedLLM:
+    """
+    Send a prompt to providers in order, starting the next one only when the
+    previous ones have not produced a valid answer within `hedge_delay`.
+    """
+
+    def __init__(self, providers: List[LLMProvider], hedge_delay: float = HEDGE_DELAY):
+        if not providers:
+            raise ValueError("HedgedLLM needs at least one provider")
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+
+    def generate(
+        self,
+        prompt: str,
+        timeout: float = 60,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """
+        Return the first response that passes `validate` (any response if no
+        validator is given). If every provider fails validation, the first
+        response received is returned so the caller can report it. Raises the
+        last provider error if no provider returned anything.
+        """
+        deadline = time.time() + timeout
+        futures = {}
+        next_provider = 0
+        first_text = None
+        last_error = None
+
+        def launch():
+            nonlocal next_provider
+            provider = self.providers[next_provider]
+            next_provider += 1
+            remaining = max(deadline - time.time(), 1)
+            future = _executor.submit(provider.generate, prompt, remaining)
+            futures[future] = provider
+            if next_provider > 1:
+                logger.info(f"  ⏱️  Hedging LLM request to {provider.name}")
+            return future
+
+        pending = {launch()}
+        try:
+            while pending or next_provider < len(self.providers):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                if not pending:
+                    pending = {launch()}
+                    continue
+
+                # Wait for an answer, but no longer than the hedge delay while
+                # there are still providers left to try
+                wait_for = remaining
+                if next_provider < len(self.providers):
+                    wait_for = min(remaining, self.hedge_delay)
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    if next_provider < len(self.providers):
+                        pending.add(launch())
+                    continue
+
+                for future in done:
+                    provider = futures[future]
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        logger.warning(f"  ✗ {provider.name} failed: {e}")
+                        last_error = e
+                        continue
+                    if validate is None or validate(text):
+                        logger.info(f"  ✓ Using response from {provider.name}")
+                        return text
+                    logger.warning(f"  ✗ {provider.name} response failed validation")
+                    if first_text is None:
+                        first_text = text
+                # If nothing is left in flight, the loop hedges immediately
+        finally:
+            # Losers that have not started are cancelled; running calls are
+            # left to finish in the background and their results dropped
+            for future in futures:
+                future.cancel()
+
+        if first_text is not None:
+            return first_text
+        if last_error is not None:
+            raise last_error
+        raise TimeoutError(f"No LLM response within {timeout}s")
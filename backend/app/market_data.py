@@ -0,0 +1,29 @@
+"""
+Market data access for the routes.
+
+Calls go to yfinance unless MARKET_DATA=synthetic is set, in which case
+they are served offline by app.synthetic_data with the same shapes.
+"""
+
+import os
+import yfinance as yf
+
+from app import synthetic_data
+
+
+def synthetic_enabled() -> bool:
+    return os.environ.get("MARKET_DATA", "yfinance").lower() == "synthetic"
+
+
+def download(tickers, **kwargs):
+    """Drop-in for yf.download"""
+    if synthetic_enabled():
+        return synthetic_data.get_market().download(tickers, **kwargs)
+    return yf.download(tickers, **kwargs)
+
+
+def ticker(symbol: str):
+    """Drop-in for yf.Ticker"""
+    if synthetic_enabled():
+        return synthetic_data.SyntheticTicker(synthetic_data.get_market(), symbol)
+    return yf.Ticker(symbol)
@@ -0,0 +1,436 @@
+"""
+Convex QP backend for constrained mean-variance portfolio problems.
+
+Problems are posed OSQP-style:
+
+    minimize    1/2 x'Px + q'x
+    subject to  l <= Ax <= u
+
+and solved by a pluggable backend (SOLVERS):
+- "admm": OSQP-style ADMM. The matrix P + sigma*I + A'RA is factorized and
+  inverted once, and reused across iterations and across solves that only
+  change q, l or u (e.g. a risk-aversion sweep), so each iteration costs one
+  matrix-vector product plus sparse products with A. When P is a
+  FactorCovariance (app.covariance) the inverse is applied through the
+  Woodbury identity at O(NK) per iteration and no N x N matrix is formed.
+  An equality-constrained "polish" step on the detected active set makes
+  the final answer exact (dense P only).
+- "slsqp": scipy SLSQP with analytic gradients, for cross-checking.
+
+PortfolioQP builds the constraints for a long-only, fully invested portfolio:
+per-asset bounds, group caps (groups default to the `Group` column of
+analysis/Equity.csv) and a turnover limit relative to current holdings,
+modelled with lifted variables t >= |w - w0|.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import scipy.linalg as sla
+import scipy.optimize as sco
+import scipy.sparse as sp
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+
+from app.covariance import FactorCovariance
+
+EQUITY_CSV = os.path.join(os.path.dirname(os.path.dirname(__file__)), "analysis", "Equity.csv")
+
+
+# ----------------- Security Groups -----------------
+
+
+@lru_cache(maxsize=1)
+def load_security_groups(path: str = EQUITY_CSV) -> Dict[str, str]:
+    """Security Id -> Group from the exchange equity master file"""
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path, usecols=["Security Id", "Group"], dtype=str, index_col=False)
+    df = df.dropna()
+    return dict(zip(df["Security Id"].str.strip().str.upper(), df["Group"].str.strip()))
+
+
+def get_ticker_groups(tickers: Sequence[str], overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Group of each ticker. Exchange suffixes are ignored when looking tickers
+    up in Equity.csv (RELIANCE.NS -> RELIANCE); `overrides` take precedence.
+    Tickers without a known group are left out.
+    """
+    overrides = {k.upper(): v for k, v in (overrides or {}).items()}
+    master = load_security_groups()
+    groups = {}
+    for ticker in tickers:
+        group = overrides.get(ticker.upper()) or master.get(ticker.upper().split(".")[0])
+        if group:
+            groups[ticker] = group
+    return groups
+
+
+# ----------------- Solvers -----------------
+
+
+class ADMMSolver:
+    """OSQP-style ADMM for 1/2 x'Px + q'x s.t. l <= Ax <= u"""
+
+    def __init__(self, P, A, rho=0.1, sigma=1e-6, alpha=1.6, max_iter=10000,
+                 eps_abs=1e-6, eps_rel=1e-6, check_every=10, adapt_every=50, polish=True):
+        self.P = P if isinstance(P, FactorCovariance) else np.asarray(P, dtype=float)
+        # Constraint rows are mostly identity blocks
+        self.A = sp.csr_matrix(A)
+        # Operators used in the iterations: a dense matvec beats the sparse
+        # call overhead on small problems, and the transpose is formed once
+        if self.A.shape[0] * self.A.shape[1] <= 40000:
+            self._A_op = self.A.toarray()
+            self._AT_op = self._A_op.T
+        else:
+            self._A_op = self.A
+            self._AT_op = self.A.T.tocsr()
+        self.rho = rho
+        self.sigma = sigma
+        self.alpha = alpha
+        self.max_iter = max_iter
+        self.eps_abs = eps_abs
+        self.eps_rel = eps_rel
+        self.check_every = check_every
+        self.adapt_every = adapt_every
+        self.polish = polish
+        self._solve_K = None
+        self._factor_key = None
+
+    def _rho_vec(self, l, u):
+        # Equality rows get a much stiffer penalty, free rows almost none
+        rho_vec = np.full(len(l), self.rho)
+        rho_vec[l == u] = 1e3 * self.rho
+        rho_vec[np.isinf(l) & np.isinf(u)] = 1e-6
+        return rho_vec
+
+    def _factorize(self, rho_vec):
+        """
+        Function applying the inverse of the x-update matrix, cached until rho
+        changes. For dense P a matvec with the explicit inverse is several
+        times faster than two triangular solves per iteration.
+        """
+        key = (self.rho, rho_vec.tobytes())
+        if self._factor_key != key:
+            solve_K = self._woodbury(rho_vec) if isinstance(self.P, FactorCovariance) else None
+            if solve_K is None:
+                P = self.P.to_dense() if isinstance(self.P, FactorCovariance) else self.P
+                n = P.shape[0]
+                K = P + self.sigma * np.eye(n) + (self.A.T @ sp.diags(rho_vec) @ self.A).toarray()
+                K_inv = sla.cho_solve(sla.cho_factor(K), np.eye(n))
+                solve_K = K_inv.__matmul__
+            self._solve_K = solve_K
+            self._factor_key = key
+        return self._solve_K
+
+    def _woodbury(self, rho_vec):
+        """
+        Inverse of BB' + diag(d) + sigma*I + A'RA for a factored P. Rows of A
+        with at most two entries (bounds, turnover pairs) must add up to a
+        diagonal; the dense rows (budget, group caps) join the factor loadings
+        in the low-rank term. Returns None when the sparse rows are not
+        diagonal, and the caller falls back to the dense inverse.
+        """
+        A = self.A
+        dense_rows = np.diff(A.indptr) > 2
+        A_sparse_rows = A[~dense_rows]
+        S = (A_sparse_rows.T @ sp.diags(rho_vec[~dense_rows]) @ A_sparse_rows).tocsr()
+        diag = S.diagonal()
+        off = (S - sp.diags(diag)).tocsr()
+        if off.nnz and np.abs(off.data).max() > 1e-12 * max(diag.max(), 1.0):
+            return None
+
+        D = self.sigma + self.P.specific_var + diag
+        U = np.hstack([
+            self.P.loadings,
+            A[dense_rows].T.multiply(np.sqrt(rho_vec[dense_rows])).toarray(),
+        ])
+        DU = U / D[:, None]
+        M = sla.cho_factor(np.eye(U.shape[1]) + U.T @ DU)
+        return lambda v: v / D - DU @ sla.cho_solve(M, DU.T @ v)
+
+    def solve(self, q, l, u, x0=None, y0=None, polish=None, eps=None) -> Dict:
+        """
+        Solve for (q, l, u), optionally warm-started from (x0, y0). `polish`
+        and `eps` override the solver defaults for this call only.
+        """
+        P, A, AT = self.P, self._A_op, self._AT_op
+        eps_abs = self.eps_abs if eps is None else eps
+        eps_rel = self.eps_rel if eps is None else eps
+        q = np.asarray(q, dtype=float)
+        l = np.asarray(l, dtype=float)
+        u = np.asarray(u, dtype=float)
+        n, m = P.shape[0], A.shape[0]
+
+        x = np.zeros(n) if x0 is None else np.asarray(x0, dtype=float).copy()
+        z = np.clip(A @ x, l, u)
+        y = np.zeros(m) if y0 is None else np.asarray(y0, dtype=float).copy()
+        rho_vec = self._rho_vec(l, u)
+        solve_K = self._factorize(rho_vec)
+        status = "max_iter"
+
+        for k in range(1, self.max_iter + 1):
+            y_prev = y
+            x_tilde = solve_K(self.sigma * x - q + AT @ (rho_vec * z - y))
+            z_tilde = A @ x_tilde
+            x = self.alpha * x_tilde + (1 - self.alpha) * x
+            z_relaxed = self.alpha * z_tilde + (1 - self.alpha) * z
+            z = np.clip(z_relaxed + y / rho_vec, l, u)
+            y = y + rho_vec * (z_relaxed - z)
+
+            if k % self.check_every:
+                continue
+
+            Ax, Px, ATy = A @ x, P @ x, AT @ y
+            r_prim = np.abs(Ax - z).max(initial=0)
+            r_dual = np.abs(Px + q + ATy).max(initial=0)
+            scale_prim = max(np.abs(Ax).max(initial=0), np.abs(z).max(initial=0))
+            scale_dual = max(np.abs(Px).max(initial=0), np.abs(ATy).max(initial=0), np.abs(q).max(initial=0))
+            if (r_prim <= eps_abs + eps_rel * scale_prim
+                    and r_dual <= eps_abs + eps_rel * scale_dual):
+                status = "solved"
+                break
+
+            if self._primal_infeasible(y - y_prev, l, u):
+                status = "primal_infeasible"
+                break
+
+            # Rebalance rho when primal and dual residuals drift apart
+            if k % self.adapt_every == 0 and r_dual > 0:
+                ratio = np.sqrt((r_prim / max(scale_prim, 1e-10)) / (r_dual / max(scale_dual, 1e-10)))
+                new_rho = float(np.clip(self.rho * ratio, 1e-6, 1e6))
+                if new_rho > 5 * self.rho or new_rho < self.rho / 5:
+                    self.rho = new_rho
+                    rho_vec = self._rho_vec(l, u)
+                    solve_K = self._factorize(rho_vec)
+
+        polish = self.polish if polish is None else polish
+        if status == "solved" and polish and not isinstance(P, FactorCovariance):
+            x = self._polish(x, z, y, q, l, u)
+
+        return {"x": x, "y": y, "status": status, "iterations": k}
+
+    def _primal_infeasible(self, dy, l, u, eps=1e-6):
+        """OSQP's certificate: A'dy ~ 0 while u'dy+ + l'dy- < 0"""
+        norm = np.abs(dy).max(initial=0)
+        if norm < 1e-10:
+            return False
+        dy_pos, dy_neg = np.maximum(dy, 0), np.minimum(dy, 0)
+        if (np.isinf(u) & (dy_pos > eps * norm)).any() or (np.isinf(l) & (dy_neg < -eps * norm)).any():
+            return False
+        support = np.sum(np.where(np.isinf(u), 0, u) * dy_pos) + np.sum(np.where(np.isinf(l), 0, l) * dy_neg)
+        return np.abs(self._AT_op @ dy).max(initial=0) < eps * norm and support < -eps * norm
+
+    def _polish(self, x, z, y, q, l, u):
+        """
+        Re-solve the equality-constrained problem on the active constraints.
+        The polished point is the exact optimum if it is feasible and its
+        multipliers have the right signs; otherwise the ADMM answer is kept.
+        """
+        P, A = self.P, self.A
+        eq = l == u
+        lower = (z - l < -y) | eq
+        upper = (u - z < y) & ~lower
+        active = lower | upper
+        A_act = A[active].toarray()
+        b_act = np.where(lower, l, u)[active]
+        n, k = P.shape[0], int(active.sum())
+
+        kkt = np.zeros((n + k, n + k))
+        kkt[:n, :n] = P
+        kkt[:n, n:] = A_act.T
+        kkt[n:, :n] = A_act
+        rhs = np.concatenate([-q, b_act])
+        try:
+            sol = np.linalg.solve(kkt, rhs)
+        except np.linalg.LinAlgError:
+            return x
+        x_pol, y_act = sol[:n], sol[n:]
+        if not np.all(np.isfinite(sol)):
+            return x
+
+        Ax = A @ x_pol
+        feasible = np.abs(np.clip(Ax, l, u) - Ax).max(initial=0) <= 1e-9
+        # Lower-bound multipliers must be <= 0, upper-bound ones >= 0
+        tol = 1e-9 * max(1.0, np.abs(y_act).max(initial=0))
+        signs_ok = np.all(y_act[(lower & ~eq)[active]] <= tol) and np.all(y_act[upper[active]] >= -tol)
+        return x_pol if feasible and signs_ok else x
+
+class SLSQPSolver:
+    """scipy SLSQP on the same problem form, for cross-checking small problems"""
+
+    def __init__(self, P, A, max_iter=500, ftol=1e-12):
+        self.P = P.to_dense() if isinstance(P, FactorCovariance) else np.asarray(P, dtype=float)
+        self.A = A.toarray() if sp.issparse(A) else np.asarray(A, dtype=float)
+        self.max_iter = max_iter
+        self.ftol = ftol
+
+    def solve(self, q, l, u, x0=None, y0=None, polish=None, eps=None) -> Dict:
+        P, A = self.P, self.A
+        q = np.asarray(q, dtype=float)
+        l = np.asarray(l, dtype=float)
+        u = np.asarray(u, dtype=float)
+        eq = l == u
+        lo = ~eq & np.isfinite(l)
+        hi = ~eq & np.isfinite(u)
+
+        constraints = []
+        if eq.any():
+            constraints.append({'type': 'eq', 'fun': lambda x: A[eq] @ x - l[eq], 'jac': lambda x: A[eq]})
+        if lo.any():
+            constraints.append({'type': 'ineq', 'fun': lambda x: A[lo] @ x - l[lo], 'jac': lambda x: A[lo]})
+        if hi.any():
+            constraints.append({'type': 'ineq', 'fun': lambda x: u[hi] - A[hi] @ x, 'jac': lambda x: -A[hi]})
+
+        x0 = np.zeros(P.shape[0]) if x0 is None else x0
+        result = sco.minimize(lambda x: 0.5 * x @ P @ x + q @ x, x0, jac=lambda x: P @ x + q,
+                              method='SLSQP', constraints=constraints,
+                              options={'maxiter': self.max_iter, 'ftol': self.ftol})
+        status = "solved" if result.success else "max_iter"
+        return {"x": result.x, "y": None, "status": status, "iterations": result.nit}
+
+
+SOLVERS = {
+    "admm": ADMMSolver,
+    "slsqp": SLSQPSolver,
+}
+
+
+def get_solver(name: str, P, A, **kwargs):
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown QP solver: {name}. Choose from {sorted(SOLVERS)}")
+    return SOLVERS[name](P, A, **kwargs)
+
+
+# ----------------- Portfolio Problems -----------------
+
+
+class PortfolioQP:
+    """
+    Constrained long-only, fully invested portfolio problems over one
+    covariance matrix (daily; annualized internally), either dense or a
+    FactorCovariance. The solver and its factorization are built once and
+    shared by every solve.
+
+    lower, upper: per-asset weight bounds (scalars or arrays)
+    groups: group label per asset (None = not capped); group_caps: label -> max weight
+    current_weights, max_turnover: sum |w - current| <= max_turnover
+    """
+
+    def __init__(self, cov_matrix, lower=0.0, upper=1.0, groups=None, group_caps=None,
+                 current_weights=None, max_turnover=None, solver="admm"):
+        factored = isinstance(cov_matrix, FactorCovariance)
+        cov_ann = cov_matrix * 252 if factored else np.asarray(cov_matrix, dtype=float) * 252
+        n = cov_ann.shape[0]
+        lower = np.broadcast_to(np.asarray(lower, dtype=float), (n,))
+        upper = np.broadcast_to(np.asarray(upper, dtype=float), (n,))
+        if np.any(lower > upper) or lower.sum() > 1 + 1e-9 or upper.sum() < 1 - 1e-9:
+            raise ValueError("Weight bounds are infeasible: they must allow the weights to sum to 1.")
+
+        turnover = max_turnover is not None
+        n_vars = 2 * n if turnover else n
+
+        # Budget and per-asset bounds
+        rows = [sp.csr_matrix(np.ones((1, n))), sp.identity(n, format="csr")]
+        l = [np.array([1.0]), lower]
+        u = [np.array([1.0]), upper]
+
+        # Group caps
+        self.group_caps = {}
+        for group, cap in (group_caps or {}).items():
+            members = np.array([g == group for g in (groups or [None] * n)])
+            if members.any():
+                rows.append(sp.csr_matrix(members[None, :].astype(float)))
+                l.append(np.array([-np.inf]))
+                u.append(np.array([float(cap)]))
+                self.group_caps[group] = float(cap)
+
+        A = sp.vstack(rows, format="csr")
+
+        # Turnover: t >= w - w0, t >= w0 - w, sum(t) <= max_turnover
+        if turnover:
+            w0 = np.zeros(n) if current_weights is None else np.asarray(current_weights, dtype=float)
+            eye = sp.identity(n, format="csr")
+            A = sp.vstack([
+                sp.hstack([A, sp.csr_matrix((A.shape[0], n))]),
+                sp.hstack([eye, -eye]),
+                sp.hstack([eye, eye]),
+                sp.hstack([sp.csr_matrix((1, n)), sp.csr_matrix(np.ones((1, n)))]),
+            ], format="csr")
+            l += [np.full(n, -np.inf), w0, np.array([0.0])]
+            u += [w0, np.full(n, np.inf), np.array([float(max_turnover)])]
+
+        if factored:
+            P = cov_ann.padded(n_vars)
+        else:
+            P = np.zeros((n_vars, n_vars))
+            P[:n, :n] = cov_ann
+        self.n = n
+        self.cov = cov_ann
+        self.P, self.A = P, A
+        self.l, self.u = np.concatenate(l), np.concatenate(u)
+        self.solver = get_solver(solver, P, A)
+        self._x = None
+        self._y = None
+
+    def _solve(self, q_assets, polish=True, eps=None):
+        q = np.zeros(self.P.shape[0])
+        q[:self.n] = q_assets
+        result = self.solver.solve(q, self.l, self.u, self._x, self._y, polish=polish, eps=eps)
+        if result["status"] == "max_iter" and self._x is not None:
+            # Multipliers from a distant problem can take very long to unwind
+            result = self.solver.solve(q, self.l, self.u, polish=polish, eps=eps)
+        if result["status"] == "primal_infeasible":
+            raise ValueError("Portfolio constraints are infeasible.")
+        if result["status"] != "solved":
+            raise ValueError(f"QP solver did not converge ({result['status']}).")
+        # Warm-start the next solve from this one
+        self._x, self._y = result["x"], result["y"]
+        # Unpolished answers carry tiny negative weights: clip and renormalize
+        weights = np.clip(result["x"][:self.n], 0, None)
+        return weights / weights.sum()
+
+    def min_variance(self):
+        return self._solve(np.zeros(self.n))
+
+    def mean_variance(self, mean_returns, tau, polish=True, eps=None):
+        """Minimize 1/2 w'Cw - tau * mu'w (tau = risk tolerance)"""
+        return self._solve(-tau * np.asarray(mean_returns, dtype=float) * 252, polish, eps)
+
+    def max_sharpe(self, mean_returns, n_grid=15, refine_steps=15):
+        """
+        Highest-Sharpe portfolio on the constrained mean-variance path. The
+        path is parametrized by risk tolerance, which only changes q, so
+        every solve reuses the same factorization and warm starts. The search
+        runs at a loose tolerance; only the final point is solved exactly.
+        """
+        mu = np.asarray(mean_returns, dtype=float) * 252
+
+        def sharpe(log_tau):
+            w = self.mean_variance(mean_returns, np.exp(log_tau), polish=False, eps=1e-5)
+            vol = np.sqrt(max(w @ self.cov @ w, 0))
+            return mu @ w / vol if vol > 0 else -np.inf
+
+        scale = np.mean(self.cov.diagonal()) / max(np.abs(mu).max(), 1e-12)
+        log_taus = np.log(scale * np.geomspace(1e-3, 1e2, n_grid))
+        sharpes = [sharpe(t) for t in log_taus]
+        best = int(np.argmax(sharpes))
+
+        # Golden-section search on log(tau) between the best point's neighbours
+        lo = log_taus[max(best - 1, 0)]
+        hi = log_taus[min(best + 1, n_grid - 1)]
+        ratio = (np.sqrt(5) - 1) / 2
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        s_a, s_b = sharpe(a), sharpe(b)
+        for _ in range(refine_steps):
+            if s_a >= s_b:
+                hi, b, s_b = b, a, s_a
+                a = hi - ratio * (hi - lo)
+                s_a = sharpe(a)
+            else:
+                lo, a, s_a = a, b, s_b
+                b = lo + ratio * (hi - lo)
+                s_b = sharpe(b)
+
+        best_log_tau = max([(sharpes[best], log_taus[best]), (s_a, a), (s_b, b)])[1]
+        return self.mean_variance(mean_returns, np.exp(best_log_tau))
@@ -0,0 +1,228 @@
+"""
+Forward projection of portfolios: correlated daily multi-asset paths.
+
+Models (PROJECTION_MODELS):
+- "gaussian": asset daily log returns N(log_mean, log_cov), correlated
+  through a Cholesky factor (or the loadings of a FactorCovariance for large
+  universes), like the Monte Carlo method of app.risk.
+- "bootstrap": circular blocks of whole rows of the historical daily return
+  panel, which keeps the cross-asset correlation, fat tails and (within a
+  block) volatility clustering of the data.
+
+Every portfolio (row of the weight matrix) is valued on the same asset
+paths. Holdings drift with prices and are reset to the target weights every
+`rebalance_every` trading days (1 = constant weights, 0 = buy and hold).
+
+Paths are simulated in chunks, one day at a time, so memory is bounded by
+the chunk size rather than paths x days x assets: the per-day draws are
+(chunk x assets), chunks are sized from them (and the drifting holdings)
+alone, and each path only carries its current log wealth, running maximum
+and deepest drawdown. The only per-path outputs kept are the final wealth
+and max drawdown. Wealth over time is summarized in a StepHistogram per
+portfolio, fed in blocks of days, from which the percentile fan charts are
+read.
+"""
+
+import numpy as np
+from typing import Dict
+
+from app.covariance import FactorCovariance
+from app.risk import _scenario_factor
+from app.sketch import StepHistogram
+from app.workers import OPTIMIZE_WORKERS, get_process_pool
+
+PROJECTION_MODELS = ("gaussian", "bootstrap")
+# Chunks hold about this many values per day, and per block of days (8 MB of float64),
+# and at most this many paths so large projections still split across workers
+PROJECTION_CHUNK_ELEMENTS = 2**20
+PROJECTION_CHUNK_PATHS = 2**14
+# Projections of at least this many log-wealth values are split across the process pool
+PROJECTION_PARALLEL_ELEMENTS = 2**24
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+TERMINAL_BINS = 50
+
+
+def gaussian_model(log_mean, log_cov) -> Dict:
+    """Daily asset log returns N(log_mean, log_cov); log_cov may be a FactorCovariance"""
+    return {"kind": "gaussian", "log_mean": np.asarray(log_mean, dtype=float),
+            "factor": _scenario_factor(log_cov),
+            "log_cov": log_cov if isinstance(log_cov, FactorCovariance) else None}
+
+
+def bootstrap_model(daily_returns, block_size: int = 21) -> Dict:
+    """Circular blocks of block_size consecutive rows of the (days x assets) simple returns"""
+    return {"kind": "bootstrap", "returns": np.asarray(daily_returns, dtype=float),
+            "block_size": block_size}
+
+
+def _log_wealth_range(model, weights, n_days):
+    """Sketch range per day and portfolio: mean +/- 6 sd of the portfolio's log-wealth random walk"""
+    W = np.atleast_2d(weights)
+    if model["kind"] == "gaussian":
+        drift = W @ model["log_mean"]
+        if model["factor"] is not None:
+            sd = np.linalg.norm(W @ model["factor"], axis=1)
+        else:
+            cov = model["log_cov"]
+            sd = np.sqrt(np.einsum('ij,ij->i', W @ cov.loadings, W @ cov.loadings)
+                         + (W ** 2) @ cov.specific_var)
+    else:
+        growth = np.log1p(model["returns"] @ W.T)
+        drift = growth.mean(axis=0)
+        # Blocks keep volatility clusters together, widening the spread by up to sqrt(block_size)
+        sd = growth.std(axis=0) * np.sqrt(model["block_size"])
+    days = np.arange(n_days + 1)
+    spread = 6 * sd[:, None] * np.sqrt(days)
+    return drift[:, None] * days - spread, drift[:, None] * days + spread
+
+
+def _draw_returns(rng, model, rows, day, starts):
+    """(rows x assets) simple returns for one day"""
+    if model["kind"] == "bootstrap":
+        R = model["returns"]
+        block = model["block_size"]
+        return R[(starts[:, day // block] + day % block) % len(R)]
+    mu = model["log_mean"]
+    if model["factor"] is not None:
+        shocks = rng.standard_normal((rows, len(mu))) @ model["factor"].T
+    else:
+        cov = model["log_cov"]
+        shocks = (rng.standard_normal((rows, cov.n_factors)) @ cov.loadings.T
+                  + rng.standard_normal((rows, len(mu))) * np.sqrt(cov.specific_var))
+    shocks += mu
+    return np.expm1(shocks, out=shocks)
+
+
+def project_chunks(seeds, sizes, model, weights, n_days, rebalance_every=1):
+    """
+    Consecutive chunks of projected paths for every portfolio (row of
+    weights), chunk i drawing sizes[i] paths from its own SeedSequence
+    seeds[i]. Wealth starts at 1. Returns the exact final log wealth and max
+    drawdown of every path as (portfolios x paths) arrays, and a StepHistogram
+    of log wealth per day for each portfolio.
+    """
+    W = np.atleast_2d(weights)
+    n_portfolios = len(W)
+    lo, hi = _log_wealth_range(model, W, n_days)
+    sketches = [StepHistogram(lo[k], hi[k]) for k in range(n_portfolios)]
+
+    final_log_wealth = np.empty((n_portfolios, sum(sizes)))
+    max_drawdowns = np.empty((n_portfolios, sum(sizes)))
+    begin = 0
+
+    for seed, rows in zip(seeds, sizes):
+        rng = np.random.default_rng(seed)
+        starts = None
+        if model["kind"] == "bootstrap":
+            n_blocks = -(-n_days // model["block_size"])
+            starts = rng.integers(0, len(model["returns"]), size=(rows, n_blocks))
+
+        # Running (portfolios x paths) state; max drawdown is the deepest fall
+        # below the running maximum of log wealth
+        log_wealth = np.zeros((n_portfolios, rows))
+        running_max = np.zeros((n_portfolios, rows))
+        drawdown = np.zeros((n_portfolios, rows))
+        # Log wealth goes to the sketches in blocks of consecutive days (day 0 first)
+        block_days = min(n_days + 1, max(1, PROJECTION_CHUNK_ELEMENTS // (n_portfolios * rows)))
+        block = np.zeros((n_portfolios, rows, block_days))
+        block_start, filled = 0, 1
+        # Constant weights only need the portfolio return; otherwise track the
+        # drifting (portfolios x paths x assets) holdings
+        holdings = None
+        if rebalance_every != 1:
+            holdings = np.repeat(W[:, None, :], rows, axis=1)
+        for day in range(n_days):
+            returns = _draw_returns(rng, model, rows, day, starts)
+            if holdings is None:
+                log_wealth += np.log1p(returns @ W.T).T
+            else:
+                holdings *= 1 + returns
+                wealth = holdings.sum(axis=2)
+                log_wealth = np.log(wealth)
+                if rebalance_every and (day + 1) % rebalance_every == 0:
+                    np.multiply(wealth[:, :, None], W[:, None, :], out=holdings)
+            np.maximum(running_max, log_wealth, out=running_max)
+            np.minimum(drawdown, log_wealth - running_max, out=drawdown)
+
+            if filled == block.shape[2]:
+                for k in range(n_portfolios):
+                    sketches[k].add(block[k], block_start)
+                block_start, filled = block_start + filled, 0
+            block[:, :, filled] = log_wealth
+            filled += 1
+
+        for k in range(n_portfolios):
+            sketches[k].add(block[k, :, :filled], block_start)
+        final_log_wealth[:, begin:begin + rows] = log_wealth
+        max_drawdowns[:, begin:begin + rows] = np.expm1(drawdown)
+        del block, holdings
+        begin += rows
+
+    return {"final_log_wealth": final_log_wealth, "max_drawdowns": max_drawdowns, "sketches": sketches}
+
+
+def chunk_sizes(n_paths, n_portfolios, n_assets):
+    """Paths per chunk, so each day's holdings (or draws) stay near PROJECTION_CHUNK_ELEMENTS"""
+    chunk = min(PROJECTION_CHUNK_PATHS, max(1, PROJECTION_CHUNK_ELEMENTS // (n_portfolios * n_assets)))
+    return [min(chunk, n_paths - begin) for begin in range(0, n_paths, chunk)]
+
+
+def project_portfolios(model, weights, n_days, n_paths, rebalance_every=1, seed=None, parallel=True):
+    """
+    Projected paths of every portfolio (row of weights) under a projection
+    model, as a list of project_chunks results in chunk order. Every chunk
+    has its own random stream spawned from SeedSequence(seed), and chunk
+    sizes do not depend on the worker count, so a given seed gives
+    bit-identical results however the chunks are spread over processes.
+    """
+    W = np.atleast_2d(weights)
+    sizes = chunk_sizes(n_paths, len(W), W.shape[1])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    n_workers = min(OPTIMIZE_WORKERS, len(sizes))
+    if parallel and n_workers > 1 and len(W) * n_paths * (n_days + 1) >= PROJECTION_PARALLEL_ELEMENTS:
+        groups = np.array_split(np.arange(len(sizes)), n_workers)
+        return list(get_process_pool().map(
+            project_chunks,
+            [[seeds[i] for i in group] for group in groups],
+            [[sizes[i] for i in group] for group in groups],
+            [model] * n_workers, [W] * n_workers, [n_days] * n_workers, [rebalance_every] * n_workers,
+        ))
+    return [project_chunks(seeds, sizes, model, W, n_days, rebalance_every)]
+
+
+def projection_report(parts, names, n_days, initial_value=1.0, percentiles=FAN_PERCENTILES) -> Dict[str, Dict]:
+    """
+    Fan chart (numpy arrays, for app.encoding), terminal distribution and max
+    drawdown distribution of each named portfolio from the project_chunks
+    results of consecutive chunk groups (merged in order).
+    """
+    final_log_wealth = np.concatenate([part["final_log_wealth"] for part in parts], axis=1)
+    max_drawdowns = np.concatenate([part["max_drawdowns"] for part in parts], axis=1)
+    sketches = parts[0]["sketches"]
+    for part in parts[1:]:
+        for sketch, other in zip(sketches, part["sketches"]):
+            sketch.merge(other)
+
+    report = {}
+    for k, name in enumerate(names):
+        fan = initial_value * np.exp(sketches[k].percentiles(percentiles))
+        terminal = initial_value * np.exp(final_log_wealth[k])
+        counts, edges = np.histogram(terminal, bins=TERMINAL_BINS)
+        report[name] = {
+            "fan_chart": {f"p{p}": fan[i] for i, p in enumerate(percentiles)},
+            "terminal": {
+                "mean": float(terminal.mean()),
+                "std": float(terminal.std()),
+                "percentiles": {f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(terminal, percentiles))},
+                "probability_of_loss": float((final_log_wealth[k] < 0).mean()),
+                # Median growth rate, annualized over 252 trading days
+                "median_annual_return": float(np.expm1(np.median(final_log_wealth[k]) * 252 / n_days)),
+                "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+            },
+            "max_drawdown": {
+                "mean": float(max_drawdowns[k].mean()),
+                "percentiles": {f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(max_drawdowns[k], percentiles))},
+            },
+        }
+    return report
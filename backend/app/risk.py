@@ -0,0 +1,361 @@
+"""
+Portfolio risk engine: Value at Risk and Conditional VaR (expected
+shortfall) at several horizons and confidence levels.
+
+Methods (RISK_METHODS):
+- "parametric": Gaussian portfolio returns from the sample mean and
+  covariance, scaled to the horizon.
+- "historical": filtered historical simulation. A GARCH(1,1) fitted to each
+  portfolio's daily returns rescales its standardized residuals to today's
+  volatility. Multi-day paths bootstrap those residuals and run the variance
+  recursion forward.
+- "monte_carlo": correlated scenarios of the assets' daily log returns,
+  multivariate normal through a Cholesky factor (or through the loadings of
+  a FactorCovariance for large universes), compounded over the horizon.
+
+Both simulation methods draw their scenarios in fixed-size blocks and keep
+only the running left tail of each portfolio's outcomes. Memory stays
+bounded by the block size however many scenarios are drawn, and the tail
+estimates are exact for the scenarios drawn. Time is bounded by
+RISK_MAX_ELEMENTS per report.
+
+VaR and CVaR are reported as returns over the horizon (negative = loss),
+like the historical figures in the /optimize metrics.
+
+rolling_risk computes trailing-window volatility, beta, correlation, VaR and
+drawdown series for many return series at once from cumulative sums and
+sliding-window views, in O(T) per series for the moment-based statistics.
+"""
+
+import numpy as np
+import scipy.optimize as sco
+import scipy.signal as sig
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import maximum_filter1d
+from scipy.stats import norm
+from typing import Dict, List, Sequence
+
+from app.covariance import FactorCovariance
+
+RISK_METHODS = ("parametric", "historical", "monte_carlo")
+DEFAULT_HORIZONS = (1, 10)
+DEFAULT_CONFIDENCE = (0.95, 0.99)
+DEFAULT_SCENARIOS = 100_000
+MAX_SCENARIOS = 10_000_000
+# Cap on the simulated values of one report, a few seconds of work: scenarios x
+# days x portfolios (historical) plus scenarios x horizons x (assets + portfolios)
+# (Monte Carlo)
+RISK_MAX_ELEMENTS = 2**27
+# Scenario blocks hold at most this many draws per day (32 MB of float64)
+BLOCK_ELEMENTS = 2**22
+
+
+# ----------------- Tail Accumulation -----------------
+
+
+def _tail_size(n_scenarios: int, confidence: float) -> int:
+    return max(1, int(np.ceil((1 - confidence) * n_scenarios)))
+
+
+class TailBuffer:
+    """
+    The k smallest outcomes seen so far in each column, for VaR/CVaR over a
+    stream of scenario blocks. With k = ceil((1 - c) * n), VaR at confidence
+    c is the k-th smallest outcome and CVaR the mean of the k smallest.
+    """
+
+    def __init__(self, k: int, n_columns: int):
+        self.k = k
+        self.tail = np.empty((0, n_columns))
+        self.count = 0
+
+    def add(self, outcomes: np.ndarray):
+        self.count += len(outcomes)
+        merged = np.vstack([self.tail, outcomes])
+        if len(merged) > self.k:
+            merged = np.partition(merged, self.k - 1, axis=0)[:self.k]
+        self.tail = merged
+
+    def var_cvar(self, confidence: float):
+        k = _tail_size(self.count, confidence)
+        tail = np.sort(self.tail, axis=0)[:k]
+        return tail[-1], tail.mean(axis=0)
+
+
+def _report(buffers: Dict[int, TailBuffer], horizons, confidences) -> List[List[Dict]]:
+    """Per-column lists of {horizon, confidence, var, cvar} from one buffer per horizon"""
+    n_columns = next(iter(buffers.values())).tail.shape[1]
+    rows = [[] for _ in range(n_columns)]
+    for h in horizons:
+        for c in confidences:
+            var, cvar = buffers[h].var_cvar(c)
+            for p in range(n_columns):
+                rows[p].append({"horizon": h, "confidence": c, "var": float(var[p]), "cvar": float(cvar[p])})
+    return rows
+
+
+# ----------------- Parametric -----------------
+
+
+def parametric_var(weights: np.ndarray, mean_returns: np.ndarray, cov_matrix,
+                   horizons=DEFAULT_HORIZONS, confidences=DEFAULT_CONFIDENCE) -> List[List[Dict]]:
+    """Gaussian VaR/CVaR of each portfolio (row of weights) at each horizon (days)"""
+    W = np.atleast_2d(weights)
+    mu = W @ np.asarray(mean_returns, dtype=float)
+    sigma = np.sqrt(np.maximum(np.einsum('pn,pn->p', W @ cov_matrix, W), 0))
+    rows = [[] for _ in range(len(W))]
+    for h in horizons:
+        for c in confidences:
+            z = norm.ppf(1 - c)
+            var = h * mu + np.sqrt(h) * sigma * z
+            cvar = h * mu - np.sqrt(h) * sigma * norm.pdf(z) / (1 - c)
+            for p in range(len(W)):
+                rows[p].append({"horizon": h, "confidence": c, "var": float(var[p]), "cvar": float(cvar[p])})
+    return rows
+
+
+# ----------------- Filtered Historical (GARCH) -----------------
+
+
+def garch_variances(eps: np.ndarray, omega: float, alpha: float, beta: float, initial: float) -> np.ndarray:
+    """
+    Conditional variances of the GARCH(1,1) recursion
+    s2[t] = omega + alpha * eps[t-1]^2 + beta * s2[t-1], s2[0] = initial,
+    followed by the one-step-ahead forecast (len(eps) + 1 values).
+    """
+    drive = omega + alpha * eps ** 2
+    # Linear recursion in s2: one IIR filter pass instead of a Python loop
+    rest = sig.lfilter([1.0], [1.0, -beta], drive, zi=[beta * initial])[0]
+    return np.concatenate([[initial], rest])
+
+
+def fit_garch(returns: np.ndarray) -> Dict:
+    """
+    Gaussian quasi-maximum-likelihood GARCH(1,1) with variance targeting
+    (omega = var * (1 - alpha - beta)). Returns the parameters, the
+    standardized residuals and the next-day variance forecast.
+    """
+    r = np.asarray(returns, dtype=float)
+    mu = r.mean()
+    eps = r - mu
+    var = eps.var()
+
+    def neg_log_likelihood(params):
+        alpha, beta = params
+        s2 = garch_variances(eps[:-1], var * (1 - alpha - beta), alpha, beta, var)
+        return 0.5 * np.sum(np.log(s2) + eps ** 2 / s2)
+
+    result = sco.minimize(neg_log_likelihood, [0.05, 0.90], method='SLSQP',
+                          bounds=[(0.0, 0.999), (0.0, 0.999)],
+                          constraints=[{'type': 'ineq', 'fun': lambda p: 0.999 - p[0] - p[1]}])
+    alpha, beta = result.x if result.success else (0.0, 0.0)
+    omega = var * (1 - alpha - beta)
+    s2 = garch_variances(eps, omega, alpha, beta, var)
+    return {
+        "mu": mu, "omega": omega, "alpha": alpha, "beta": beta,
+        "residuals": eps / np.sqrt(s2[:-1]), "next_variance": s2[-1],
+    }
+
+
+def filtered_historical_var(portfolio_returns: np.ndarray, horizons=DEFAULT_HORIZONS,
+                            confidences=DEFAULT_CONFIDENCE, n_scenarios: int = DEFAULT_SCENARIOS,
+                            seed: int = 0) -> List[List[Dict]]:
+    """
+    Filtered historical simulation for each column of the (days x portfolios)
+    daily returns: paths bootstrap the GARCH-standardized residuals, starting
+    from today's conditional variance.
+    """
+    R = np.atleast_2d(np.asarray(portfolio_returns, dtype=float).T).T
+    n_columns = R.shape[1]
+    fits = [fit_garch(R[:, p]) for p in range(n_columns)]
+    k = _tail_size(n_scenarios, min(confidences))
+    buffers = {h: TailBuffer(k, n_columns) for h in horizons}
+    rng = np.random.default_rng(seed)
+    # Only the current day's (scenarios x portfolios) state is held; each
+    # horizon's outcomes go to its buffer on that day
+    block = max(1, BLOCK_ELEMENTS // n_columns)
+
+    for start in range(0, n_scenarios, block):
+        size = min(block, n_scenarios - start)
+        growth = np.ones((size, n_columns))
+        s2 = np.array([f["next_variance"] for f in fits]) * np.ones((size, 1))
+        for day in range(1, max(horizons) + 1):
+            z = np.column_stack([rng.choice(f["residuals"], size) for f in fits])
+            eps = np.sqrt(s2) * z
+            growth *= 1 + np.array([f["mu"] for f in fits]) + eps
+            if day in buffers:
+                buffers[day].add(growth - 1)
+            s2 = (np.array([f["omega"] for f in fits]) + np.array([f["alpha"] for f in fits]) * eps ** 2
+                  + np.array([f["beta"] for f in fits]) * s2)
+
+    return _report(buffers, horizons, confidences)
+
+
+# ----------------- Monte Carlo -----------------
+
+
+def _scenario_factor(cov_matrix):
+    """Matrix F with F F' = cov (Cholesky, or loadings plus specific vols for a factor model)"""
+    if isinstance(cov_matrix, FactorCovariance):
+        return None
+    cov = np.asarray(cov_matrix, dtype=float)
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # Singular sample covariance (more assets than days): add a tiny ridge
+        jitter = 1e-10 * np.trace(cov) / len(cov)
+        return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+
+
+def monte_carlo_var(weights: np.ndarray, log_mean: np.ndarray, log_cov, horizons=DEFAULT_HORIZONS,
+                    confidences=DEFAULT_CONFIDENCE, n_scenarios: int = DEFAULT_SCENARIOS,
+                    seed: int = 0) -> List[List[Dict]]:
+    """
+    Monte Carlo VaR/CVaR of each portfolio (row of weights). Asset daily log
+    returns are N(log_mean, log_cov), so an h-day scenario is
+    N(h * log_mean, h * log_cov), compounded into simple returns and valued
+    with the weights. All horizons share the same normal draws.
+    """
+    W = np.atleast_2d(weights)
+    mu = np.asarray(log_mean, dtype=float)
+    n_assets = len(mu)
+    chol = _scenario_factor(log_cov)
+    k = _tail_size(n_scenarios, min(confidences))
+    buffers = {h: TailBuffer(k, len(W)) for h in horizons}
+    rng = np.random.default_rng(seed)
+    block = max(1, BLOCK_ELEMENTS // n_assets)
+
+    for start in range(0, n_scenarios, block):
+        size = min(block, n_scenarios - start)
+        if chol is not None:
+            shocks = rng.standard_normal((size, n_assets)) @ chol.T
+        else:
+            shocks = (rng.standard_normal((size, log_cov.n_factors)) @ log_cov.loadings.T
+                      + rng.standard_normal((size, n_assets)) * np.sqrt(log_cov.specific_var))
+        for h, buffer in buffers.items():
+            buffer.add(np.expm1(h * mu + np.sqrt(h) * shocks) @ W.T)
+
+    return _report(buffers, horizons, confidences)
+
+
+# ----------------- Rolling Windows -----------------
+
+
+def _window_sums(X: np.ndarray, window: int) -> np.ndarray:
+    """Sums over every trailing window (len(X) - window + 1 rows) by differencing cumulative sums"""
+    S = np.concatenate([np.zeros((1,) + X.shape[1:]), np.cumsum(X, axis=0)])
+    return S[window:] - S[:-window]
+
+
+def rolling_historical_var(returns: np.ndarray, window: int, confidence: float = 0.95) -> np.ndarray:
+    """Trailing-window historical VaR of a 1-D return series (k-th smallest return per window)"""
+    k = _tail_size(window, confidence) - 1
+    return np.partition(sliding_window_view(returns, window), k, axis=-1)[:, k]
+
+
+def rolling_risk(returns: np.ndarray, benchmark: np.ndarray, window: int,
+                 confidence: float = 0.95) -> Dict[str, np.ndarray]:
+    """
+    Trailing-window statistics of each column of the (days x series) daily
+    returns, one row per window end (len(returns) - window + 1 rows):
+    annualized volatility, beta and correlation to the benchmark returns,
+    Gaussian daily VaR, and drawdown from the highest value within the window.
+    """
+    R = np.asarray(returns, dtype=float)
+    b = np.asarray(benchmark, dtype=float)
+    # Demeaning first keeps the sum-of-squares differences well conditioned
+    means = R.mean(axis=0)
+    X = R - means
+    y = b - b.mean()
+
+    sx, sy = _window_sums(X, window), _window_sums(y, window)
+    var_x = np.maximum(_window_sums(X * X, window) - sx * sx / window, 0) / (window - 1)
+    var_y = np.maximum(_window_sums(y * y, window) - sy * sy / window, 0) / (window - 1)
+    cov_xy = (_window_sums(X * y[:, None], window) - sx * sy[:, None] / window) / (window - 1)
+
+    vol = np.sqrt(var_x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = np.where(var_y[:, None] > 0, cov_xy / var_y[:, None], 0.0)
+        corr = np.where(vol * np.sqrt(var_y)[:, None] > 0, cov_xy / (vol * np.sqrt(var_y)[:, None]), 0.0)
+
+    wealth = np.cumprod(1 + R, axis=0)
+    # origin shifts the filter so each output sees the trailing window only
+    peak = maximum_filter1d(wealth, window, axis=0, origin=(window - 1) // 2)
+
+    return {
+        "volatility": vol * np.sqrt(252),
+        "beta": beta,
+        "correlation": np.clip(corr, -1, 1),
+        "var": sx / window + means + vol * norm.ppf(1 - confidence),
+        "drawdown": wealth[window - 1:] / peak[window - 1:] - 1,
+    }
+
+
+# ----------------- Report -----------------
+
+
+def validate_risk_options(options) -> Dict:
+    """Normalized risk options from a request ({} or true = defaults); ValueError if invalid"""
+    options = options if isinstance(options, dict) else {}
+    methods = options.get("methods") or list(RISK_METHODS)
+    try:
+        horizons = sorted({int(h) for h in options.get("horizons") or DEFAULT_HORIZONS})
+        confidences = sorted({float(c) for c in options.get("confidence") or DEFAULT_CONFIDENCE})
+        # JSON null means "use the default", like a missing key
+        n_scenarios = int(DEFAULT_SCENARIOS if options.get("simulations") is None else options["simulations"])
+        seed = int(0 if options.get("seed") is None else options["seed"])
+    except (TypeError, ValueError):
+        raise ValueError("Risk horizons, confidence levels, simulations and seed must be numbers.")
+    if not isinstance(methods, list) or not set(methods) <= set(RISK_METHODS):
+        raise ValueError(f"Risk methods must be drawn from {list(RISK_METHODS)}.")
+    if not all(1 <= h <= 252 for h in horizons):
+        raise ValueError("Risk horizons must be between 1 and 252 trading days.")
+    if not all(0.5 <= c < 1 for c in confidences):
+        raise ValueError("Risk confidence levels must be in [0.5, 1).")
+    if not 1000 <= n_scenarios <= MAX_SCENARIOS:
+        raise ValueError(f"Risk simulations must be between 1000 and {MAX_SCENARIOS}.")
+    return {
+        "methods": list(dict.fromkeys(methods)),
+        "horizons": horizons,
+        "confidence": confidences,
+        "simulations": n_scenarios,
+        "seed": seed,
+    }
+
+
+def get_risk_report(daily_returns, weights: np.ndarray, methods: Sequence[str] = RISK_METHODS,
+                    horizons=DEFAULT_HORIZONS, confidence=DEFAULT_CONFIDENCE,
+                    simulations: int = DEFAULT_SCENARIOS, seed: int = 0, n_factors=None) -> List[Dict]:
+    """
+    VaR/CVaR of each portfolio (row of weights) over the daily simple
+    returns (dates x assets) by each method, as one {method: [{horizon,
+    confidence, var, cvar}, ...]} dict per portfolio. With n_factors, the
+    parametric covariance and the Monte Carlo scenarios come from a PCA
+    factor model of that many factors, so no N x N matrix is formed.
+    Raises ValueError if the simulations would exceed RISK_MAX_ELEMENTS.
+    """
+    R = np.asarray(daily_returns, dtype=float)
+    W = np.atleast_2d(weights)
+    work = (("historical" in methods) * simulations * max(horizons) * len(W)
+            + ("monte_carlo" in methods) * simulations * len(horizons) * (W.shape[1] + len(W)))
+    if work > RISK_MAX_ELEMENTS:
+        raise ValueError("Risk simulation too large: reduce simulations, horizons, portfolios or tickers.")
+    reports = [{} for _ in range(len(W))]
+
+    by_method = {}
+    if "parametric" in methods:
+        cov = FactorCovariance.fit(R, n_factors) if n_factors else np.atleast_2d(np.cov(R, rowvar=False))
+        by_method["parametric"] = parametric_var(W, R.mean(axis=0), cov, horizons, confidence)
+    if "historical" in methods:
+        by_method["historical"] = filtered_historical_var(R @ W.T, horizons, confidence, simulations, seed)
+    if "monte_carlo" in methods:
+        log_R = np.log1p(R)
+        log_cov = (FactorCovariance.fit(log_R, n_factors) if n_factors
+                   else np.atleast_2d(np.cov(log_R, rowvar=False)))
+        by_method["monte_carlo"] = monte_carlo_var(W, log_R.mean(axis=0), log_cov, horizons,
+                                                   confidence, simulations, seed)
+
+    for method, rows in by_method.items():
+        for p, row in enumerate(rows):
+            reports[p][method] = row
+    return reports
@@ -1,11 +1,12 @@
-from flask import Blueprint, request, jsonify
-import yfinance as yf
+from flask import Blueprint, request, jsonify, Response
 import numpy as np
 import pandas as pd
 import re
 import os
 import logging
 import time
+import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field
@@ -14,6 +15,16 @@ from backtesting import Backtest, Strategy
 
 import google.generativeai as genai
 
+from app import market_data
+from app.encoding import encode_response
+from app.strategy_examples import build_few_shot_examples
+from app.llm_providers import (
+    GeminiProvider,
+    HedgedLLM,
+    get_groq_provider,
+    latency_stats,
+)
+
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -42,6 +53,10 @@ class BacktestRequest(BaseModel):
     capital: float = Field(
         default=10000, gt=0, description="Initial capital per ticker"
     )
+    stream: bool = Field(
+        default=False,
+        description="Stream results as server-sent events, with each analysis text sent as it completes",
+    )
 
 
 class TradeMetrics(BaseModel):
@@ -58,6 +73,7 @@ class TradeMetrics(BaseModel):
     profit_factor: float
     pnl: float
     is_profitable: bool
+    trade_returns: List[float] = []  # Per-trade returns as fractions, e.g. for /simulate "trades" mode
 
 
 class PortfolioMetrics(BaseModel):
@@ -99,175 +115,6 @@ class BacktestResult(BaseModel):
     errors: List[str] = []
 
 
-# ----------------- Few-Shot Examples -----------------
-
-FEW_SHOT_EXAMPLES = """
-=== BACKTESTING.PY STRATEGY EXAMPLES ===
-IMPORTANT: self.buy() ONLY accepts these parameters: sl (stop-loss price), tp (take-profit price), size (position size)
-DO NOT use trail_sl, trailing_stop, or any other parameters - they will cause errors!
-
-EXAMPLE 1: MACD Strategy with Signal Line Crossover
-class UserStrategy(Strategy):
-    def init(self):
-        def ema(arr, n):
-            return pd.Series(arr).ewm(span=n).mean().values
-        
-        def macd_line(close):
-            ema12 = pd.Series(close).ewm(span=12).mean()
-            ema26 = pd.Series(close).ewm(span=26).mean()
-            return (ema12 - ema26).values
-        
-        def signal_line(close):
-            macd = pd.Series(close).ewm(span=12).mean() - pd.Series(close).ewm(span=26).mean()
-            return macd.ewm(span=9).mean().values
-        
-        self.ema50 = self.I(ema, self.data.Close, 50)
-        self.macd = self.I(macd_line, self.data.Close)
-        self.signal = self.I(signal_line, self.data.Close)
-    
-    def next(self):
-        if len(self.data.Close) < 50:
-            return
-        
-        price = self.data.Close[-1]
-        
-        if not self.position:
-            macd_cross_up = self.macd[-1] > self.signal[-1] and self.macd[-2] <= self.signal[-2]
-            above_ema = price > self.ema50[-1]
-            if macd_cross_up and above_ema:
-                self.buy(tp=price*1.05, sl=price*0.98)  # Only sl and tp allowed
-        elif self.position:
-            macd_cross_down = self.macd[-1] < self.signal[-1] and self.macd[-2] >= self.signal[-2]
-            if macd_cross_down:
-                self.position.close()
-
-EXAMPLE 2: RSI Mean Reversion Strategy
-class UserStrategy(Strategy):
-    def init(self):
-        def rsi(arr, period=14):
-            delta = pd.Series(arr).diff()
-            gain = delta.where(delta > 0, 0).rolling(period).mean()
-            loss = -delta.where(delta < 0, 0).rolling(period).mean()
-            rs = gain / loss
-            return (100 - 100/(1 + rs)).fillna(50).values
-        
-        def sma(arr, n):
-            return pd.Series(arr).rolling(n).mean().bfill().values
-        
-        self.rsi = self.I(rsi, self.data.Close, 14)
-        self.sma200 = self.I(sma, self.data.Close, 200)
-    
-    def next(self):
-        if len(self.data.Close) < 200:
-            return
-        
-        price = self.data.Close[-1]
-        
-        if not self.position:
-            if self.rsi[-1] < 30 and price > self.sma200[-1]:
-                self.buy(tp=price*1.08, sl=price*0.96)  # Only sl and tp allowed
-        elif self.position:
-            if self.rsi[-1] > 70:
-                self.position.close()
-
-EXAMPLE 3: Bollinger Bands Breakout
-class UserStrategy(Strategy):
-    def init(self):
-        def sma(arr, n):
-            return pd.Series(arr).rolling(n).mean().values
-        
-        def bb_upper(arr, n=20, std_dev=2):
-            s = pd.Series(arr)
-            return (s.rolling(n).mean() + std_dev * s.rolling(n).std()).values
-        
-        def bb_lower(arr, n=20, std_dev=2):
-            s = pd.Series(arr)
-            return (s.rolling(n).mean() - std_dev * s.rolling(n).std()).values
-        
-        self.sma20 = self.I(sma, self.data.Close, 20)
-        self.bb_upper = self.I(bb_upper, self.data.Close, 20, 2)
-        self.bb_lower = self.I(bb_lower, self.data.Close, 20, 2)
-    
-    def next(self):
-        if len(self.data.Close) < 30:
-            return
-        
-        price = self.data.Close[-1]
-        prev_price = self.data.Close[-2]
-        
-        if not self.position:
-            if prev_price <= self.bb_lower[-2] and price > self.bb_lower[-1]:
-                self.buy(sl=price*0.97, tp=price*1.06)  # Only sl and tp allowed
-        elif self.position:
-            if price >= self.bb_upper[-1]:
-                self.position.close()
-
-EXAMPLE 4: EMA Crossover with Volume Confirmation
-class UserStrategy(Strategy):
-    def init(self):
-        def ema(arr, n):
-            return pd.Series(arr).ewm(span=n).mean().values
-        
-        def vol_sma(arr, n):
-            return pd.Series(arr).rolling(n).mean().values
-        
-        self.ema9 = self.I(ema, self.data.Close, 9)
-        self.ema21 = self.I(ema, self.data.Close, 21)
-        self.vol_avg = self.I(vol_sma, self.data.Volume, 20)
-    
-    def next(self):
-        if len(self.data.Close) < 30:
-            return
-        
-        price = self.data.Close[-1]
-        volume = self.data.Volume[-1]
-        
-        if not self.position:
-            ema_cross_up = self.ema9[-1] > self.ema21[-1] and self.ema9[-2] <= self.ema21[-2]
-            high_volume = volume > self.vol_avg[-1] * 1.5
-            if ema_cross_up and high_volume:
-                self.buy(tp=price*1.06, sl=price*0.97)  # Only sl and tp allowed
-        elif self.position:
-            ema_cross_down = self.ema9[-1] < self.ema21[-1] and self.ema9[-2] >= self.ema21[-2]
-            if ema_cross_down:
-                self.position.close()
-
-EXAMPLE 5: ATR-Based Volatility Breakout
-class UserStrategy(Strategy):
-    def init(self):
-        def atr(high, low, close, period=14):
-            h = pd.Series(high)
-            l = pd.Series(low)
-            c = pd.Series(close)
-            tr1 = h - l
-            tr2 = abs(h - c.shift())
-            tr3 = abs(l - c.shift())
-            tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-            return tr.rolling(period).mean().values
-        
-        def sma(arr, n):
-            return pd.Series(arr).rolling(n).mean().values
-        
-        self.sma20 = self.I(sma, self.data.Close, 20)
-        self.atr = self.I(atr, self.data.High, self.data.Low, self.data.Close, 14)
-    
-    def next(self):
-        if len(self.data.Close) < 50:
-            return
-        
-        price = self.data.Close[-1]
-        
-        if not self.position:
-            breakout = price > self.sma20[-1] and self.data.Close[-2] <= self.sma20[-2]
-            if breakout:
-                atr_val = self.atr[-1]
-                # Use ATR for dynamic sl/tp - ONLY sl and tp parameters allowed
-                self.buy(tp=price + 2*atr_val, sl=price - 1.5*atr_val)
-        elif self.position:
-            if price < self.sma20[-1]:
-                self.position.close()
-"""
-
 # ----------------- LLM System Prompt -----------------
 
 SYSTEM_PROMPT = """You are an expert quantitative trading strategist. Generate a ROBUST Python trading strategy for the backtesting.py library.
@@ -432,6 +279,25 @@ def get_llm():
     )
 
 
+def get_strategy_llm(model) -> HedgedLLM:
+    """
+    Strategy-generation LLM: Gemini first, hedged to Groq after
+    LLM_HEDGE_DELAY seconds when GROQ_API_KEY is set.
+    """
+    providers = [GeminiProvider(model)]
+    groq = get_groq_provider()
+    if groq is not None:
+        providers.append(groq)
+    return HedgedLLM(providers)
+
+
+def clean_generated_code(text: str) -> str:
+    """Strip markdown fences from an LLM response"""
+    code = re.sub(r"```python\n?", "", text.strip())
+    code = re.sub(r"```\n?", "", code)
+    return code.strip()
+
+
 def generate_strategy_code(
     query: str,
     model,
@@ -440,32 +306,31 @@ def generate_strategy_code(
     previous_results: Dict = None,
     errors: List[str] = None,
 ) -> str:
-    """Generate strategy code using LLM"""
+    """Generate strategy code using LLM (a HedgedLLM or a Gemini model)"""
 
     prompt = f"""{SYSTEM_PROMPT}
 
 USER REQUEST: "{query}"
 
 REFERENCE EXAMPLES:
-{FEW_SHOT_EXAMPLES}
+{build_few_shot_examples(query)}
 
 Generate a complete, robust UserStrategy class that implements the user's request.
 Include proper risk management with stop-loss and take-profit.
 Output ONLY the Python code, no markdown formatting."""
 
-    # Call the API with timeout
-    logger.info("  Calling Gemini API...")
-    response = model.generate_content(prompt, request_options={"timeout": 60})
-
-    # Extract text from response
-    code = response.text.strip()
+    if not isinstance(model, HedgedLLM):
+        model = HedgedLLM([GeminiProvider(model)])
 
-    # Clean the response
-    code = re.sub(r"```python\n?", "", code)
-    code = re.sub(r"```\n?", "", code)
-    code = code.strip()
+    # Call the API with timeout, taking the first response that compiles
+    logger.info("  Calling LLM API...")
+    text = model.generate(
+        prompt,
+        timeout=60,
+        validate=lambda t: compile_strategy(clean_generated_code(t))[0] is not None,
+    )
 
-    return code
+    return clean_generated_code(text)
 
 
 def compile_strategy(code: str):
@@ -524,7 +389,7 @@ def compile_strategy(code: str):
 def fetch_data(ticker: str, period: str) -> pd.DataFrame:
     """Fetch and prepare OHLCV data for backtesting"""
     try:
-        df = yf.download(ticker, period=period, progress=False, auto_adjust=True)
+        df = market_data.download(ticker, period=period, progress=False, auto_adjust=True)
 
         if df is None or df.empty:
             return None
@@ -582,6 +447,12 @@ def run_single_backtest(
 
         num_trades = int(safe_get("# Trades"))
         win_rate = safe_get("Win Rate [%]")
+        trades = stats._trades
+        trade_returns = (
+            [round(float(r), 6) for r in trades["ReturnPct"]]
+            if trades is not None and "ReturnPct" in trades.columns
+            else []
+        )
 
         metrics = TradeMetrics(
             symbol=ticker,
@@ -595,6 +466,7 @@ def run_single_backtest(
             profit_factor=round(safe_get("Profit Factor", 1), 3),
             pnl=round(pnl, 2),
             is_profitable=pnl > 0,
+            trade_returns=trade_returns,
         )
 
         # Get sampled equity curve (max 50 points for charting)
@@ -714,10 +586,21 @@ def calculate_portfolio_metrics(
     )
 
 
-def generate_analysis(
-    model, results: List[TradeMetrics], portfolio: PortfolioMetrics, query: str
-) -> Analysis:
-    """Generate verification and recommendations using LLM"""
+ANALYSIS_TIMEOUT = 30  # Shared deadline (seconds) for verifier + recommender
+
+ANALYSIS_FALLBACKS = {
+    "verification": "Analysis unavailable due to an error.",
+    "recommendations": "Unable to generate recommendations.",
+}
+
+# Verifier and recommender prompts are independent, so they run side by side
+_analysis_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis")
+
+
+def build_analysis_prompts(
+    results: List[TradeMetrics], portfolio: PortfolioMetrics, query: str
+) -> Dict[str, str]:
+    """Build the verifier and recommender prompts keyed by Analysis field"""
 
     # Build concise metrics summary
     metrics_summary = f"""
@@ -748,26 +631,72 @@ Explain: Is this strategy profitable? What do the key metrics indicate about its
 DO NOT GENERATE MORE THAN 3-4 LINES.
 Focus on: entry/exit timing, risk management, or indicator adjustments. Be actionable."""
 
-    try:
-        logger.info("🔍 Running Verifier agent...")
-        verify_response = model.generate_content(
-            verifier_prompt, request_options={"timeout": 30}
-        )
-        verification = verify_response.text.strip()[:500]
+    return {"verification": verifier_prompt, "recommendations": recommender_prompt}
 
-        logger.info("💡 Running Recommender agent...")
-        recommend_response = model.generate_content(
-            recommender_prompt, request_options={"timeout": 30}
-        )
-        recommendations = recommend_response.text.strip()[:500]
 
-        return Analysis(verification=verification, recommendations=recommendations)
-    except Exception as e:
-        logger.error(f"Analysis generation failed: {e}")
-        return Analysis(
-            verification="Analysis unavailable due to an error.",
-            recommendations="Unable to generate recommendations.",
-        )
+def _run_analysis_prompt(model, prompt: str, timeout: float) -> str:
+    response = model.generate_content(prompt, request_options={"timeout": timeout})
+    return response.text.strip()[:500]
+
+
+def start_analysis(
+    model,
+    results: List[TradeMetrics],
+    portfolio: PortfolioMetrics,
+    query: str,
+    timeout: float = ANALYSIS_TIMEOUT,
+) -> Dict[str, Any]:
+    """Submit verifier and recommender prompts concurrently.
+
+    Returns a dict with the pending futures and the shared deadline, to be
+    consumed by iter_analysis() or collect_analysis().
+    """
+    logger.info("🔍💡 Running Verifier and Recommender agents concurrently...")
+    prompts = build_analysis_prompts(results, portfolio, query)
+    futures = {
+        _analysis_executor.submit(_run_analysis_prompt, model, prompt, timeout): key
+        for key, prompt in prompts.items()
+    }
+    return {"futures": futures, "deadline": time.time() + timeout}
+
+
+def iter_analysis(pending: Dict[str, Any]):
+    """Yield (field, text) pairs as each analysis prompt completes.
+
+    Prompts that fail, or are still running at the shared deadline, yield
+    their fallback text instead.
+    """
+    not_done = set(pending["futures"])
+    while not_done:
+        remaining = pending["deadline"] - time.time()
+        if remaining <= 0:
+            break
+        done, not_done = wait(not_done, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = pending["futures"][future]
+            try:
+                yield key, future.result()
+            except Exception as e:
+                logger.error(f"Analysis generation failed ({key}): {e}")
+                yield key, ANALYSIS_FALLBACKS[key]
+
+    for future in not_done:
+        key = pending["futures"][future]
+        future.cancel()
+        logger.error(f"Analysis generation timed out ({key})")
+        yield key, ANALYSIS_FALLBACKS[key]
+
+
+def collect_analysis(pending: Dict[str, Any]) -> Analysis:
+    """Block until both analysis prompts finish or the deadline passes"""
+    return Analysis(**dict(iter_analysis(pending)))
+
+
+def generate_analysis(
+    model, results: List[TradeMetrics], portfolio: PortfolioMetrics, query: str
+) -> Analysis:
+    """Generate verification and recommendations using LLM"""
+    return collect_analysis(start_analysis(model, results, portfolio, query))
 
 
 # ----------------- Flask Route -----------------
@@ -783,10 +712,16 @@ def backtest_route():
         "query": "Buy when RSI < 30 and price above 200 SMA, sell when RSI > 70",
         "tickers": ["AAPL", "MSFT", "GOOGL"],
         "period": "2y",
-        "capital": 10000
+        "capital": 10000,
+        "stream": false
     }
 
     Returns backtest results with metrics, equity curve, and AI analysis.
+    With "stream": true the response is a server-sent event stream: a
+    "result" event without analysis, then one "analysis" event per field
+    (verification / recommendations) as each completes, then "complete".
+    Otherwise the equity curve can be requested as columns or an Arrow table
+    through the Accept header or ?format= (see app.encoding).
     """
     start_time = time.time()
     try:
@@ -817,7 +752,7 @@ def backtest_route():
         try:
             logger.info("🤖 Generating strategy code with LLM...")
             llm_start = time.time()
-            code = generate_strategy_code(req.query, llm)
+            code = generate_strategy_code(req.query, get_strategy_llm(llm))
             logger.info(
                 f"✅ Code generated in {time.time() - llm_start:.2f}s ({len(code)} chars)"
             )
@@ -870,18 +805,11 @@ def backtest_route():
             f"Return={portfolio_metrics.portfolio_return_pct:.2f}%"
         )
 
-        # Generate AI analysis (verifier + recommender)
+        # Generate AI analysis (verifier + recommender) in the background
         logger.info("🤖 Generating AI analysis...")
-        analysis = generate_analysis(llm, results, portfolio_metrics, req.query)
+        pending_analysis = start_analysis(llm, results, portfolio_metrics, req.query)
 
-        # Build response
-        logger.info(f"\n{'='*50}")
-        logger.info(
-            f"🏁 BACKTEST COMPLETE - Total time: {time.time() - start_time:.2f}s"
-        )
-        logger.info(f"{'='*50}")
-
-        # Convert equity data to EquityPoint objects
+        # Serialize ticker results while the analysis prompts are in flight
         equity_points = (
             [
                 EquityPoint(date=ep["date"], equity=ep["equity"])
@@ -896,14 +824,46 @@ def backtest_route():
             portfolio_metrics=portfolio_metrics,
             ticker_results=results,
             equity_curve=equity_points,
-            analysis=analysis,
+            analysis=Analysis(verification="", recommendations=""),
             errors=errors if errors else [],
         )
+        payload = result.model_dump(exclude={"analysis"})
 
-        return jsonify(result.model_dump())
+        if req.stream:
+
+            def generate():
+                yield f"data: {json.dumps({'type': 'result', 'data': payload})}\n\n"
+                for key, text in iter_analysis(pending_analysis):
+                    event = {"type": "analysis", "field": key, "text": text}
+                    yield f"data: {json.dumps(event)}\n\n"
+                logger.info(
+                    f"🏁 BACKTEST COMPLETE - Total time: {time.time() - start_time:.2f}s"
+                )
+                yield f"data: {json.dumps({'type': 'complete'})}\n\n"
+
+            return Response(generate(), mimetype="text/event-stream")
+
+        payload["analysis"] = collect_analysis(pending_analysis).model_dump()
+        # As a frame the curve can be sent as columns or an Arrow table (see app.encoding)
+        payload["equity_curve"] = pd.DataFrame(payload["equity_curve"], columns=["date", "equity"])
+
+        # Build response
+        logger.info(f"\n{'='*50}")
+        logger.info(
+            f"🏁 BACKTEST COMPLETE - Total time: {time.time() - start_time:.2f}s"
+        )
+        logger.info(f"{'='*50}")
+
+        return encode_response(payload)
 
     except Exception as e:
         import traceback
 
         logger.error(f"❌ Unexpected error: {str(e)}")
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+
+
+@backtest_bp.route("/backtest/llm-stats", methods=["GET"])
+def llm_stats_route():
+    """Per-provider LLM latency histograms (seconds) since process start"""
+    return jsonify({"providers": latency_stats()})
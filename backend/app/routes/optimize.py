@@ -1,9 +1,21 @@
 from flask import Blueprint, request, jsonify
-import yfinance as yf
+import secrets
 import numpy as np
 import pandas as pd
 import scipy.optimize as sco
 import scipy.cluster.hierarchy as sch
+import scipy.spatial.distance as ssd
+from concurrent.futures import ThreadPoolExecutor
+
+from app import market_data
+from app.covariance import DEFAULT_FACTORS, FactorCovariance, get_covariance, cov_to_corr
+from app.encoding import encode_response
+from app.portfolio_qp import PortfolioQP, get_ticker_groups
+from app.projection import (PROJECTION_MODELS, bootstrap_model, gaussian_model, project_portfolios,
+                            projection_report)
+from app.risk import get_risk_report, rolling_historical_var, rolling_risk, validate_risk_options
+from app.stress import STRESS_SCENARIOS, resolve_scenarios, stress_test
+from app.workers import OPTIMIZE_WORKERS, get_process_pool
 
 optimize_bp = Blueprint('optimize', __name__)
 
@@ -11,10 +23,11 @@ def get_portfolio_metrics(weights, mean_returns, cov_matrix):
     """
     Calculate portfolio return, volatility, and Sharpe ratio.
     Assumes risk_free_rate = 0 for Sharpe calculation.
+    cov_matrix can be a dense array or a FactorCovariance.
     """
     weights = np.array(weights)
     ret = np.sum(mean_returns * weights) * 252
-    vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) * np.sqrt(252)
+    vol = np.sqrt(weights @ (cov_matrix @ weights)) * np.sqrt(252)
     sharpe = ret / vol if vol > 0 else 0
     return ret, vol, sharpe
 
@@ -25,9 +38,9 @@ def get_diversification_ratio(weights, cov_matrix):
     Higher values indicate better diversification.
     """
     weights = np.array(weights)
-    individual_vols = np.sqrt(np.diag(cov_matrix)) * np.sqrt(252)
+    individual_vols = np.sqrt(cov_matrix.diagonal()) * np.sqrt(252)
     weighted_vol = np.sum(weights * individual_vols)
-    portfolio_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) * np.sqrt(252)
+    portfolio_vol = np.sqrt(weights @ (cov_matrix @ weights)) * np.sqrt(252)
     return weighted_vol / portfolio_vol if portfolio_vol > 0 else 1.0
 
 def get_herfindahl_index(weights):
@@ -50,10 +63,11 @@ def get_risk_contribution(weights, cov_matrix):
     Calculate marginal and percentage risk contribution per asset.
     """
     weights = np.array(weights)
-    portfolio_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+    cov_w = cov_matrix @ weights
+    portfolio_vol = np.sqrt(weights @ cov_w)
     
     # Marginal risk contribution
-    marginal_contrib = np.dot(cov_matrix, weights) / portfolio_vol if portfolio_vol > 0 else np.zeros_like(weights)
+    marginal_contrib = cov_w / portfolio_vol if portfolio_vol > 0 else np.zeros_like(weights)
     
     # Percentage risk contribution
     risk_contrib = weights * marginal_contrib
@@ -83,186 +97,896 @@ def get_var_cvar(returns, weights, confidence=0.95):
     # Annualize (approximate)
     return float(var * np.sqrt(252)), float(cvar * np.sqrt(252)) if not np.isnan(cvar) else float(var * np.sqrt(252))
 
-def get_correlation_insights(corr_matrix, tickers):
+def get_correlation_insights(corr_matrix, tickers, k=3):
     """
     Extract correlation insights - most/least correlated pairs.
+    The upper triangle is scanned in row blocks of bounded size, keeping
+    only the k extreme pairs of each block (argpartition). A factored
+    correlation (cov_to_corr of a FactorCovariance) is expanded one row
+    block at a time, so it never exists as an N x N matrix.
     """
+    factored = isinstance(corr_matrix, FactorCovariance)
+    corr = corr_matrix if factored else np.asarray(corr_matrix, dtype=float)
     n = len(tickers)
-    correlations = []
-    
-    for i in range(n):
-        for j in range(i + 1, n):
-            correlations.append({
-                "pair": [tickers[i], tickers[j]],
-                "correlation": float(corr_matrix.iloc[i, j])
-            })
-    
-    # Sort by correlation
-    correlations.sort(key=lambda x: x["correlation"])
-    
+    n_pairs = n * (n - 1) // 2
+    if n_pairs == 0:
+        return {"least_correlated": [], "most_correlated": [], "avg_correlation": 0}
+
+    rows, cols, values = [], [], []
+    block = max(1, 2**20 // n)
+    for start in range(0, n - 1, block):
+        stop = min(start + block, n - 1)
+        # Upper-triangle entries (i, j > i) of rows start..stop
+        r, c = np.triu_indices(stop - start, k=start + 1, m=n)
+        # Off-diagonal entries only: the specific variances never enter
+        v = (corr.loadings[start:stop] @ corr.loadings.T)[r, c] if factored else corr[r + start, c]
+        r += start
+        if len(v) > 2 * k:
+            keep = np.argpartition(v, [k - 1, len(v) - k])
+            keep = np.concatenate([keep[:k], keep[-k:]])
+            r, c, v = r[keep], c[keep], v[keep]
+        rows.append(r)
+        cols.append(c)
+        values.append(v)
+
+    rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+    order = np.argsort(values, kind='stable')
+    pairs = [{"pair": [tickers[rows[i]], tickers[cols[i]]], "correlation": float(values[i])} for i in order]
+    # Sum of the off-diagonal entries counts every pair twice; for L L' + diag(s)
+    # the full sum is |L' 1|^2 + sum(s) and the trace is n
+    total = np.sum(corr.loadings.sum(axis=0) ** 2) + corr.specific_var.sum() if factored else corr.sum()
+    avg = (total - n) / (2 * n_pairs)
+
     return {
-        "least_correlated": correlations[:3] if len(correlations) >= 3 else correlations,
-        "most_correlated": correlations[-3:][::-1] if len(correlations) >= 3 else correlations[::-1],
-        "avg_correlation": float(np.mean([c["correlation"] for c in correlations])) if correlations else 0
+        "least_correlated": pairs[:k],
+        "most_correlated": pairs[::-1][:min(k, n_pairs)],
+        "avg_correlation": float(avg)
     }
 
-def get_min_risk_weights(mean_returns, cov_matrix):
+def get_correlation_heatmap(corr_matrix, tickers, max_size=50):
+    """
+    Correlation matrix in hierarchical-cluster order, so correlated groups
+    sit in blocks along the diagonal. Above max_size assets, consecutive
+    assets in that order are pooled into max_size bins and each cell holds
+    the mean correlation between two bins (self-correlations included).
+    A factored correlation is ordered by each asset's dominant factor (then
+    by its loading on it) instead, and pooled from the loadings in O(NK).
+    """
+    n = len(tickers)
+    edges = np.linspace(0, n, min(n, max_size) + 1).round().astype(int)
+    sizes = np.diff(edges)
+    if isinstance(corr_matrix, FactorCovariance):
+        L = corr_matrix.loadings
+        dominant = np.abs(L).argmax(axis=1)
+        order = np.lexsort((-np.abs(L[np.arange(n), dominant]), dominant))
+        # Bin sums of L L' + diag(s): (S L)(S L)' plus the specific part on the diagonal
+        pooled = np.add.reduceat(L[order], edges[:-1], axis=0)
+        sums = pooled @ pooled.T
+        sums[np.diag_indices_from(sums)] += np.add.reduceat(corr_matrix.specific_var[order], edges[:-1])
+    else:
+        corr = np.asarray(corr_matrix, dtype=float)
+        dist = np.sqrt(np.clip((1 - corr) / 2, 0, None))
+        order = sch.leaves_list(sch.linkage(ssd.squareform(dist, checks=False), 'average'))
+        corr = corr[np.ix_(order, order)]
+        sums = np.add.reduceat(np.add.reduceat(corr, edges[:-1], axis=0), edges[:-1], axis=1)
+    ordered = [tickers[i] for i in order]
+    cells = sums / np.outer(sizes, sizes)
+    labels = [
+        ordered[lo] if hi - lo == 1 else f"{ordered[lo]}..{ordered[hi - 1]}"
+        for lo, hi in zip(edges[:-1], edges[1:])
+    ]
+
+    return {
+        "order": ordered,
+        "labels": labels,
+        "bin_sizes": sizes.tolist(),
+        "matrix": np.round(cells, 4).tolist()
+    }
+
+def get_min_risk_weights(mean_returns, cov_matrix, x0=None):
     num_assets = len(mean_returns)
     args = (cov_matrix)
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1})
+    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)})
     bounds = tuple((0, 1) for asset in range(num_assets))
     
     def portfolio_volatility(weights, cov_matrix):
-        return np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+        # Volatility and its gradient: d sqrt(w'Cw) / dw = Cw / sqrt(w'Cw)
+        cov_w = cov_matrix @ weights
+        vol = np.sqrt(np.dot(weights, cov_w))
+        return vol, cov_w / vol if vol > 0 else np.zeros_like(weights)
     
-    result = sco.minimize(portfolio_volatility, num_assets*[1./num_assets,], args=args,
+    x0 = num_assets*[1./num_assets,] if x0 is None else x0
+    result = sco.minimize(portfolio_volatility, x0, args=args, jac=True,
                           method='SLSQP', bounds=bounds, constraints=constraints)
     return result.x
 
-def get_max_sharpe_weights(mean_returns, cov_matrix, risk_free_rate=0.0, l2_reg=0.5):
+def get_max_sharpe_weights(mean_returns, cov_matrix, risk_free_rate=0.0, l2_reg=0.5, x0=None):
     """
     Maximize Sharpe Ratio with L2 regularization to encourage diversification.
     l2_reg: Regularization parameter. Higher value = more diversification.
+    x0: optional starting weights (default equal weights).
     """
     num_assets = len(mean_returns)
     args = (mean_returns, cov_matrix)
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1})
+    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)})
     bounds = tuple((0, 1) for asset in range(num_assets))
     
     def neg_sharpe_ratio(weights, mean_returns, cov_matrix):
         p_ret = np.sum(mean_returns * weights) * 252
-        p_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) * np.sqrt(252)
-        
-        sharpe = (p_ret - risk_free_rate) / p_vol if p_vol > 0 else 0
+        cov_w = (cov_matrix @ weights) * 252
+        p_vol = np.sqrt(np.dot(weights, cov_w))
         
         # Add L2 regularization penalty: -Sharpe + gamma * sum(w^2)
         # sum(w^2) is minimized when weights are equal (1/N).
         penalty = l2_reg * np.sum(weights**2)
+        grad_penalty = 2 * l2_reg * weights
+        
+        if p_vol <= 0:
+            return penalty, grad_penalty
         
-        return -sharpe + penalty
+        sharpe = (p_ret - risk_free_rate) / p_vol
+        # d Sharpe / dw = 252 mu / vol - (ret - rf) * 252 C w / vol^3
+        grad_sharpe = 252 * np.asarray(mean_returns) / p_vol - (p_ret - risk_free_rate) * cov_w / p_vol**3
+        
+        return -sharpe + penalty, -grad_sharpe + grad_penalty
     
-    result = sco.minimize(neg_sharpe_ratio, num_assets*[1./num_assets,], args=args,
+    x0 = num_assets*[1./num_assets,] if x0 is None else x0
+    result = sco.minimize(neg_sharpe_ratio, x0, args=args, jac=True,
                           method='SLSQP', bounds=bounds, constraints=constraints)
     return result.x
 
-def get_fractional_kelly_weights(returns, fraction=0.5):
+def get_frontier_metrics(weights_matrix, mean_returns, cov_matrix):
+    """
+    Annualized return, volatility and Sharpe for many portfolios at once.
+    weights_matrix: (n_portfolios, n_assets)
+    """
+    W = np.asarray(weights_matrix)
+    rets = W @ np.asarray(mean_returns) * 252
+    variances = np.einsum('ij,ij->i', W @ cov_matrix, W)
+    vols = np.sqrt(np.maximum(variances, 0)) * np.sqrt(252)
+    sharpes = np.divide(rets, vols, out=np.zeros_like(rets), where=vols > 0)
+    return rets, vols, sharpes
+
+def _min_variance_active_set(cov_matrix, tol=1e-12):
+    """
+    Exact long-only minimum-variance weights by block pivoting on the KKT
+    system of the held (non-zero) assets. Returns None if it does not settle.
+    """
+    n = cov_matrix.shape[0]
+    free = np.ones(n, dtype=bool)
+    for _ in range(3 * n):
+        k = int(free.sum())
+        kkt = np.zeros((k + 1, k + 1))
+        kkt[:k, :k] = 2 * cov_matrix[np.ix_(free, free)]
+        kkt[:k, k] = kkt[k, :k] = 1.0
+        rhs = np.zeros(k + 1)
+        rhs[k] = 1.0
+        sol = np.linalg.solve(kkt, rhs)
+        w = np.zeros(n)
+        w[free] = sol[:k]
+        
+        if w[free].min() < -tol:
+            free[np.argmin(np.where(free, w, np.inf))] = False
+            continue
+        # Bound multipliers of the held-out assets must be non-negative
+        nu = 2 * cov_matrix @ w + sol[k]
+        entering = ~free & (nu < -tol)
+        if entering.any():
+            free[np.argmin(np.where(entering, nu, np.inf))] = True
+            continue
+        return w
+    return None
+
+def _frontier_kkt(cov_matrix, A, free):
+    """
+    Solve the equality-constrained KKT system on the free assets for
+    b = (1, 0) and b = (0, 1), so the solution at target return t is
+    base + t * slope. Returns (base, slope) as (weights, multipliers) pairs.
+    """
+    k = int(free.sum())
+    A_free = A[:, free]
+    kkt = np.zeros((k + 2, k + 2))
+    kkt[:k, :k] = 2 * cov_matrix[np.ix_(free, free)]
+    kkt[:k, k:] = A_free.T
+    kkt[k:, :k] = A_free
+    rhs = np.zeros((k + 2, 2))
+    rhs[k, 0] = 1.0
+    rhs[k + 1, 1] = 1.0
+    sol = np.linalg.solve(kkt, rhs)
+    n = len(free)
+    w0, w1 = np.zeros(n), np.zeros(n)
+    w0[free], w1[free] = sol[:k, 0], sol[:k, 1]
+    return (w0, sol[k:, 0]), (w1, sol[k:, 1])
+
+def get_efficient_frontier(mean_returns, cov_matrix, n_points=50):
+    """
+    Long-only efficient frontier: minimum-variance weights for n_points target
+    returns between the minimum-variance portfolio and the best single asset.
+    Between corner portfolios the optimal weights are linear in the target
+    return, so the frontier is traced in one pass: each point starts from the
+    previous point's set of zero-weight assets and only changes it when a
+    weight hits zero or a held-out asset becomes worth adding. SLSQP,
+    warm-started from the previous weights, is the fallback for degenerate
+    cases.
+    Returns a (n_points, n_assets) weights matrix.
+    """
+    # Annualize so tolerances are meaningful at daily-return scale
+    mean_ann = np.asarray(mean_returns) * 252
+    cov_ann = np.asarray(cov_matrix) * 252
+    num_assets = len(mean_ann)
+    ones = np.ones(num_assets)
+    A = np.vstack([ones, mean_ann])
+    bounds = tuple((0, 1) for asset in range(num_assets))
+    tol = 1e-12
+    
+    try:
+        w = _min_variance_active_set(cov_ann)
+    except np.linalg.LinAlgError:
+        w = None
+    if w is None:
+        w = get_min_risk_weights(mean_returns, cov_matrix)
+    free = w > 1e-10
+    
+    best_asset = int(np.argmax(mean_ann))
+    targets = np.linspace(mean_ann @ w, mean_ann[best_asset], n_points)
+    frontier = np.empty((n_points, num_assets))
+    t_current = targets[0]
+    
+    for i, target in enumerate(targets):
+        w_next = None
+        if i == n_points - 1:
+            # The top of the frontier is the highest-return asset alone
+            w_next = np.zeros(num_assets)
+            w_next[best_asset] = 1.0
+        else:
+            try:
+                for _ in range(4 * num_assets):
+                    (w0, lam0), (w1, lam1) = _frontier_kkt(cov_ann, A, free)
+                    # Multipliers of the w >= 0 bounds on held-out assets
+                    nu0 = 2 * cov_ann @ w0 + A.T @ lam0
+                    nu1 = 2 * cov_ann @ w1 + A.T @ lam1
+                    
+                    # First event between t_current and target: a held weight
+                    # falls to zero or a held-out asset's multiplier does
+                    value = np.where(free, w0 + t_current * w1, nu0 + t_current * nu1)
+                    rate = np.where(free, w1, nu1)
+                    falling = rate < -tol
+                    steps = np.full(num_assets, np.inf)
+                    steps[falling] = np.maximum(value[falling], 0) / -rate[falling]
+                    j = int(np.argmin(steps))
+                    
+                    if t_current + steps[j] >= target:
+                        w_next = w0 + target * w1
+                        t_current = target
+                        break
+                    t_current += steps[j]
+                    free[j] = not free[j]
+            except np.linalg.LinAlgError:
+                w_next = None
+            
+            if w_next is None or w_next.min() < -1e-8:
+                constraints = (
+                    {'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: ones},
+                    {'type': 'eq', 'fun': lambda x, t=target: mean_ann @ x - t, 'jac': lambda x: mean_ann},
+                )
+                result = sco.minimize(lambda x: x @ cov_ann @ x, w, jac=lambda x: 2 * cov_ann @ x,
+                                      method='SLSQP', bounds=bounds, constraints=constraints,
+                                      options={'ftol': 1e-12, 'maxiter': 500})
+                w_next = result.x
+                free = w_next > 1e-6
+                t_current = target
+        
+        w = np.maximum(w_next, 0)
+        w /= w.sum()
+        frontier[i] = w
+    
+    return frontier
+
+def kelly_utility(weights, returns, gamma, with_hessian=True):
+    """
+    Negative CRRA utility of the daily portfolio growth factors, with its
+    gradient and (optionally) Hessian. Days clipped at the 1e-6 floor contribute no
+    curvature or slope.
+    u(x) = log(x) for gamma = 1, else x^(1-gamma) / (1-gamma), so
+    u'(x) = x^-gamma and u''(x) = -gamma x^(-gamma-1) in both cases.
+    """
+    growth = np.dot(returns, weights) + 1
+    # Avoid domain errors for utility functions (log or power of <= 0)
+    safe_rets = np.maximum(growth, 1e-6)
+    active = growth > 1e-6
+    
+    if abs(gamma - 1.0) < 1e-6:
+        # Log Utility (Full Kelly)
+        value = -np.sum(np.log(safe_rets))
+    else:
+        # CRRA Utility (Power Utility)
+        value = -np.sum((safe_rets**(1-gamma)) / (1-gamma))
+    
+    marginal = np.where(active, safe_rets**(-gamma), 0.0)
+    grad = -np.dot(returns.T, marginal)
+    if not with_hessian:
+        return value, grad, None
+    curvature = np.where(active, gamma * safe_rets**(-gamma - 1), 0.0)
+    hess = np.dot(returns.T * curvature, returns)
+    return value, grad, hess
+
+def _kelly_newton(returns, gamma, max_iter=100, tol=1e-12, w0=None):
+    """
+    Active-set Newton method for the long-only, fully-invested CRRA Kelly
+    problem. Each step solves the Newton system restricted to the held
+    assets with sum(step) = 0, backtracks along the step projected onto
+    w >= 0 until the utility decreases, and releases a zero-weight asset
+    once the held assets are stationary but that asset's bound multiplier
+    turns negative. Starts from w0 (default equal weights) with its
+    nonzero weights held. Returns None if it fails to converge.
+    """
+    num_assets = returns.shape[1]
+    w = np.full(num_assets, 1.0 / num_assets) if w0 is None else np.asarray(w0, dtype=float)
+    free = w > 0
+    value, grad, hess = kelly_utility(w, returns, gamma)
+    
+    for _ in range(max_iter):
+        k = int(free.sum())
+        kkt = np.zeros((k + 1, k + 1))
+        kkt[:k, :k] = hess[np.ix_(free, free)]
+        kkt[:k, k] = kkt[k, :k] = 1.0
+        rhs = np.concatenate([-grad[free], [0.0]])
+        try:
+            sol = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+        except np.linalg.LinAlgError:
+            return None
+        step = np.zeros(num_assets)
+        step[free] = sol[:k]
+        
+        # Newton decrement: -g'd is the predicted decrease
+        decrement = -np.dot(grad, step)
+        if decrement < tol * max(1.0, abs(value)):
+            # Stationary on the held assets; check held-out multipliers
+            nu = grad + sol[k]
+            entering = ~free & (nu < -tol * max(1.0, np.abs(grad).max()))
+            if not entering.any():
+                return w
+            free[np.argmin(np.where(entering, nu, np.inf))] = True
+            continue
+        
+        # Backtracking (Armijo) search along the projected Newton arc: weights
+        # that would go negative are clipped to zero and leave the held set,
+        # so several assets can drop out in one step
+        t = 1.0
+        while t > 1e-12:
+            w_new = np.maximum(w + t * step, 0)
+            w_new /= w_new.sum()
+            value_new = kelly_utility(w_new, returns, gamma, with_hessian=False)[0]
+            if value_new <= value - 1e-4 * t * decrement:
+                break
+            t *= 0.5
+        else:
+            return None
+        
+        w = w_new
+        free = w > 0
+        value, grad, hess = kelly_utility(w, returns, gamma)
+    
+    return None
+
+def get_fractional_kelly_weights(returns, fraction=0.5, x0=None):
     """
     Calculate weights based on Fractional Kelly Criterion using CRRA Utility.
     Fraction = 0.5 (Half Kelly) implies Relative Risk Aversion (gamma) = 2.
+    Solved by active-set Newton with the analytic Hessian; SLSQP with the
+    analytic gradient is the fallback. x0: optional starting weights.
     """
+    returns = np.asarray(returns)
     num_assets = returns.shape[1]
     
     # Gamma (Risk Aversion) = 1 / fraction
     gamma = 1.0 / fraction
     
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1})
+    weights = _kelly_newton(returns, gamma, w0=x0)
+    if weights is not None:
+        return weights
+    
+    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)})
     bounds = tuple((0, 1) for asset in range(num_assets))
     
     def neg_utility(weights, returns):
-        # Portfolio returns series (daily)
-        port_rets = np.dot(returns, weights)
-        
-        # Avoid domain errors for utility functions (log or power of <= 0)
-        safe_rets = np.maximum(port_rets + 1, 1e-6)
+        value, grad, _ = kelly_utility(weights, returns, gamma, with_hessian=False)
+        return value, grad
         
-        if abs(gamma - 1.0) < 1e-6:
-            # Log Utility (Full Kelly)
-            return -np.sum(np.log(safe_rets))
-        else:
-            # CRRA Utility (Power Utility)
-            return -np.sum((safe_rets**(1-gamma)) / (1-gamma))
-        
-    result = sco.minimize(neg_utility, num_assets*[1./num_assets,], args=(returns,),
+    x0 = num_assets*[1./num_assets,] if x0 is None else x0
+    result = sco.minimize(neg_utility, x0, args=(returns,), jac=True,
                           method='SLSQP', bounds=bounds, constraints=constraints)
     return result.x
 
 # --- HRP Implementation ---
+# Works on integer positions and plain arrays throughout, so it scales to
+# universes of thousands of assets.
 
 def get_hrp_weights(returns):
     # 1. Cluster
-    cov = returns.cov()
-    corr = returns.corr()
+    X = np.asarray(returns, dtype=float)
+    cov = np.cov(X, rowvar=False)
+    std = np.sqrt(np.diag(cov))
+    corr = np.clip(cov / np.outer(std, std), -1, 1)
+    np.fill_diagonal(corr, 1.0)
     
     # Dist matrix based on correlation
     dist = np.sqrt(np.clip((1 - corr) / 2, a_min=0, a_max=None))
-    link = sch.linkage(dist, 'single')
+    # As in the reference implementation, linkage clusters the rows of the
+    # distance matrix as observations; their euclidean distances are computed
+    # here with one matrix product instead of scipy's pairwise loop
+    link = sch.linkage(get_row_distances(dist), 'single')
     
     # Sort (Quasi-Diagonalization)
     sort_ix = get_quasi_diag(link)
-    sort_ix = corr.columns[sort_ix].tolist() # Get ticker names in sorted order
-    
-    # Reorder covariance
-    df_cov = cov.loc[sort_ix, sort_ix]
-    
-    # 2. Recursive Bisection
-    hrp_weights = get_rec_bisection(df_cov, sort_ix)
     
-    # Realign weights to original order (returns.columns) before returning
-    # hrp_weights is a pd.Series with index as tickers
-    return hrp_weights.reindex(returns.columns).fillna(0).values
+    # 2. Recursive Bisection (weights come back in the original column order)
+    return get_rec_bisection(cov, sort_ix)
+
+def get_row_distances(X):
+    """Condensed euclidean distances between the rows of X"""
+    sq_norms = np.einsum('ij,ij->i', X, X)
+    sq_dist = sq_norms[:, None] + sq_norms[None, :] - 2 * X @ X.T
+    np.fill_diagonal(sq_dist, 0)
+    return ssd.squareform(np.sqrt(np.maximum(sq_dist, 0)), checks=False)
 
 def get_quasi_diag(link):
-    link = link.astype(int)
-    sort_ix = pd.Series([link[-1, 0], link[-1, 1]])
-    num_items = link[-1, 3]
-    
-    while sort_ix.max() >= num_items:
-        sort_ix.index = range(0, sort_ix.shape[0] * 2, 2)
-        df0 = sort_ix[sort_ix >= num_items]
-        i = df0.index
-        j = df0.values - num_items
-        sort_ix[i] = link[j, 0]
-        df0 = pd.Series(link[j, 1], index=i + 1)
-        sort_ix = pd.concat([sort_ix, df0]) # Use concat instead of append
-        sort_ix = sort_ix.sort_index()
-        sort_ix.index = range(sort_ix.shape[0])
-    
-    return sort_ix.tolist()
+    """Leaf order of the dendrogram, left branch first"""
+    return sch.leaves_list(link).tolist()
 
 def get_rec_bisection(cov, sort_ix):
-    w = pd.Series(1, index=sort_ix)
-    c_items = [sort_ix]
+    """
+    HRP weights by recursive bisection of the quasi-diagonal order.
+    Clusters are contiguous ranges of sorted positions, so each one is a
+    block slice of the reordered covariance matrix.
+    """
+    sort_ix = np.asarray(sort_ix)
+    cov_sorted = np.asarray(cov)[np.ix_(sort_ix, sort_ix)]
+    inv_var = 1. / np.diag(cov_sorted)
+    w = np.ones(len(sort_ix))
+    c_items = [(0, len(sort_ix))]
     
     while len(c_items) > 0:
-        # Split the list of items in two
-        c_items = [i[j:k] for i in c_items for j, k in ((0, len(i) // 2), (len(i) // 2, len(i))) if len(i) > 1]
+        # Split each range in two
+        c_items = [r for lo, hi in c_items if hi - lo > 1
+                   for r in ((lo, lo + (hi - lo) // 2), (lo + (hi - lo) // 2, hi))]
         
         for i in range(0, len(c_items), 2):
             c_left = c_items[i]
             c_right = c_items[i + 1]
             
-            v_left = get_cluster_var(cov, c_left)
-            v_right = get_cluster_var(cov, c_right)
+            v_left = get_cluster_var(cov_sorted, inv_var, *c_left)
+            v_right = get_cluster_var(cov_sorted, inv_var, *c_right)
             
             alpha = 1 - v_left / (v_left + v_right)
             
-            w[c_left] *= alpha
-            w[c_right] *= 1 - alpha
-            
-    return w
-
-def get_cluster_var(cov, c_items):
-    cov_slice = cov.loc[c_items, c_items]
-    w = get_ivp(cov_slice).reshape(-1, 1)
-    return np.dot(np.dot(w.T, cov_slice), w)[0, 0]
+            w[c_left[0]:c_left[1]] *= alpha
+            w[c_right[0]:c_right[1]] *= 1 - alpha
+    
+    weights = np.empty(len(sort_ix))
+    weights[sort_ix] = w
+    return weights
 
-def get_ivp(cov):
-    ivp = 1. / np.diag(cov)
-    ivp /= ivp.sum()
-    return ivp
+def get_cluster_var(cov_sorted, inv_var, lo, hi):
+    """Variance of the inverse-variance portfolio of sorted positions lo..hi-1"""
+    w = inv_var[lo:hi] / inv_var[lo:hi].sum()
+    return w @ cov_sorted[lo:hi, lo:hi] @ w
 
 # --- End HRP ---
 
+def fetch_close_prices(tickers, period="2y", align=True, fill=True):
+    """
+    Download adjusted close prices and clean them into a dates x tickers frame.
+    Tickers with no data are dropped; an empty frame means nothing was found.
+    With align=False, dates before every ticker has started trading are kept
+    (NaN-padded) so that sub-baskets can be aligned separately. With
+    fill=False, gaps are not forward-filled either (see clean_basket_prices).
+    """
+    print(f"Fetching data for tickers: {tickers}")
+    
+    # Using 'Close' (which is auto-adjusted) for returns
+    raw_data = market_data.download(tickers, period=period, progress=False, auto_adjust=True)
+    
+    print(f"Raw data shape: {raw_data.shape if hasattr(raw_data, 'shape') else 'N/A'}")
+    print(f"Raw data columns: {raw_data.columns.tolist() if hasattr(raw_data, 'columns') else 'N/A'}")
+    
+    # Handle different DataFrame structures based on number of tickers
+    if len(tickers) == 1:
+        # Single ticker: columns are just ['Close', 'High', 'Low', 'Open', 'Volume']
+        df = raw_data[['Close']].copy()
+        df.columns = tickers
+    elif 'Close' in raw_data.columns.get_level_values(0) if hasattr(raw_data.columns, 'get_level_values') else False:
+        # Multi-level columns when multiple tickers
+        df = raw_data['Close']
+    else:
+        # Fallback: assume single level or already processed
+        df = raw_data if isinstance(raw_data, pd.DataFrame) else pd.DataFrame(raw_data)
+    
+    print(f"Processed df shape: {df.shape}")
+    print(f"Processed df columns: {df.columns.tolist()}")
+    
+    if df.empty:
+        return df
+    
+    # Handle missing data (drop cols with too many NaNs, fill forward)
+    df = df.dropna(axis=1, how='all')
+    if not fill:
+        return df
+    df = df.ffill()  # Forward fill (replaces deprecated fillna(method='ffill'))
+    if align:
+        df = df.dropna()  # Drop initial rows with NaNs
+    return df
+
+def clean_basket_prices(raw, tickers):
+    """
+    One basket's prices from an unfilled multi-basket frame (fetch_close_prices
+    with fill=False), cleaned as if only the basket had been downloaded:
+    only dates on which one of its tickers traded, forward-filled, aligned.
+    """
+    df = raw[[t for t in dict.fromkeys(tickers) if t in raw.columns]]
+    return df.dropna(how='all').dropna(axis=1, how='all').ffill().dropna()
+
+def get_constraint_kwargs(constraints, tickers):
+    """
+    PortfolioQP keyword arguments from the optional "constraints" object:
+    min_weight / max_weight (all assets), bounds {ticker: [lo, hi]},
+    group_caps {group: cap} with groups from Equity.csv or a groups
+    {ticker: group} override, current_weights {ticker: w} with max_turnover,
+    and solver ("admm" or "slsqp"). Raises ValueError for malformed values.
+    """
+    n = len(tickers)
+    try:
+        lower = np.full(n, float(constraints.get('min_weight', 0.0)))
+        upper = np.full(n, float(constraints.get('max_weight', 1.0)))
+        for ticker, (lo, hi) in (constraints.get('bounds') or {}).items():
+            if ticker.upper() in tickers:
+                i = tickers.index(ticker.upper())
+                lower[i], upper[i] = float(lo), float(hi)
+        current = {k.upper(): float(v) for k, v in (constraints.get('current_weights') or {}).items()}
+        max_turnover = constraints.get('max_turnover')
+        max_turnover = None if max_turnover is None else float(max_turnover)
+        group_caps = {g: float(cap) for g, cap in (constraints.get('group_caps') or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("Constraint weights, bounds ([lo, hi] per ticker), group caps and max_turnover must be numbers.")
+    
+    groups = get_ticker_groups(tickers, constraints.get('groups'))
+    
+    return {
+        'lower': lower,
+        'upper': upper,
+        'groups': [groups.get(t) for t in tickers],
+        'group_caps': group_caps,
+        'current_weights': np.array([current.get(t, 0.0) for t in tickers]),
+        'max_turnover': max_turnover,
+        'solver': constraints.get('solver', 'admm'),
+    }
+
+# The optimizers only read the returns and covariance, so they run side by side
+_optimizer_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="optimizer")
+
+def run_optimizers(daily_returns, cov_matrix, qp_kwargs=None, parallel=True, methods=None):
+    """
+    Weights of the four strategies (min_risk, max_sharpe, hrp, kelly) for
+    one basket, or of the given subset of `methods`. With qp_kwargs, min
+    risk and max Sharpe are solved by PortfolioQP under those constraints.
+    With `parallel`, the solves run concurrently on the shared, read-only
+    returns and covariance.
+    """
+    mean_returns = daily_returns.mean().values
+    if qp_kwargs is not None:
+        # PortfolioQP keeps warm-start state between solves, so each task builds its own
+        solves = {
+            'min_risk': lambda: PortfolioQP(cov_matrix, **qp_kwargs).min_variance(),
+            'max_sharpe': lambda: PortfolioQP(cov_matrix, **qp_kwargs).max_sharpe(mean_returns),
+        }
+    else:
+        solves = {
+            'min_risk': lambda: get_min_risk_weights(mean_returns, cov_matrix),
+            # Diversified Max Sharpe (with L2 regularization)
+            'max_sharpe': lambda: get_max_sharpe_weights(mean_returns, cov_matrix, l2_reg=0.5),
+        }
+    solves['hrp'] = lambda: get_hrp_weights(daily_returns)
+    solves['kelly'] = lambda: get_fractional_kelly_weights(daily_returns.values, fraction=0.5)  # Half Kelly
+    if methods is not None:
+        solves = {name: solve for name, solve in solves.items() if name in methods}
+    
+    if not parallel:
+        return {name: solve() for name, solve in solves.items()}
+    futures = {name: _optimizer_executor.submit(solve) for name, solve in solves.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+# ----------------- Resampled Optimization -----------------
+
+STRATEGIES = ('min_risk', 'max_sharpe', 'hrp', 'kelly')
+
+RESAMPLE_MAX_SAMPLES = 5000
+
+def get_bootstrap_indices(n_days, n_samples, seed=0):
+    """Row indices of n_samples i.i.d. bootstrap draws of n_days days, generated in one call"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n_days, size=(n_samples, n_days), dtype=np.int32)
+
+def solve_samples(returns, indices, qp_kwargs=None, methods=STRATEGIES):
+    """
+    Weights of the given strategies on each sample of the daily returns,
+    as {strategy: (n_samples x n_assets)}. Each row of `indices` selects
+    the days of one sample (a bootstrap draw or a trailing window). Each
+    sample's solves start from the previous sample's weights.
+    """
+    X = np.asarray(returns, dtype=float)
+    weights = {name: np.empty((len(indices), X.shape[1])) for name in methods}
+    prev = {}
+    for b, rows in enumerate(indices):
+        sample = X[rows]
+        mean_returns = sample.mean(axis=0)
+        cov_matrix = np.cov(sample, rowvar=False)
+        if qp_kwargs is not None and ('min_risk' in methods or 'max_sharpe' in methods):
+            # max_sharpe warm-starts from the min-variance solve on the same matrix
+            qp = PortfolioQP(cov_matrix, **qp_kwargs)
+            if 'min_risk' in methods:
+                weights['min_risk'][b] = qp.min_variance()
+            if 'max_sharpe' in methods:
+                weights['max_sharpe'][b] = qp.max_sharpe(mean_returns)
+        else:
+            if 'min_risk' in methods:
+                # Exact active-set solve: SLSQP's answer on the flat volatility surface
+                # depends on its starting point by more than the resampling noise
+                w_min_risk = _min_variance_active_set(cov_matrix)
+                if w_min_risk is None:
+                    w_min_risk = get_min_risk_weights(mean_returns, cov_matrix, x0=prev.get('min_risk'))
+                weights['min_risk'][b] = w_min_risk
+            if 'max_sharpe' in methods:
+                weights['max_sharpe'][b] = get_max_sharpe_weights(mean_returns, cov_matrix, l2_reg=0.5,
+                                                                  x0=prev.get('max_sharpe'))
+        if 'hrp' in methods:
+            weights['hrp'][b] = get_hrp_weights(sample)
+        if 'kelly' in methods:
+            weights['kelly'][b] = get_fractional_kelly_weights(sample, fraction=0.5, x0=prev.get('kelly'))
+        for name, w in weights.items():
+            # Clean weights (handle small negatives) before they seed the next sample
+            w[b] = np.maximum(w[b], 0) / np.maximum(w[b], 0).sum()
+            prev[name] = w[b]
+    return weights
+
+def solve_samples_parallel(returns, indices, qp_kwargs=None, methods=STRATEGIES, parallel=True):
+    """
+    solve_samples with the samples split into one contiguous chunk per
+    worker process. A given worker count always gives the same weights.
+    """
+    X = np.asarray(returns, dtype=float)
+    if parallel and OPTIMIZE_WORKERS > 1 and len(indices) > 1:
+        chunks = np.array_split(indices, min(OPTIMIZE_WORKERS, len(indices)))
+        n = len(chunks)
+        parts = list(get_process_pool().map(solve_samples, [X] * n, chunks, [qp_kwargs] * n, [methods] * n))
+    else:
+        parts = [solve_samples(X, indices, qp_kwargs, methods)]
+    return {name: np.concatenate([part[name] for part in parts]) for name in methods}
+
+def get_resampled_weights(returns, n_samples=1000, seed=0, qp_kwargs=None, parallel=True):
+    """
+    Resampled (Michaud) weights: each strategy's weights averaged over
+    n_samples bootstrap draws of the daily returns.
+    """
+    indices = get_bootstrap_indices(len(returns), n_samples, seed)
+    weights = solve_samples_parallel(returns, indices, qp_kwargs, parallel=parallel)
+    return {name: w.mean(axis=0) for name, w in weights.items()}
+
+# HRP (correlation distances) and Kelly (Newton Hessian) work on dense N x N
+# matrices; with the factor estimator they only run up to this many assets
+DENSE_STRATEGY_MAX_ASSETS = 1000
+
+def optimize_prices(df, tickers, data, parallel=True, covariance=None):
+    """
+    Full /optimize report for a cleaned dates x tickers price frame, with
+    the request options in `data`. `covariance` is an already computed
+    get_covariance result for these returns and options (computed here if
+    None). Raises ValueError for invalid options (unknown covariance
+    estimator, infeasible constraints, ...).
+    """
+    valid_tickers = df.columns.tolist()
+    capital = float(data.get('capital', 10000))
+    
+    # Calculate Returns
+    daily_returns = df.pct_change().dropna()
+    mean_returns = daily_returns.mean()
+    cov_estimator = data.get('cov_estimator', 'sample')
+    n_factors = int(data.get('n_factors', DEFAULT_FACTORS))
+    cov_matrix, cov_source = covariance or get_covariance(daily_returns, cov_estimator, n_factors=n_factors)
+    # Factor covariances stay factored: every consumer only needs C @ x and diag(C)
+    factored = isinstance(cov_matrix, FactorCovariance)
+    cov_values = cov_matrix if factored else cov_matrix.values
+    
+    # --- Run Optimizations ---
+    
+    results = {}
+    constraints = data.get('constraints')
+    # Constrained (or large-universe) min risk / max Sharpe go through the QP backend
+    qp_kwargs = get_constraint_kwargs(constraints or {}, valid_tickers) if constraints or factored else None
+    risk_options = validate_risk_options(data['risk']) if data.get('risk') else None
+    resample = data.get('resample')
+    if resample:
+        resample = resample if isinstance(resample, dict) else {}
+        n_samples = int(resample.get('samples', 1000))
+        seed = int(resample.get('seed', 0))
+        if factored:
+            raise ValueError("Resampling needs dense covariances: it cannot be combined with the factor estimator.")
+        if not 10 <= n_samples <= RESAMPLE_MAX_SAMPLES:
+            raise ValueError(f"Resample samples must be between 10 and {RESAMPLE_MAX_SAMPLES}.")
+        resample = {"samples": n_samples, "seed": seed}
+        weight_vectors = get_resampled_weights(daily_returns.values, n_samples, seed, qp_kwargs, parallel)
+    else:
+        methods = None
+        if factored and len(valid_tickers) > DENSE_STRATEGY_MAX_ASSETS:
+            methods = ('min_risk', 'max_sharpe')
+        weight_vectors = run_optimizers(daily_returns, cov_values, qp_kwargs, parallel, methods)
+    
+    # Format Results
+    
+    for strategy, w_vec in weight_vectors.items():
+        # Clean weights (round and handle small negatives)
+        w_vec = np.maximum(w_vec, 0) # Enforce non-negative just in case
+        w_vec = w_vec / np.sum(w_vec) # Renormalize
+        
+        # Create weight dict
+        weights_dict = {ticker: float(weight) for ticker, weight in zip(valid_tickers, w_vec)}
+        
+        # Allocation
+        allocation_dict = {ticker: float(weight * capital) for ticker, weight in zip(valid_tickers, w_vec)}
+        
+        # Basic Metrics
+        ret, vol, sharpe = get_portfolio_metrics(w_vec, mean_returns.values, cov_values)
+        
+        # Advanced Metrics
+        div_ratio = get_diversification_ratio(w_vec, cov_values)
+        hhi = get_herfindahl_index(w_vec)
+        effective_n = get_effective_n(w_vec)
+        risk_contrib = get_risk_contribution(w_vec, cov_values)
+        max_dd = estimate_max_drawdown(daily_returns, w_vec)
+        var_95, cvar_95 = get_var_cvar(daily_returns, w_vec, confidence=0.95)
+        
+        # Risk contribution per asset
+        risk_contribution_dict = {ticker: float(rc) for ticker, rc in zip(valid_tickers, risk_contrib)}
+        
+        # Find dominant asset (highest weight)
+        sorted_weights = sorted(weights_dict.items(), key=lambda x: x[1], reverse=True)
+        top_holding = sorted_weights[0] if sorted_weights else ("N/A", 0)
+        
+        results[strategy] = {
+            "weights": weights_dict,
+            "allocation": allocation_dict,
+            "risk_contribution": risk_contribution_dict,
+            "metrics": {
+                "return": float(ret),
+                "volatility": float(vol),
+                "sharpe": float(sharpe),
+                "diversification_ratio": float(div_ratio),
+                "concentration_hhi": float(hhi),
+                "effective_assets": float(effective_n),
+                "max_drawdown": float(max_dd),
+                "var_95": float(var_95),
+                "cvar_95": float(cvar_95)
+            },
+            "insights": {
+                "top_holding": {"ticker": top_holding[0], "weight": float(top_holding[1])},
+                "is_concentrated": bool(hhi > 0.5),
+                "is_well_diversified": bool(div_ratio > 1.2 and effective_n > len(valid_tickers) * 0.6)
+            }
+        }
+
+    # Risk engine: VaR/CVaR of every candidate portfolio, scenarios shared across them
+    if risk_options:
+        weight_matrix = np.array([list(r["weights"].values()) for r in results.values()])
+        reports = get_risk_report(daily_returns.values, weight_matrix, **risk_options,
+                                  n_factors=cov_matrix.n_factors if factored else None)
+        for portfolio, report in zip(results.values(), reports):
+            portfolio["risk"] = report
+        
+    # Individual Asset Metrics
+    individual_metrics = {}
+    asset_vars = cov_values.diagonal()
+    for ticker, asset_var in zip(valid_tickers, asset_vars):
+        ann_ret = mean_returns[ticker] * 252
+        ann_vol = np.sqrt(asset_var) * np.sqrt(252)
+        sharpe = ann_ret / ann_vol if ann_vol > 0 else 0
+        individual_metrics[ticker] = {
+            "return": float(ann_ret),
+            "volatility": float(ann_vol),
+            "sharpe": float(sharpe)
+        }
+    
+    # Correlation matrix for insights
+    corr_matrix = cov_to_corr(cov_matrix)
+    correlation_insights = get_correlation_insights(corr_matrix, valid_tickers)
+    correlation_heatmap = None
+    if data.get('correlation_heatmap'):
+        heatmap_size = min(max(int(data.get('heatmap_size', 50)), 2), 200)
+        correlation_heatmap = get_correlation_heatmap(corr_matrix, valid_tickers, heatmap_size)
+    
+    # Find best/worst assets
+    sorted_by_return = sorted(individual_metrics.items(), key=lambda x: x[1]["return"], reverse=True)
+    sorted_by_sharpe = sorted(individual_metrics.items(), key=lambda x: x[1]["sharpe"], reverse=True)
+    sorted_by_volatility = sorted(individual_metrics.items(), key=lambda x: x[1]["volatility"])
+    
+    asset_insights = {
+        "best_return": {"ticker": sorted_by_return[0][0], "value": sorted_by_return[0][1]["return"]},
+        "worst_return": {"ticker": sorted_by_return[-1][0], "value": sorted_by_return[-1][1]["return"]},
+        "best_sharpe": {"ticker": sorted_by_sharpe[0][0], "value": sorted_by_sharpe[0][1]["sharpe"]},
+        "lowest_volatility": {"ticker": sorted_by_volatility[0][0], "value": sorted_by_volatility[0][1]["volatility"]},
+        "highest_volatility": {"ticker": sorted_by_volatility[-1][0], "value": sorted_by_volatility[-1][1]["volatility"]}
+    }
+    
+    # Strategy comparison insights
+    strategy_comparison = {
+        "best_return": max(results.items(), key=lambda x: x[1]["metrics"]["return"])[0],
+        "lowest_risk": min(results.items(), key=lambda x: x[1]["metrics"]["volatility"])[0],
+        "best_sharpe": max(results.items(), key=lambda x: x[1]["metrics"]["sharpe"])[0],
+        "most_diversified": max(results.items(), key=lambda x: x[1]["metrics"]["diversification_ratio"])[0],
+    }
+        
+    response = {
+        "input": {
+            "tickers": tickers,
+            "capital": capital,
+            "valid_tickers_found": valid_tickers,
+            "data_period": "2 years",
+            "trading_days_analyzed": int(len(daily_returns)),
+            "covariance": {
+                "estimator": cov_estimator,
+                "cache": cov_source,
+                "n_factors": cov_matrix.n_factors if factored else None,
+                "skipped_strategies": [m for m in STRATEGIES if m not in weight_vectors],
+            },
+            "resample": resample or None,
+            "risk": risk_options,
+            "constraints": {
+                **constraints,
+                "groups": {t: g for t, g in zip(valid_tickers, qp_kwargs['groups']) if g},
+            } if constraints else None
+        },
+        "assets": individual_metrics,
+        "asset_insights": asset_insights,
+        "correlation_insights": correlation_insights,
+        "correlation_heatmap": correlation_heatmap,
+        "portfolios": results,
+        "strategy_comparison": strategy_comparison,
+        "recommendations": generate_recommendations(results, asset_insights, correlation_insights)
+    }
+    
+    return response
+
 @optimize_bp.route('/optimize', methods=['POST'])
 def optimize_route():
     """
     Optimize portfolio weights.
     Input: JSON {"tickers": ["AAPL", "MSFT"], "capital": 10000}
+    Optional "cov_estimator": "sample" (default) | "ledoit_wolf" | "ewma" | "factor"
+        ("factor" is a PCA factor model for large universes, with "n_factors", default 10;
+        min_risk and max_sharpe then always go through the QP backend at O(N * n_factors),
+        and the correlation insights and heatmap are computed from the factors. HRP and
+        Kelly stay dense, so above 1000 assets they are skipped (input.covariance.skipped_strategies))
+    Optional "resample": {"samples": 1000, "seed": 0} replaces each strategy's weights by
+        their average over bootstrap resamples of the daily returns (Michaud resampling)
+    Optional "risk": {"methods": ["parametric", "historical", "monte_carlo"], "horizons": [1, 10],
+        "confidence": [0.95, 0.99], "simulations": 100000, "seed": 0} (or true for these defaults)
+        adds VaR/CVaR per portfolio: Gaussian, GARCH-filtered historical simulation, and
+        chunked Monte Carlo over correlated asset scenarios. Simulations x max horizon x
+        portfolios (historical) plus simulations x horizons x (tickers + portfolios) (Monte
+        Carlo) is capped at RISK_MAX_ELEMENTS
+    Optional "correlation_heatmap": true adds the cluster-ordered correlation matrix,
+        pooled to at most "heatmap_size" (default 50, max 200) rows and columns
+    Optional "constraints" (applied to min_risk and max_sharpe):
+        {"max_weight": 0.4, "bounds": {"TCS.NS": [0.1, 0.3]}, "group_caps": {"A": 0.6},
+         "current_weights": {"TCS.NS": 0.5, "INFY.NS": 0.5}, "max_turnover": 0.5}
+        With constraints (or the factor estimator) max_sharpe is the highest-Sharpe point of
+        the constrained mean-variance path, without the L2 diversification penalty of the
+        unconstrained solve, so even {"max_weight": 1} can give more concentrated weights
+    
+    curl -X POST http://localhost:3001/optimize -H "Content-Type: application/json" \
+         -d '{"tickers": ["TCS.NS", "INFY.NS", "RELIANCE.NS", "HDFCBANK.NS"], "constraints": {"max_weight": 0.4, "group_caps": {"A": 0.9}}}'
     """
     try:
         data = request.get_json()
         tickers = data.get('tickers')
-        capital = float(data.get('capital', 10000))
         
         if not tickers or not isinstance(tickers, list) or len(tickers) < 2:
             return jsonify({'error': 'Please provide at least 2 tickers in a list.'}), 400
@@ -270,179 +994,22 @@ def optimize_route():
         # Clean tickers
         tickers = [t.strip().upper() for t in tickers]
         
-        print(f"Fetching data for tickers: {tickers}")
-        
-        # Fetch data
-        # Using 'Close' (which is auto-adjusted) for returns
-        raw_data = yf.download(tickers, period="2y", progress=False, auto_adjust=True)
-        
-        print(f"Raw data shape: {raw_data.shape if hasattr(raw_data, 'shape') else 'N/A'}")
-        print(f"Raw data columns: {raw_data.columns.tolist() if hasattr(raw_data, 'columns') else 'N/A'}")
-        
-        # Handle different DataFrame structures based on number of tickers
-        if len(tickers) == 1:
-            # Single ticker: columns are just ['Close', 'High', 'Low', 'Open', 'Volume']
-            df = raw_data[['Close']].copy()
-            df.columns = tickers
-        elif 'Close' in raw_data.columns.get_level_values(0) if hasattr(raw_data.columns, 'get_level_values') else False:
-            # Multi-level columns when multiple tickers
-            df = raw_data['Close']
-        else:
-            # Fallback: assume single level or already processed
-            df = raw_data if isinstance(raw_data, pd.DataFrame) else pd.DataFrame(raw_data)
-        
-        print(f"Processed df shape: {df.shape}")
-        print(f"Processed df columns: {df.columns.tolist()}")
-        
+        df = fetch_close_prices(tickers)
+
         # Check data availability
         if df.empty:
             return jsonify({'error': 'No data found for tickers.'}), 404
-            
-        # Handle missing data (drop cols with too many NaNs, fill forward)
-        df.dropna(axis=1, how='all', inplace=True)
-        df = df.ffill()  # Forward fill (replaces deprecated fillna(method='ffill'))
-        df.dropna(inplace=True)  # Drop initial rows with NaNs
-        
+
         valid_tickers = df.columns.tolist()
         print(f"Valid tickers after cleaning: {valid_tickers}")
         
         if len(valid_tickers) < 2:
              return jsonify({'error': 'Not enough valid data for at least 2 tickers.'}), 400
         
-        # Calculate Returns
-        daily_returns = df.pct_change().dropna()
-        mean_returns = daily_returns.mean()
-        cov_matrix = daily_returns.cov()
-        
-        # --- Run Optimizations ---
-        
-        results = {}
-        kelly_fraction = 0.5 # Half Kelly
-        
-        # 1. Min Risk
-        w_min_risk = get_min_risk_weights(mean_returns.values, cov_matrix.values)
-        
-        # 2. Diversified Max Sharpe (with L2 regularization)
-        w_max_sharpe = get_max_sharpe_weights(mean_returns.values, cov_matrix.values, l2_reg=0.5)
-        
-        # 3. HRP
-        w_hrp = get_hrp_weights(daily_returns)
-        
-        # 4. Fractional Kelly
-        w_kelly = get_fractional_kelly_weights(daily_returns.values, fraction=kelly_fraction)
-        
-        # Format Results
-        
-        weight_vectors = {
-            'min_risk': w_min_risk,
-            'max_sharpe': w_max_sharpe,
-            'hrp': w_hrp,
-            'kelly': w_kelly
-        }
-        
-        for strategy, w_vec in weight_vectors.items():
-            # Clean weights (round and handle small negatives)
-            w_vec = np.maximum(w_vec, 0) # Enforce non-negative just in case
-            w_vec = w_vec / np.sum(w_vec) # Renormalize
-            
-            # Create weight dict
-            weights_dict = {ticker: float(weight) for ticker, weight in zip(valid_tickers, w_vec)}
-            
-            # Allocation
-            allocation_dict = {ticker: float(weight * capital) for ticker, weight in zip(valid_tickers, w_vec)}
-            
-            # Basic Metrics
-            ret, vol, sharpe = get_portfolio_metrics(w_vec, mean_returns.values, cov_matrix.values)
-            
-            # Advanced Metrics
-            div_ratio = get_diversification_ratio(w_vec, cov_matrix.values)
-            hhi = get_herfindahl_index(w_vec)
-            effective_n = get_effective_n(w_vec)
-            risk_contrib = get_risk_contribution(w_vec, cov_matrix.values)
-            max_dd = estimate_max_drawdown(daily_returns, w_vec)
-            var_95, cvar_95 = get_var_cvar(daily_returns, w_vec, confidence=0.95)
-            
-            # Risk contribution per asset
-            risk_contribution_dict = {ticker: float(rc) for ticker, rc in zip(valid_tickers, risk_contrib)}
-            
-            # Find dominant asset (highest weight)
-            sorted_weights = sorted(weights_dict.items(), key=lambda x: x[1], reverse=True)
-            top_holding = sorted_weights[0] if sorted_weights else ("N/A", 0)
-            
-            results[strategy] = {
-                "weights": weights_dict,
-                "allocation": allocation_dict,
-                "risk_contribution": risk_contribution_dict,
-                "metrics": {
-                    "return": float(ret),
-                    "volatility": float(vol),
-                    "sharpe": float(sharpe),
-                    "diversification_ratio": float(div_ratio),
-                    "concentration_hhi": float(hhi),
-                    "effective_assets": float(effective_n),
-                    "max_drawdown": float(max_dd),
-                    "var_95": float(var_95),
-                    "cvar_95": float(cvar_95)
-                },
-                "insights": {
-                    "top_holding": {"ticker": top_holding[0], "weight": float(top_holding[1])},
-                    "is_concentrated": bool(hhi > 0.5),
-                    "is_well_diversified": bool(div_ratio > 1.2 and effective_n > len(valid_tickers) * 0.6)
-                }
-            }
-            
-        # Individual Asset Metrics
-        individual_metrics = {}
-        for ticker in valid_tickers:
-            ann_ret = mean_returns[ticker] * 252
-            ann_vol = np.sqrt(cov_matrix.loc[ticker, ticker]) * np.sqrt(252)
-            sharpe = ann_ret / ann_vol if ann_vol > 0 else 0
-            individual_metrics[ticker] = {
-                "return": float(ann_ret),
-                "volatility": float(ann_vol),
-                "sharpe": float(sharpe)
-            }
-        
-        # Correlation matrix for insights
-        corr_matrix = daily_returns.corr()
-        correlation_insights = get_correlation_insights(corr_matrix, valid_tickers)
-        
-        # Find best/worst assets
-        sorted_by_return = sorted(individual_metrics.items(), key=lambda x: x[1]["return"], reverse=True)
-        sorted_by_sharpe = sorted(individual_metrics.items(), key=lambda x: x[1]["sharpe"], reverse=True)
-        sorted_by_volatility = sorted(individual_metrics.items(), key=lambda x: x[1]["volatility"])
-        
-        asset_insights = {
-            "best_return": {"ticker": sorted_by_return[0][0], "value": sorted_by_return[0][1]["return"]},
-            "worst_return": {"ticker": sorted_by_return[-1][0], "value": sorted_by_return[-1][1]["return"]},
-            "best_sharpe": {"ticker": sorted_by_sharpe[0][0], "value": sorted_by_sharpe[0][1]["sharpe"]},
-            "lowest_volatility": {"ticker": sorted_by_volatility[0][0], "value": sorted_by_volatility[0][1]["volatility"]},
-            "highest_volatility": {"ticker": sorted_by_volatility[-1][0], "value": sorted_by_volatility[-1][1]["volatility"]}
-        }
-        
-        # Strategy comparison insights
-        strategy_comparison = {
-            "best_return": max(results.items(), key=lambda x: x[1]["metrics"]["return"])[0],
-            "lowest_risk": min(results.items(), key=lambda x: x[1]["metrics"]["volatility"])[0],
-            "best_sharpe": max(results.items(), key=lambda x: x[1]["metrics"]["sharpe"])[0],
-            "most_diversified": max(results.items(), key=lambda x: x[1]["metrics"]["diversification_ratio"])[0],
-        }
-            
-        response = {
-            "input": {
-                "tickers": tickers,
-                "capital": capital,
-                "valid_tickers_found": valid_tickers,
-                "data_period": "2 years",
-                "trading_days_analyzed": int(len(daily_returns))
-            },
-            "assets": individual_metrics,
-            "asset_insights": asset_insights,
-            "correlation_insights": correlation_insights,
-            "portfolios": results,
-            "strategy_comparison": strategy_comparison,
-            "recommendations": generate_recommendations(results, asset_insights, correlation_insights)
-        }
+        try:
+            response = optimize_prices(df, tickers, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify(response)
 
@@ -496,4 +1063,630 @@ def generate_recommendations(results, asset_insights, correlation_insights):
             "description": f"Even the minimum risk portfolio has {min_risk.get('volatility', 0)*100:.1f}% volatility. Consider adding more stable assets."
         })
     
-    return recommendations
\ No newline at end of file
+    return recommendations
+
+
+# ----------------- Batch Optimization -----------------
+
+BATCH_MAX_BASKETS = 100
+# Risk-engine scenarios per basket: the simulations are paid once per basket
+BATCH_MAX_RISK_SCENARIOS = 100_000
+
+def optimize_basket(df, tickers, data, covariance=None):
+    """Worker task: /optimize report for one basket (its four solves run serially)"""
+    try:
+        return optimize_prices(df, tickers, data, parallel=False, covariance=covariance)
+    except ValueError as e:
+        return {'error': str(e)}
+
+@optimize_bp.route('/optimize/batch', methods=['POST'])
+def batch_route():
+    """
+    Optimize many ticker baskets in one request.
+    Input: JSON {"baskets": [{"name": "IT", "tickers": ["TCS.NS", "INFY.NS"]}, ...], "capital": 10000}
+    Each basket accepts the /optimize options (capital, cov_estimator, n_factors,
+    constraints, resample, risk, correlation_heatmap) and inherits the top-level ones it does
+    not set. Risk simulations are limited to 100000 per basket.
+    The union of tickers is downloaded once and each basket is cleaned on its own trading
+    days, so its report matches a standalone /optimize call. Covariances come from this
+    process's covariance cache (shared with /optimize, so repeated baskets are not
+    re-estimated); baskets are then evaluated across a process pool (OPTIMIZE_WORKERS
+    processes, default one per CPU).
+    Returns {"input": {...}, "results": [one /optimize report or {"error": ...} per basket]}
+    
+    curl -X POST http://localhost:3001/optimize/batch -H "Content-Type: application/json" \
+         -d '{"baskets": [{"name": "IT", "tickers": ["TCS.NS", "INFY.NS", "WIPRO.NS"]}, {"name": "Banks", "tickers": ["HDFCBANK.NS", "ICICIBANK.NS", "SBIN.NS"]}], "capital": 50000}'
+    """
+    try:
+        data = request.get_json()
+        baskets = data.get('baskets')
+        
+        if not baskets or not isinstance(baskets, list) or len(baskets) > BATCH_MAX_BASKETS:
+            return jsonify({'error': f'Please provide between 1 and {BATCH_MAX_BASKETS} baskets in a list.'}), 400
+        for basket in baskets:
+            tickers = basket.get('tickers') if isinstance(basket, dict) else None
+            if not tickers or not isinstance(tickers, list) or len(tickers) < 2:
+                return jsonify({'error': 'Every basket needs at least 2 tickers in a list.'}), 400
+        
+        shared = {k: v for k, v in data.items() if k != 'baskets'}
+        basket_tickers = [[t.strip().upper() for t in basket['tickers']] for basket in baskets]
+        union = list(dict.fromkeys(t for tickers in basket_tickers for t in tickers))
+        
+        # One download for the union, left unfilled: each basket fills and aligns
+        # its own columns, so other baskets' trading days do not leak in
+        prices = fetch_close_prices(union, align=False, fill=False)
+        if prices.empty:
+            return jsonify({'error': 'No data found for tickers.'}), 404
+        
+        pool = get_process_pool()
+        futures = []
+        for basket, tickers in zip(baskets, basket_tickers):
+            df = clean_basket_prices(prices, tickers)
+            if df.shape[1] < 2:
+                futures.append({'error': 'Not enough valid data for at least 2 tickers.'})
+                continue
+            options = {**shared, **basket}
+            if options.get('risk'):
+                try:
+                    if validate_risk_options(options['risk'])['simulations'] > BATCH_MAX_RISK_SCENARIOS:
+                        raise ValueError(f"Batch risk simulations are limited to {BATCH_MAX_RISK_SCENARIOS} per basket.")
+                except ValueError as e:
+                    futures.append({'error': str(e)})
+                    continue
+            # Estimated here, through the parent's covariance cache, and shipped to the worker
+            try:
+                covariance = get_covariance(df.pct_change().dropna(), options.get('cov_estimator', 'sample'),
+                                            n_factors=int(options.get('n_factors', DEFAULT_FACTORS)))
+            except (TypeError, ValueError) as e:
+                futures.append({'error': str(e)})
+                continue
+            futures.append(pool.submit(optimize_basket, df, tickers, options, covariance))
+        
+        results = []
+        for i, (basket, future) in enumerate(zip(baskets, futures)):
+            report = future if isinstance(future, dict) else future.result()
+            results.append({"name": basket.get('name', f"basket_{i + 1}"), **report})
+        
+        return jsonify({
+            "input": {
+                "baskets": len(baskets),
+                "union_tickers": union,
+                "valid_tickers_found": prices.columns.tolist(),
+                "workers": OPTIMIZE_WORKERS
+            },
+            "results": results
+        })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+# ----------------- Walk-Forward Backtest -----------------
+
+WALK_FORWARD_PERIODS = ("2y", "5y", "10y", "max")
+
+def simulate_rebalancing(returns, starts, weights):
+    """
+    Out-of-sample daily returns of periodically rebalanced portfolios.
+    weights[k] (methods x assets) is bought at the start of day starts[k]
+    and then drifts with prices until the next rebalance. All methods are
+    evaluated at once from one panel of asset growth since each segment
+    start. Returns (daily returns, days x methods) and (turnover
+    sum |w_k - drifted w_(k-1)| per rebalance, rebalances x methods; the
+    first row is the initial purchase).
+    """
+    R = np.asarray(returns, dtype=float)[starts[0]:]
+    offsets = np.asarray(starts) - starts[0]
+    n_methods = weights.shape[1]
+    
+    # Segment of each day, and each asset's growth since its segment began
+    segment = np.searchsorted(offsets, np.arange(len(R)), side='right') - 1
+    log_growth = np.cumsum(np.log1p(R), axis=0)
+    log_base = np.vstack([np.zeros(R.shape[1]), log_growth])[offsets]
+    growth = np.exp(log_growth - log_base[segment])
+    
+    # Value of each method's holdings relative to the segment start
+    value = np.einsum('tn,tmn->tm', growth, weights[segment])
+    previous = np.vstack([np.ones(n_methods), value[:-1]])
+    previous[offsets] = 1.0
+    portfolio_returns = value / previous - 1
+    
+    # Holdings drifted to the day before each rebalance
+    ends = offsets[1:] - 1
+    drifted = weights[:-1] * growth[ends][:, None, :] / value[ends][:, :, None]
+    drifted = np.concatenate([np.zeros((1,) + weights.shape[1:]), drifted])
+    turnover = np.abs(weights - drifted).sum(axis=2)
+    return portfolio_returns, turnover
+
+def get_walk_forward(returns, lookback=252, rebalance_every=21, methods=STRATEGIES, parallel=True):
+    """
+    Walk-forward backtest: at every rebalance date each method is re-fitted
+    on the trailing `lookback` days only, and its weights are held until the
+    next rebalance. The per-date solves run across the process pool.
+    Returns (rebalance positions, {method: (rebalances x assets) weights},
+    daily returns, turnover) with the last two as in simulate_rebalancing.
+    """
+    X = np.asarray(returns, dtype=float)
+    starts = np.arange(lookback, len(X), rebalance_every)
+    windows = starts[:, None] - lookback + np.arange(lookback)
+    weights = solve_samples_parallel(X, windows, methods=methods, parallel=parallel)
+    panel = np.stack([weights[name] for name in methods], axis=1)
+    portfolio_returns, turnover = simulate_rebalancing(X, starts, panel)
+    return starts, weights, portfolio_returns, turnover
+
+@optimize_bp.route('/optimize/walkforward', methods=['POST'])
+def walk_forward_route():
+    """
+    Out-of-sample rebalancing backtest of the optimizers.
+    Input: JSON {"tickers": ["AAPL", "MSFT"], "capital": 10000}
+    Optional "methods" (subset of min_risk, max_sharpe, hrp, kelly; default all),
+    "lookback" trading days of history per fit (default 252), "rebalance_every"
+    trading days (default 21), "period" of history: 2y | 5y (default) | 10y | max
+    Returns per method: equity_curve [{date, value}], out-of-sample metrics and turnover
+    (sum of |weight change| at each rebalance, after drift since the previous one)
+    
+    curl -X POST http://localhost:3001/optimize/walkforward -H "Content-Type: application/json" \
+         -d '{"tickers": ["TCS.NS", "INFY.NS", "RELIANCE.NS", "HDFCBANK.NS"], "methods": ["min_risk", "hrp"], "rebalance_every": 63}'
+    """
+    try:
+        data = request.get_json()
+        tickers = data.get('tickers')
+        capital = float(data.get('capital', 10000))
+        methods = data.get('methods') or list(STRATEGIES)
+        lookback = int(data.get('lookback', 252))
+        rebalance_every = int(data.get('rebalance_every', 21))
+        period = data.get('period', '5y')
+        
+        if not tickers or not isinstance(tickers, list) or len(tickers) < 2:
+            return jsonify({'error': 'Please provide at least 2 tickers in a list.'}), 400
+        if not isinstance(methods, list) or not set(methods) <= set(STRATEGIES):
+            return jsonify({'error': f'methods must be a list drawn from {list(STRATEGIES)}.'}), 400
+        if lookback < 20 or rebalance_every < 1:
+            return jsonify({'error': 'lookback must be at least 20 days and rebalance_every at least 1.'}), 400
+        if period not in WALK_FORWARD_PERIODS:
+            return jsonify({'error': f'period must be one of {list(WALK_FORWARD_PERIODS)}.'}), 400
+        
+        tickers = [t.strip().upper() for t in tickers]
+        methods = list(dict.fromkeys(methods))
+        df = fetch_close_prices(tickers, period=period)
+        if df.empty:
+            return jsonify({'error': 'No data found for tickers.'}), 404
+        valid_tickers = df.columns.tolist()
+        if len(valid_tickers) < 2:
+            return jsonify({'error': 'Not enough valid data for at least 2 tickers.'}), 400
+        
+        daily_returns = df.pct_change().dropna()
+        if len(daily_returns) <= lookback:
+            return jsonify({'error': f'Need more than {lookback} trading days of history; got {len(daily_returns)}.'}), 400
+        
+        starts, weights, portfolio_returns, turnover = get_walk_forward(
+            daily_returns.values, lookback, rebalance_every, methods)
+        
+        dates = daily_returns.index[starts[0]:].strftime('%Y-%m-%d').tolist()
+        rebalance_dates = daily_returns.index[starts].strftime('%Y-%m-%d').tolist()
+        equity = capital * np.cumprod(1 + portfolio_returns, axis=0)
+        drawdown = equity / np.maximum.accumulate(equity, axis=0) - 1
+        years = len(portfolio_returns) / 252
+        
+        results = {}
+        for m, method in enumerate(methods):
+            r = portfolio_returns[:, m]
+            ann_ret = r.mean() * 252
+            ann_vol = r.std() * np.sqrt(252)
+            results[method] = {
+                "equity_curve": [{"date": d, "value": float(v)} for d, v in zip(dates, equity[:, m])],
+                "metrics": {
+                    "total_return": float(equity[-1, m] / capital - 1),
+                    "return": float(ann_ret),
+                    "volatility": float(ann_vol),
+                    "sharpe": float(ann_ret / ann_vol) if ann_vol > 0 else 0.0,
+                    "max_drawdown": float(drawdown[:, m].min())
+                },
+                "turnover": {
+                    # The initial purchase is not a rebalance
+                    "average": float(turnover[1:, m].mean()) if len(starts) > 1 else 0.0,
+                    "annualized": float(turnover[1:, m].sum() / years),
+                    "by_rebalance": [{"date": d, "turnover": float(t)} for d, t in zip(rebalance_dates, turnover[:, m])]
+                },
+                "final_weights": {t: float(w) for t, w in zip(valid_tickers, weights[method][-1])}
+            }
+        
+        return jsonify({
+            "input": {
+                "tickers": tickers,
+                "valid_tickers_found": valid_tickers,
+                "capital": capital,
+                "methods": methods,
+                "lookback": lookback,
+                "rebalance_every": rebalance_every,
+                "period": period,
+                "out_of_sample_days": len(portfolio_returns),
+                "rebalances": len(starts)
+            },
+            "results": results
+        })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+ROLLING_WINDOWS = (21, 63, 252)
+
+def _series_dict(stats, column):
+    return {name: values[:, column] for name, values in stats.items()}
+
+@optimize_bp.route('/optimize/rolling', methods=['POST'])
+def rolling_route():
+    """
+    Rolling risk of a fixed-weight (daily rebalanced) portfolio and its constituents.
+    Input: JSON {"tickers": ["AAPL", "MSFT"]}
+    Optional "weights" {ticker: weight} (default equal; renormalized over the tickers found),
+    "benchmark" ticker (default ^NSEI), "windows" in trading days (default [21, 63, 252]),
+    "confidence" for VaR (default 0.95), "period" of history: 2y | 5y (default) | 10y | max
+    Returns per window, aligned with its "dates" (window ends): annualized volatility, beta and
+    correlation to the benchmark, Gaussian daily VaR and drawdown from the window's peak for
+    the portfolio and each asset, plus the portfolio's historical daily VaR
+    
+    curl -X POST http://localhost:3001/optimize/rolling -H "Content-Type: application/json" \
+         -d '{"tickers": ["TCS.NS", "INFY.NS", "RELIANCE.NS"], "weights": {"TCS.NS": 0.5, "INFY.NS": 0.3, "RELIANCE.NS": 0.2}, "windows": [21, 63]}'
+    """
+    try:
+        data = request.get_json()
+        tickers = data.get('tickers')
+        benchmark = str(data.get('benchmark', '^NSEI')).strip().upper()
+        windows = data.get('windows') or list(ROLLING_WINDOWS)
+        confidence = float(data.get('confidence', 0.95))
+        period = data.get('period', '5y')
+        
+        if not tickers or not isinstance(tickers, list):
+            return jsonify({'error': 'Please provide at least 1 ticker in a list.'}), 400
+        if not isinstance(windows, list) or not all(isinstance(w, int) and w >= 2 for w in windows):
+            return jsonify({'error': 'windows must be a list of integers of at least 2 trading days.'}), 400
+        if not 0.5 <= confidence < 1:
+            return jsonify({'error': 'confidence must be in [0.5, 1).'}), 400
+        if period not in WALK_FORWARD_PERIODS:
+            return jsonify({'error': f'period must be one of {list(WALK_FORWARD_PERIODS)}.'}), 400
+        
+        tickers = [t.strip().upper() for t in tickers]
+        windows = sorted(set(windows))
+        df = fetch_close_prices(list(dict.fromkeys(tickers + [benchmark])), period=period)
+        if benchmark not in df.columns:
+            return jsonify({'error': f'No data found for benchmark {benchmark}.'}), 404
+        valid_tickers = [t for t in dict.fromkeys(tickers) if t in df.columns]
+        if not valid_tickers:
+            return jsonify({'error': 'No data found for tickers.'}), 404
+        
+        weights = data.get('weights') or {}
+        w = np.array([float(weights.get(t, 0 if weights else 1)) for t in valid_tickers])
+        if w.sum() <= 0:
+            return jsonify({'error': 'weights must be positive for at least one ticker found.'}), 400
+        w = w / w.sum()
+        
+        daily_returns = df.pct_change().dropna()
+        if len(daily_returns) < windows[-1]:
+            return jsonify({'error': f'Need at least {windows[-1]} trading days of history; got {len(daily_returns)}.'}), 400
+        
+        asset_returns = daily_returns[valid_tickers].values
+        portfolio_returns = asset_returns @ w
+        # Portfolio in column 0, constituents after it: one pass per window
+        series = np.column_stack([portfolio_returns, asset_returns])
+        dates = daily_returns.index.strftime('%Y-%m-%d')
+        
+        results = {}
+        for window in windows:
+            stats = rolling_risk(series, daily_returns[benchmark].values, window, confidence)
+            results[str(window)] = {
+                "dates": dates[window - 1:].tolist(),
+                "portfolio": {
+                    **_series_dict(stats, 0),
+                    "historical_var": rolling_historical_var(portfolio_returns, window, confidence),
+                },
+                "assets": {t: _series_dict(stats, i + 1) for i, t in enumerate(valid_tickers)},
+            }
+        
+        # Series stay numpy arrays for encode_response (fast JSON, columnar or Arrow)
+        return encode_response({
+            "input": {
+                "tickers": tickers,
+                "valid_tickers_found": valid_tickers,
+                "weights": {t: float(x) for t, x in zip(valid_tickers, w)},
+                "benchmark": benchmark,
+                "windows": windows,
+                "confidence": confidence,
+                "period": period,
+                "trading_days_analyzed": int(len(daily_returns))
+            },
+            "windows": results
+        })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def get_portfolio_candidates(portfolios, tickers):
+    """
+    Weight vectors over `tickers` for request portfolios {name: {ticker: weight}}
+    (tickers not listed get 0). Raises ValueError for non-numeric or negative weights.
+    """
+    candidates = {}
+    for name, weights in portfolios.items():
+        if not isinstance(weights, dict):
+            raise ValueError(f"Portfolio {name!r} must be an object of {{ticker: weight}}.")
+        try:
+            weights = {t.upper(): float(w) for t, w in weights.items()}
+        except (TypeError, ValueError):
+            raise ValueError(f"Portfolio {name!r} has a non-numeric weight.")
+        if any(w < 0 for w in weights.values()):
+            raise ValueError(f"Portfolio {name!r} has a negative weight: portfolios are long-only.")
+        candidates[name] = np.array([weights.get(t, 0.0) for t in tickers])
+    return candidates
+
+@optimize_bp.route('/optimize/stress', methods=['POST'])
+def stress_route():
+    """
+    Replay historical crashes on portfolios.
+    Input: JSON {"tickers": ["AAPL", "MSFT"]}
+    Optional "portfolios" {name: {ticker: weight}} of non-negative weights (normalized to sum
+    to 1); by default the four /optimize strategies (fitted on the last 2 years) plus an
+    equal-weight portfolio
+    Optional "scenarios": a stored name or a list of stored names (gfc_2008, covid_2020,
+    rate_hikes_2022; default all) and/or custom windows {"name": "...", "start": "2015-08-10", "end": "2016-02-29"}
+    Returns per scenario: dates and, per portfolio, total return, max drawdown, trough date,
+    trading days from trough back to the pre-crash peak (null if not yet recovered) and
+    the daily drawdown path
+    
+    curl -X POST http://localhost:3001/optimize/stress -H "Content-Type: application/json" \
+         -d '{"tickers": ["TCS.NS", "INFY.NS", "RELIANCE.NS", "HDFCBANK.NS"], "scenarios": ["covid_2020", "rate_hikes_2022"]}'
+    """
+    try:
+        data = request.get_json()
+        tickers = data.get('tickers')
+        portfolios = data.get('portfolios')
+        
+        if not tickers or not isinstance(tickers, list) or len(tickers) < 2:
+            return jsonify({'error': 'Please provide at least 2 tickers in a list.'}), 400
+        if portfolios is not None and (not isinstance(portfolios, dict) or not portfolios):
+            return jsonify({'error': 'portfolios must be an object of {name: {ticker: weight}}.'}), 400
+        try:
+            scenarios = resolve_scenarios(data.get('scenarios'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        tickers = [t.strip().upper() for t in tickers]
+        # Full history, each ticker from its own first trading day
+        df = fetch_close_prices(tickers, period="max", align=False)
+        if df.empty:
+            return jsonify({'error': 'No data found for tickers.'}), 404
+        valid_tickers = df.columns.tolist()
+        daily_returns = df.pct_change(fill_method=None).iloc[1:]
+        
+        if portfolios is None:
+            recent = daily_returns.iloc[-504:].dropna()
+            if len(valid_tickers) < 2 or len(recent) < 2:
+                return jsonify({'error': 'Not enough valid data for at least 2 tickers.'}), 400
+            candidates = run_optimizers(recent, recent.cov().values)
+            candidates['equal_weight'] = np.ones(len(valid_tickers))
+        else:
+            try:
+                candidates = get_portfolio_candidates(portfolios, valid_tickers)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        names = list(candidates)
+        # Optimizer output can carry tiny negative weights; user weights were checked above
+        weight_matrix = np.array([np.maximum(candidates[n], 0) for n in names])
+        totals = weight_matrix.sum(axis=1, keepdims=True)
+        if (totals <= 0).any():
+            return jsonify({'error': 'Every portfolio needs a positive weight on a ticker with data.'}), 400
+        weight_matrix /= totals
+        
+        return jsonify({
+            "input": {
+                "tickers": tickers,
+                "valid_tickers_found": valid_tickers,
+                "history_start": daily_returns.index[0].strftime('%Y-%m-%d'),
+                "portfolios": {n: {t: float(w) for t, w in zip(valid_tickers, row)} for n, row in zip(names, weight_matrix)},
+                "available_scenarios": STRESS_SCENARIOS
+            },
+            "scenarios": stress_test(daily_returns, weight_matrix, names, scenarios)
+        })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+# ----------------- Projection -----------------
+
+PROJECT_MAX_DAYS = 2520
+PROJECT_MAX_PATHS = 1_000_000
+# Cap on portfolios x tickers x paths x days, the work of a projection
+PROJECT_MAX_ELEMENTS = 2**30
+
+@optimize_bp.route('/optimize/project', methods=['POST'])
+def project_route():
+    """
+    Project portfolios forward on correlated simulated asset paths.
+    Input: JSON {"tickers": ["AAPL", "MSFT"]}
+    Optional "portfolios" {name: {ticker: weight}} of non-negative weights; by default the
+    four /optimize strategies plus an equal-weight portfolio, all fitted on the same history
+    Optional "model": "gaussian" (multivariate normal daily log returns, default) or
+    "bootstrap" (circular blocks of historical days, "block_size" default 21)
+    Optional "days" (default 252), "paths" (default 10000), "rebalance_every" trading days
+    (default 21; 1 = constant weights, 0 = buy and hold), "initial_value" (default 10000),
+    "period" of history (default "2y"), "factors" (gaussian model from a PCA factor
+    covariance), "seed" (echoed back; random if omitted); portfolios x tickers x paths x days
+    is capped at PROJECT_MAX_ELEMENTS
+    Returns per portfolio: percentile fan chart of wealth per day, terminal wealth
+    distribution (summary, percentiles, histogram) and max drawdown distribution
+    
+    curl -X POST http://localhost:3001/optimize/project -H "Content-Type: application/json" \
+         -d '{"tickers": ["TCS.NS", "INFY.NS", "RELIANCE.NS", "HDFCBANK.NS"], "days": 504, "model": "bootstrap"}'
+    """
+    try:
+        data = request.get_json()
+        tickers = data.get('tickers')
+        portfolios = data.get('portfolios')
+        model_name = data.get('model', 'gaussian')
+        period = data.get('period', '2y')
+        
+        if not tickers or not isinstance(tickers, list) or len(tickers) < 2:
+            return jsonify({'error': 'Please provide at least 2 tickers in a list.'}), 400
+        if portfolios is not None and (not isinstance(portfolios, dict) or not portfolios):
+            return jsonify({'error': 'portfolios must be an object of {name: {ticker: weight}}.'}), 400
+        if model_name not in PROJECTION_MODELS:
+            return jsonify({'error': f'model must be one of {list(PROJECTION_MODELS)}.'}), 400
+        if period not in WALK_FORWARD_PERIODS:
+            return jsonify({'error': f'period must be one of {list(WALK_FORWARD_PERIODS)}.'}), 400
+        try:
+            n_days = int(data.get('days', 252))
+            n_paths = int(data.get('paths', 10000))
+            rebalance_every = int(data.get('rebalance_every', 21))
+            block_size = int(data.get('block_size', 21))
+            initial_value = float(data.get('initial_value', 10000))
+            n_factors = int(data['factors']) if data.get('factors') else None
+            seed = int(data['seed']) if data.get('seed') is not None else secrets.randbits(53)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'days, paths, rebalance_every, block_size, factors and seed must be integers.'}), 400
+        if not 1 <= n_days <= PROJECT_MAX_DAYS:
+            return jsonify({'error': f'days must be between 1 and {PROJECT_MAX_DAYS}.'}), 400
+        if not 100 <= n_paths <= PROJECT_MAX_PATHS:
+            return jsonify({'error': f'paths must be between 100 and {PROJECT_MAX_PATHS}.'}), 400
+        if rebalance_every < 0 or block_size < 1 or initial_value <= 0 or (n_factors is not None and n_factors < 1):
+            return jsonify({'error': 'rebalance_every must be >= 0, block_size and factors >= 1, initial_value > 0.'}), 400
+        
+        tickers = [t.strip().upper() for t in tickers]
+        df = fetch_close_prices(tickers, period=period)
+        if df.empty:
+            return jsonify({'error': 'No data found for tickers.'}), 404
+        valid_tickers = df.columns.tolist()
+        daily_returns = df.pct_change().dropna()
+        if len(valid_tickers) < 2 or len(daily_returns) < 2:
+            return jsonify({'error': 'Not enough valid data for at least 2 tickers.'}), 400
+        
+        if portfolios is None:
+            candidates = run_optimizers(daily_returns, daily_returns.cov().values)
+            candidates['equal_weight'] = np.ones(len(valid_tickers))
+        else:
+            try:
+                candidates = get_portfolio_candidates(portfolios, valid_tickers)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        names = list(candidates)
+        # Optimizer output can carry tiny negative weights; user weights were checked above
+        weight_matrix = np.array([np.maximum(candidates[n], 0) for n in names])
+        totals = weight_matrix.sum(axis=1, keepdims=True)
+        if (totals <= 0).any():
+            return jsonify({'error': 'Every portfolio needs a positive weight on a ticker with data.'}), 400
+        weight_matrix /= totals
+        if weight_matrix.size * n_paths * n_days > PROJECT_MAX_ELEMENTS:
+            return jsonify({'error': 'Projection too large: reduce paths, days, portfolios or tickers.'}), 400
+        
+        if model_name == 'bootstrap':
+            model = bootstrap_model(daily_returns.values, min(block_size, len(daily_returns)))
+        else:
+            log_returns = np.log1p(daily_returns.values)
+            log_cov = (FactorCovariance.fit(log_returns, n_factors) if n_factors
+                       else np.cov(log_returns, rowvar=False))
+            model = gaussian_model(log_returns.mean(axis=0), log_cov)
+        
+        parts = project_portfolios(model, weight_matrix, n_days, n_paths, rebalance_every, seed)
+        
+        return encode_response({
+            "input": {
+                "tickers": tickers,
+                "valid_tickers_found": valid_tickers,
+                "period": period,
+                "trading_days_analyzed": int(len(daily_returns)),
+                "model": model_name,
+                "block_size": model.get("block_size"),
+                "factors": n_factors,
+                "days": n_days,
+                "paths": n_paths,
+                "rebalance_every": rebalance_every,
+                "initial_value": initial_value,
+                "seed": seed,
+                "portfolios": {n: {t: float(w) for t, w in zip(valid_tickers, row)} for n, row in zip(names, weight_matrix)}
+            },
+            "projections": projection_report(parts, names, n_days, initial_value)
+        })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@optimize_bp.route('/optimize/frontier', methods=['POST'])
+def frontier_route():
+    """
+    Long-only efficient frontier.
+    Input: JSON {"tickers": ["AAPL", "MSFT", "GOOGL"], "points": 50, "include_weights": true,
+                 "cov_estimator": "sample"}
+    
+    curl -X POST http://localhost:3001/optimize/frontier -H "Content-Type: application/json" \
+         -d '{"tickers": ["AAPL", "MSFT", "GOOGL", "AMZN"], "points": 100}'
+    """
+    try:
+        data = request.get_json()
+        tickers = data.get('tickers')
+        n_points = max(2, min(int(data.get('points', 50)), 1000))
+        include_weights = bool(data.get('include_weights', True))
+        
+        if not tickers or not isinstance(tickers, list) or len(tickers) < 2:
+            return jsonify({'error': 'Please provide at least 2 tickers in a list.'}), 400
+        
+        tickers = [t.strip().upper() for t in tickers]
+        df = fetch_close_prices(tickers)
+        if df.empty:
+            return jsonify({'error': 'No data found for tickers.'}), 404
+        
+        valid_tickers = df.columns.tolist()
+        if len(valid_tickers) < 2:
+            return jsonify({'error': 'Not enough valid data for at least 2 tickers.'}), 400
+        
+        daily_returns = df.pct_change().dropna()
+        mean_returns = daily_returns.mean().values
+        try:
+            cov_estimator = data.get('cov_estimator', 'sample')
+            cov_matrix = get_covariance(daily_returns, cov_estimator)[0]
+            # The active-set tracer factorizes sub-blocks of C: densify a factor model
+            cov_matrix = cov_matrix.to_dense() if isinstance(cov_matrix, FactorCovariance) else cov_matrix.values
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        weights_matrix = get_efficient_frontier(mean_returns, cov_matrix, n_points)
+        rets, vols, sharpes = get_frontier_metrics(weights_matrix, mean_returns, cov_matrix)
+        
+        points = []
+        for i in range(n_points):
+            point = {
+                "return": float(rets[i]),
+                "volatility": float(vols[i]),
+                "sharpe": float(sharpes[i]),
+            }
+            if include_weights:
+                point["weights"] = {ticker: float(w) for ticker, w in zip(valid_tickers, weights_matrix[i])}
+            points.append(point)
+        
+        return jsonify({
+            "input": {
+                "tickers": tickers,
+                "valid_tickers_found": valid_tickers,
+                "points": n_points,
+                "data_period": "2 years",
+                "trading_days_analyzed": int(len(daily_returns)),
+                "cov_estimator": cov_estimator
+            },
+            "frontier": points,
+            "min_risk_index": int(np.argmin(vols)),
+            "max_sharpe_index": int(np.argmax(sharpes)),
+        })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
@@ -1,11 +1,341 @@
 from flask import Blueprint, request, jsonify, send_file
 import numpy as np
 import io
+import itertools
+import secrets
+import scipy.optimize as sco
+from scipy.stats import binom
+
+from app.encoding import encode_response
+from app.sketch import StepHistogram
+from app.workers import OPTIMIZE_WORKERS, get_process_pool
 # Optional: for image generation if we decide to add it later, we'd need matplotlib.
 # For now, we will return exhaustive JSON data.
 
 simulate_bp = Blueprint('simulate', __name__)
 
+# Paths are simulated in chunks of about this many equity values (8 MB of float64)
+SIM_CHUNK_ELEMENTS = 2**20
+# Simulations of at least this many equity values are split across the process pool
+SIM_PARALLEL_ELEMENTS = 2**24
+# Analytic mode only samples paths for drawdown statistics
+ANALYTIC_DRAWDOWN_SIMS = 2000
+PERCENTILES = [5, 25, 50, 75, 95]
+# Sweep mode limits: grid points, and grid points x paths x trades
+SWEEP_MAX_POINTS = 400
+SWEEP_MAX_ELEMENTS = 2**31
+DRAWDOWN_BINS = 1000
+# Trades mode: minimum sample of trade returns, and the largest Kelly fraction searched
+TRADES_MIN_COUNT = 5
+KELLY_MAX_LEVERAGE = 10.0
+
+
+def fixed_fraction_model(risk_pct, rr_ratio, win_rate):
+    """Per-trade log growth model: win log(1 + risk * rr) with probability win_rate, else log(1 - risk)"""
+    return {"kind": "fixed", "log_win": np.log1p(risk_pct * rr_ratio), "log_loss": np.log1p(-risk_pct),
+            "win_rate": win_rate}
+
+
+def trade_bootstrap_model(trade_returns, fraction, block_size=1):
+    """
+    Per-trade log growth model resampling empirical trade returns, with a
+    `fraction` of equity committed to each trade. block_size > 1 draws
+    circular blocks of consecutive trades, preserving winning and losing streaks.
+    """
+    return {"kind": "bootstrap", "log_growth": np.log1p(fraction * np.asarray(trade_returns, dtype=float)),
+            "block_size": block_size}
+
+
+def _draw_log_growth(rng, model, rows, n_trades):
+    if model["kind"] == "fixed":
+        # Outcomes -> log multipliers (win with probability win_rate)
+        wins = rng.random((rows, n_trades)) < model["win_rate"]
+        return np.where(wins, model["log_win"], model["log_loss"])
+    
+    growth = model["log_growth"]
+    block = model["block_size"]
+    if block == 1:
+        return growth[rng.integers(0, len(growth), size=(rows, n_trades))]
+    n_blocks = -(-n_trades // block)
+    starts = rng.integers(0, len(growth), size=(rows, n_blocks, 1))
+    idx = (starts + np.arange(block)) % len(growth)
+    return growth[idx.reshape(rows, n_blocks * block)[:, :n_trades]]
+
+
+def _log_growth_range(model, n_trades):
+    """Sketch range per trade: mean +/- 6 sd of the random walk, within its reachable range"""
+    steps = np.arange(n_trades + 1)
+    if model["kind"] == "fixed":
+        log_win, log_loss, p = model["log_win"], model["log_loss"], model["win_rate"]
+        drift = p * log_win + (1 - p) * log_loss
+        spread = 6 * np.sqrt(p * (1 - p) * steps) * (log_win - log_loss)
+        low, high = log_loss, log_win
+    else:
+        growth = model["log_growth"]
+        drift = growth.mean()
+        # Blocks of correlated trades widen the spread by up to sqrt(block_size)
+        spread = 6 * growth.std() * np.sqrt(model["block_size"] * steps)
+        low, high = growth.min(), growth.max()
+    return np.maximum(steps * drift - spread, steps * low), np.minimum(steps * drift + spread, steps * high)
+
+
+def simulate_chunks(seeds, sizes, start_cap, model, n_trades):
+    """
+    Consecutive chunks of trading paths under a per-trade log growth model,
+    chunk i drawing sizes[i] paths from its own SeedSequence seeds[i].
+    Returns the exact final log equity and max drawdown of every path, the
+    best and worst log-equity paths, and a StepHistogram of log equity per trade.
+    """
+    # Work in log equity: the multipliers become additive steps
+    log_start = np.log(start_cap)
+    lo, hi = _log_growth_range(model, n_trades)
+    sketch = StepHistogram(log_start + lo, log_start + hi)
+    
+    final_log_equities = np.empty(sum(sizes))
+    max_drawdowns = np.empty(sum(sizes))
+    best_case = worst_case = None
+    begin = 0
+    
+    for seed, rows in zip(seeds, sizes):
+        rng = np.random.default_rng(seed)
+        # 1. Per-trade log multipliers
+        growth = _draw_log_growth(rng, model, rows, n_trades)
+        log_equity = np.empty((rows, n_trades + 1))
+        log_equity[:, 0] = log_start
+        # 2. Equity curves: cumulative sum of log multipliers
+        np.cumsum(growth, axis=1, out=log_equity[:, 1:])
+        log_equity[:, 1:] += log_start
+        del growth
+        
+        sketch.add(log_equity)
+        finals = log_equity[:, -1]
+        final_log_equities[begin:begin + rows] = finals
+        # Max drawdown: deepest fall below the running maximum
+        falls = np.maximum.accumulate(log_equity, axis=1)
+        np.subtract(log_equity, falls, out=falls)
+        max_drawdowns[begin:begin + rows] = np.expm1(falls.min(axis=1))
+        del falls
+        
+        best, worst = finals.argmax(), finals.argmin()
+        if best_case is None or finals[best] > best_case[-1]:
+            best_case = log_equity[best].copy()
+        if worst_case is None or finals[worst] < worst_case[-1]:
+            worst_case = log_equity[worst].copy()
+        begin += rows
+    
+    return {
+        "final_log_equities": final_log_equities,
+        "max_drawdowns": max_drawdowns,
+        "sketch": sketch,
+        "best_case": best_case,
+        "worst_case": worst_case,
+    }
+
+
+def simulate_paths(n_sims, start_cap, model, n_trades, seed=None, parallel=True):
+    """
+    Trading paths under a per-trade log growth model, simulated in chunks of
+    paths so memory does not grow with n_sims. Every chunk has its own random
+    stream spawned from SeedSequence(seed), and chunk sizes only depend on
+    n_trades, so a given seed gives bit-identical results however the chunks
+    are spread over worker processes. Large runs use the shared process pool.
+    Returns the merged simulate_chunks results, as equities rather than
+    log equities.
+    """
+    seed_seq = np.random.SeedSequence(seed)
+    chunk = max(1, SIM_CHUNK_ELEMENTS // (n_trades + 1))
+    sizes = [min(chunk, n_sims - begin) for begin in range(0, n_sims, chunk)]
+    seeds = seed_seq.spawn(len(sizes))
+    
+    n_workers = min(OPTIMIZE_WORKERS, len(sizes))
+    if parallel and n_workers > 1 and n_sims * (n_trades + 1) >= SIM_PARALLEL_ELEMENTS:
+        groups = np.array_split(np.arange(len(sizes)), n_workers)
+        parts = list(get_process_pool().map(
+            simulate_chunks,
+            [[seeds[i] for i in group] for group in groups],
+            [[sizes[i] for i in group] for group in groups],
+            [start_cap] * n_workers, [model] * n_workers, [n_trades] * n_workers,
+        ))
+    else:
+        parts = [simulate_chunks(seeds, sizes, start_cap, model, n_trades)]
+    
+    # Merge in chunk order, so ties resolve exactly as in a single pass
+    result = parts[0]
+    for part in parts[1:]:
+        result["sketch"].merge(part["sketch"])
+        if part["best_case"][-1] > result["best_case"][-1]:
+            result["best_case"] = part["best_case"]
+        if part["worst_case"][-1] < result["worst_case"][-1]:
+            result["worst_case"] = part["worst_case"]
+    
+    return {
+        "final_equities": np.exp(np.concatenate([part["final_log_equities"] for part in parts])),
+        "max_drawdowns": np.concatenate([part["max_drawdowns"] for part in parts]),
+        "sketch": result["sketch"],
+        "best_case": np.exp(result["best_case"]),
+        "worst_case": np.exp(result["worst_case"]),
+    }
+
+
+def simulate_fixed_fraction(n_sims, start_cap, risk_pct, rr_ratio, win_rate, n_trades, seed=None, parallel=True):
+    """simulate_paths for the fixed-fractional model (constant win rate, risk and reward)"""
+    model = fixed_fraction_model(risk_pct, rr_ratio, win_rate)
+    return simulate_paths(n_sims, start_cap, model, n_trades, seed, parallel)
+
+
+def kelly_fraction(trade_returns, max_fraction=1.0):
+    """
+    Growth-optimal fraction of equity per trade for the empirical trade
+    returns: argmax of mean(log(1 + f * r)) over [0, max_fraction], kept
+    below the fraction at which the worst trade would wipe out the account.
+    """
+    r = np.asarray(trade_returns, dtype=float)
+    upper = max_fraction
+    if r.min() < 0:
+        upper = min(upper, 0.999 / -r.min())
+    result = sco.minimize_scalar(lambda f: -np.mean(np.log1p(f * r)), bounds=(0.0, upper), method='bounded')
+    return float(result.x)
+
+
+def sweep_fixed_fraction(n_sims, start_cap, risk_values, rr_values, win_values, n_trades, seed=None):
+    """
+    Fixed-fractional statistics over a grid of (win_rate, risk_per_trade,
+    risk_reward_ratio), all evaluated on one shared set of uniform draws
+    (common random numbers), drawn as antithetic pairs (u, 1 - u). Differences
+    between grid points then reflect the parameters rather than sampling noise.
+
+    For a given win rate, every (risk, reward) path is linear in the running
+    win count K_t: log equity = K_t * (log win - log loss) + t * log loss. So
+    K is computed once per win rate and all risk/reward combinations are
+    broadcast over it. Final equities depend on the final win count only, so
+    its histogram gives exact sample quantiles and profit probabilities.
+    """
+    combos = list(itertools.product(risk_values, rr_values))
+    risk = np.array([c[0] for c in combos])
+    reward = np.array([c[1] for c in combos])
+    log_win, log_loss = np.log1p(risk * reward), np.log1p(-risk)
+    step_gain = log_win - log_loss
+    steps = np.arange(1, n_trades + 1)
+    n_combos = len(combos)
+    
+    n_pairs = (n_sims + 1) // 2
+    chunk_pairs = max(1, SIM_CHUNK_ELEMENTS // (2 * n_trades * n_combos))
+    sizes = [min(chunk_pairs, n_pairs - begin) for begin in range(0, n_pairs, chunk_pairs)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    
+    win_counts = np.zeros((len(win_values), n_trades + 1), dtype=np.int64)
+    # Per (win rate, combo): sums of antithetic pair means of final equity, and of their squares
+    pair_sum = np.zeros((len(win_values), n_combos))
+    pair_sumsq = np.zeros((len(win_values), n_combos))
+    # Max drawdown histogram over [-1, 0], for its 5th percentile
+    drawdown_counts = np.zeros((len(win_values), n_combos, DRAWDOWN_BINS + 1), dtype=np.int64)
+    drawdown_sum = np.zeros((len(win_values), n_combos))
+    worst_drawdown = np.zeros((len(win_values), n_combos))
+    
+    for seed_i, pairs in zip(seeds, sizes):
+        u = np.random.default_rng(seed_i).random((pairs, n_trades))
+        u = np.vstack([u, 1 - u])
+        for w, win_rate in enumerate(win_values):
+            K = np.cumsum(u < win_rate, axis=1, dtype=np.int32)
+            finals_k = K[:, -1]
+            win_counts[w] += np.bincount(finals_k, minlength=n_trades + 1)
+            
+            finals = start_cap * np.exp(np.outer(finals_k, step_gain) + n_trades * log_loss)
+            pair_means = (finals[:pairs] + finals[pairs:]) / 2
+            pair_sum[w] += pair_means.sum(axis=0)
+            pair_sumsq[w] += (pair_means ** 2).sum(axis=0)
+            
+            # (combos x paths x trades) log equity relative to the start
+            log_equity = K[None] * step_gain[:, None, None] + steps * log_loss[:, None, None]
+            running_max = np.maximum(np.maximum.accumulate(log_equity, axis=2), 0)
+            max_dd = np.expm1((log_equity - running_max).min(axis=2))
+            del log_equity, running_max
+            bins = np.minimum(((max_dd + 1) * DRAWDOWN_BINS).astype(np.int64), DRAWDOWN_BINS)
+            for c in range(n_combos):
+                drawdown_counts[w, c] += np.bincount(bins[c], minlength=DRAWDOWN_BINS + 1)
+            drawdown_sum[w] += max_dd.sum(axis=1)
+            worst_drawdown[w] = np.minimum(worst_drawdown[w], max_dd.min(axis=1))
+    
+    n_paths = 2 * n_pairs
+    bin_centers = (np.arange(DRAWDOWN_BINS + 1) + 0.5) / DRAWDOWN_BINS - 1
+    wins = np.arange(n_trades + 1)
+    grid = []
+    for w, win_rate in enumerate(win_values):
+        cum = np.cumsum(win_counts[w])
+        # Exact sample quantiles of the final win count (lower order statistic)
+        k_q = {p: int(np.searchsorted(cum, p / 100 * n_paths)) for p in (5, 50, 95)}
+        for c, (risk_pct, rr_ratio) in enumerate(combos):
+            def final_equity(k):
+                return float(start_cap * np.exp(k * step_gain[c] + n_trades * log_loss[c]))
+            mean = pair_sum[w, c] / n_pairs
+            pair_var = max(pair_sumsq[w, c] / n_pairs - mean ** 2, 0)
+            dd_counts = drawdown_counts[w, c]
+            dd_p5 = bin_centers[np.searchsorted(np.cumsum(dd_counts), 0.05 * n_paths)]
+            grid.append({
+                "win_rate": win_rate,
+                "risk_per_trade": risk_pct,
+                "risk_reward_ratio": rr_ratio,
+                "mean_final_equity": float(mean),
+                "mean_final_equity_std_error": float(np.sqrt(pair_var / n_pairs)),
+                "median_final_equity": final_equity(k_q[50]),
+                "p5_final_equity": final_equity(k_q[5]),
+                "p95_final_equity": final_equity(k_q[95]),
+                "profit_probability": float(win_counts[w][wins * step_gain[c] + n_trades * log_loss[c] > 0].sum() / n_paths),
+                "mean_roi_pct": float((mean - start_cap) / start_cap * 100),
+                "mean_max_drawdown_pct": float(drawdown_sum[w, c] / n_paths * 100),
+                "p5_max_drawdown_pct": float(min(dd_p5, 0) * 100),
+                "worst_max_drawdown_pct": float(worst_drawdown[w, c] * 100),
+            })
+    return grid, n_paths
+
+
+def analytic_fixed_fraction(start_cap, risk_pct, rr_ratio, win_rate, n_trades, percentiles=PERCENTILES):
+    """
+    Exact results of the fixed-fractional model without sampling. Equity after
+    t trades with k wins is start * win^k * loss^(t - k), monotonic in k, and
+    k ~ Binomial(t, win_rate): every equity percentile is the equity at the
+    same percentile of the win count, and the final equity distribution is
+    the binomial one.
+    """
+    win_mult = 1 + risk_pct * rr_ratio
+    loss_mult = 1 - risk_pct
+    steps = np.arange(n_trades + 1)
+    
+    def equity(wins, trades):
+        return start_cap * np.exp(wins * np.log(win_mult) + (trades - wins) * np.log(loss_mult))
+    
+    curves = {f"p{p}": equity(binom.ppf(p / 100, steps, win_rate), steps) for p in percentiles}
+    
+    wins = np.arange(n_trades + 1)
+    probs = binom.pmf(wins, n_trades, win_rate)
+    finals = equity(wins, n_trades)
+    step_mean = win_rate * win_mult + (1 - win_rate) * loss_mult
+    step_second = win_rate * win_mult ** 2 + (1 - win_rate) * loss_mult ** 2
+    mean = start_cap * step_mean ** n_trades
+    # Var = E[X^2] - E[X]^2 = mean^2 * ((E[m^2] / E[m]^2)^n - 1), without the cancellation
+    variance = mean ** 2 * np.expm1(n_trades * np.log(step_second / step_mean ** 2))
+    # Profitable once k * log(win) + (n - k) * log(loss) > 0
+    breakeven = -n_trades * np.log(loss_mult) / (np.log(win_mult) - np.log(loss_mult))
+    reachable = probs > 0
+    
+    return {
+        "curves": curves,
+        "best_case": equity(steps, steps),
+        "worst_case": equity(0, steps),
+        "mean": mean,
+        "median": float(equity(binom.ppf(0.5, n_trades, win_rate), n_trades)),
+        "std": np.sqrt(max(variance, 0)),
+        "min": float(finals[reachable].min()),
+        "max": float(finals[reachable].max()),
+        "profit_probability": float(binom.sf(np.floor(breakeven), n_trades, win_rate)),
+        # Outcomes with non-negligible probability, for plotting the distribution
+        "distribution": [
+            {"wins": int(k), "final_equity": float(e), "probability": float(q)}
+            for k, e, q in zip(wins, finals, probs) if q > 1e-12
+        ],
+    }
+
+
 @simulate_bp.route('/simulate', methods=['POST'])
 def run_simulation():
     """
@@ -15,12 +345,39 @@ def run_simulation():
     - n_simulations (int): Number of simulations (100 - 100000). Default: 1000.
     - starting_capital (float): Initial portfolio value. Default: 10000.
     - risk_per_trade (float): Risk per trade as a percentage (e.g., 0.01 for 1%). Default: 0.01.
-    - risk_reward_ratio (float): Ratio of reward to risk (e.g., 2.0). Default: 1.5.
+    - risk_reward_ratio (float): Ratio of reward to risk, positive (e.g., 2.0). Default: 1.5.
     - win_rate (float): Probability of winning a trade (0.0 - 1.0). Default: 0.5.
     - num_trades (int): Number of trades per simulation. Default: 100.
+    - seed (int): Seed for reproducible results (drawn and echoed back if omitted).
+    - mode (str): "monte_carlo" (default), "analytic", "sweep" or "trades". Analytic mode computes the final
+      equity distribution, percentile curves and profit probability exactly from the
+      binomial win count (adding "final_distribution"); only the drawdown statistics
+      are sampled, from min(n_simulations, 2000) paths.
+      Sweep mode evaluates every combination of the lists in "sweep" (e.g.
+      {"risk_per_trade": [0.01, 0.02], "risk_reward_ratio": [1, 2, 3]}) on one shared set of
+      antithetic random draws and returns summary statistics per grid point under "grid".
+      Trades mode bootstraps sequences from "trade_returns" (per-trade returns as fractions,
+      e.g. ticker_results[].trade_returns from /backtest) instead of the win/loss model.
+      Optional "block_size" (default 1) resamples blocks of consecutive trades to keep streaks;
+      "sizing": {"rule": "fixed_fractional", "fraction": 1.0} commits a fixed fraction of equity
+      per trade, {"rule": "kelly", "kelly_fraction": 0.5, "max_fraction": 1.0} a multiple of the
+      growth-optimal fraction for these trades, capped.
     
     Returns:
     - JSON object containing statistical analysis and equity curve percentiles.
+      Send "Accept: application/vnd.columnar+json" (base64 float32 curves) or
+      "Accept: application/vnd.apache.arrow.stream" (Arrow IPC), or ?format=columnar|arrow,
+      for compact curves, and Accept-Encoding gzip/zstd to compress (see app.encoding).
+    
+    Paths are simulated in chunks, so memory does not grow with n_simulations: the largest
+    run (100000 x 5000 trades) peaks at about 45 MB above the idle process (per worker).
+    Large runs are split across worker processes; a seed gives the same result either way.
+    Statistics are exact; the percentile curves come from a per-trade histogram sketch.
+    
+    curl -X POST http://localhost:3001/simulate -H "Content-Type: application/json" \
+         -d '{"mode": "analytic", "win_rate": 0.45, "risk_reward_ratio": 2, "num_trades": 500}'
+    curl -X POST "http://localhost:3001/simulate?format=arrow" -H "Content-Type: application/json" \
+         -H "Accept-Encoding: zstd" -d '{"n_simulations": 100000, "num_trades": 5000}' -o simulate.arrows
     """
     try:
         data = request.get_json()
@@ -34,88 +391,158 @@ def run_simulation():
         rr_ratio = float(data.get('risk_reward_ratio', 1.5))
         win_rate = float(data.get('win_rate', 0.5))
         n_trades = int(data.get('num_trades', 100))
+        mode = data.get('mode', 'monte_carlo')
+        # Without a seed, draw one and report it, so any run can be reproduced (53 bits: exact in JSON)
+        seed = data.get('seed')
+        seed = secrets.randbits(53) if seed is None else int(seed)
 
         # Constraints
         n_sims = max(100, min(n_sims, 100000))
         n_trades = max(10, min(n_trades, 5000))
         
-        # Simulation Logic (Vectorized with NumPy)
-        # 1. Generate outcomes: 1 for Win, 0 for Loss
-        # Shape: (n_sims, n_trades)
-        outcomes = np.random.choice(
-            [1, 0], 
-            size=(n_sims, n_trades), 
-            p=[win_rate, 1 - win_rate]
-        )
-        
-        # 2. Calculate PnL multipliers
-        # If Win: balance * (1 + risk * rr)
-        # If Loss: balance * (1 - risk)
-        win_multiplier = 1 + (risk_pct * rr_ratio)
-        loss_multiplier = 1 - risk_pct
-        
-        # Map outcomes to multipliers
-        # where outcome is 1 -> win_multiplier, else -> loss_multiplier
-        multipliers = np.where(outcomes == 1, win_multiplier, loss_multiplier)
-        
-        # 3. Calculate Equity Curves
-        # Cumulative product along the trades axis
-        # Start with 1.0 representing the initial capital multiplier
-        # Prepend a column of 1s for the starting state
+        if not 0 < risk_pct < 1:
+            return jsonify({'error': 'risk_per_trade must be between 0 and 1.'}), 400
+        if start_cap <= 0 or not 0 <= win_rate <= 1:
+            return jsonify({'error': 'starting_capital must be positive and win_rate between 0 and 1.'}), 400
+        if not 0 < rr_ratio < np.inf:
+            return jsonify({'error': 'risk_reward_ratio must be a positive number.'}), 400
         
-        # efficient cumulative product
-        equity_curves = np.cumprod(multipliers, axis=1) * start_cap
+        if mode not in ('monte_carlo', 'analytic', 'sweep', 'trades'):
+            return jsonify({'error': 'mode must be "monte_carlo", "analytic", "sweep" or "trades".'}), 400
+        if seed < 0:
+            return jsonify({'error': 'seed must be a non-negative integer.'}), 400
         
-        # Add starting capital column (index 0)
-        start_col = np.full((n_sims, 1), start_cap)
-        equity_curves = np.hstack((start_col, equity_curves))
-        
-        # --- Analysis ---
+        trades = None
+        if mode == 'trades':
+            trade_returns = data.get('trade_returns')
+            sizing = data.get('sizing') or {}
+            if not isinstance(sizing, dict):
+                return jsonify({'error': 'sizing must be an object like {"rule": "kelly", "kelly_fraction": 0.5}.'}), 400
+            rule = sizing.get('rule', 'fixed_fractional')
+            if rule not in ('fixed_fractional', 'kelly'):
+                return jsonify({'error': 'sizing rule must be "fixed_fractional" or "kelly".'}), 400
+            if not isinstance(trade_returns, list) or len(trade_returns) < TRADES_MIN_COUNT:
+                return jsonify({'error': f'trade_returns must be a list of at least {TRADES_MIN_COUNT} trade returns.'}), 400
+            try:
+                trade_returns = np.array(trade_returns, dtype=float)
+                block_size = int(data.get('block_size', 1))
+                if rule == 'fixed_fractional':
+                    fraction = float(sizing.get('fraction', 1.0))
+                else:
+                    kelly_multiple = float(sizing.get('kelly_fraction', 0.5))
+                    max_fraction = float(sizing.get('max_fraction', 1.0))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'trade_returns, block_size and the sizing fractions must be numbers.'}), 400
+            if trade_returns.ndim != 1 or not np.isfinite(trade_returns).all() or trade_returns.min() <= -1:
+                return jsonify({'error': 'trade_returns must be finite fractions above -1 (e.g. -0.05 for a 5% loss).'}), 400
+            if not 1 <= block_size <= len(trade_returns):
+                return jsonify({'error': 'block_size must be between 1 and the number of trade returns.'}), 400
+            
+            if rule == 'kelly':
+                full_kelly = kelly_fraction(trade_returns, KELLY_MAX_LEVERAGE)
+                fraction = min(kelly_multiple * full_kelly, max_fraction)
+            if not 0 <= fraction < np.inf or fraction * trade_returns.min() <= -1:
+                return jsonify({'error': 'The position fraction must be non-negative and survive the worst trade.'}), 400
+            
+            trades = {
+                "count": len(trade_returns),
+                "block_size": block_size,
+                "sizing": {"rule": rule, "fraction": fraction, **({"full_kelly": full_kelly} if rule == 'kelly' else {})},
+            }
         
-        final_equities = equity_curves[:, -1]
+        if mode == 'sweep':
+            # Each swept parameter is a list; the others keep their single values
+            sweep = data.get('sweep') or {}
+            risk_values = [float(v) for v in sweep.get('risk_per_trade', [risk_pct])]
+            rr_values = [float(v) for v in sweep.get('risk_reward_ratio', [rr_ratio])]
+            win_values = [float(v) for v in sweep.get('win_rate', [win_rate])]
+            n_points = len(risk_values) * len(rr_values) * len(win_values)
+            if (not all(0 < v < 1 for v in risk_values) or not all(0 < v < np.inf for v in rr_values)
+                    or not all(0 <= v <= 1 for v in win_values)):
+                return jsonify({'error': 'Swept risk_per_trade must be in (0, 1), risk_reward_ratio positive and win_rate in [0, 1].'}), 400
+            if not 1 <= n_points <= SWEEP_MAX_POINTS:
+                return jsonify({'error': f'A sweep must have between 1 and {SWEEP_MAX_POINTS} grid points.'}), 400
+            if n_points * n_sims * n_trades > SWEEP_MAX_ELEMENTS:
+                return jsonify({'error': 'Sweep too large: reduce grid points, n_simulations or num_trades.'}), 400
+            
+            grid, n_paths = sweep_fixed_fraction(n_sims, start_cap, risk_values, rr_values, win_values, n_trades, seed)
+            return encode_response({
+                "input_parameters": {
+                    "n_simulations": n_paths,
+                    "starting_capital": start_cap,
+                    "num_trades": n_trades,
+                    "mode": mode,
+                    "seed": seed,
+                    "sweep": {"risk_per_trade": risk_values, "risk_reward_ratio": rr_values, "win_rate": win_values}
+                },
+                "grid": grid,
+                "note": "Every grid point is evaluated on the same antithetic pairs of random draws."
+            })
         
-        # 1. Summary Statistics
-        stats = {
-            "mean_final_equity": float(np.mean(final_equities)),
-            "median_final_equity": float(np.median(final_equities)),
-            "std_dev_equity": float(np.std(final_equities)),
-            "min_final_equity": float(np.min(final_equities)),
-            "max_final_equity": float(np.max(final_equities)),
-            "profit_probability": float(np.mean(final_equities > start_cap)),
-            "ruin_probability": float(np.mean(final_equities <= 0)), # Simple ruin check
-            # Return on Investment
-            "mean_roi_pct": float((np.mean(final_equities) - start_cap) / start_cap * 100),
-            "max_roi_pct": float((np.max(final_equities) - start_cap) / start_cap * 100),
-        }
+        if mode == 'analytic':
+            exact = analytic_fixed_fraction(start_cap, risk_pct, rr_ratio, win_rate, n_trades)
+            stats = {
+                "mean_final_equity": float(exact["mean"]),
+                "median_final_equity": exact["median"],
+                "std_dev_equity": float(exact["std"]),
+                "min_final_equity": exact["min"],
+                "max_final_equity": exact["max"],
+                "profit_probability": exact["profit_probability"],
+                "ruin_probability": 0.0, # Equity never reaches 0 with risk_per_trade < 1
+                "mean_roi_pct": float((exact["mean"] - start_cap) / start_cap * 100),
+                "max_roi_pct": float((exact["max"] - start_cap) / start_cap * 100),
+            }
+            time_series_data = dict(exact["curves"])
+            time_series_data["best_case"] = exact["best_case"]
+            time_series_data["worst_case"] = exact["worst_case"]
+            # Drawdowns depend on the order of wins and losses: estimate them from a small sample
+            drawdown_sims = min(n_sims, ANALYTIC_DRAWDOWN_SIMS)
+            max_drawdowns = simulate_fixed_fraction(
+                drawdown_sims, start_cap, risk_pct, rr_ratio, win_rate, n_trades, seed)["max_drawdowns"]
+        else:
+            if mode == 'trades':
+                model = trade_bootstrap_model(trade_returns, fraction, block_size)
+                result = simulate_paths(n_sims, start_cap, model, n_trades, seed)
+            else:
+                result = simulate_fixed_fraction(n_sims, start_cap, risk_pct, rr_ratio, win_rate, n_trades, seed)
+            final_equities = result["final_equities"]
+            max_drawdowns = result["max_drawdowns"]
+            
+            # --- Analysis ---
+            
+            # 1. Summary Statistics
+            stats = {
+                "mean_final_equity": float(np.mean(final_equities)),
+                "median_final_equity": float(np.median(final_equities)),
+                "std_dev_equity": float(np.std(final_equities)),
+                "min_final_equity": float(np.min(final_equities)),
+                "max_final_equity": float(np.max(final_equities)),
+                "profit_probability": float(np.mean(final_equities > start_cap)),
+                "ruin_probability": float(np.mean(final_equities <= 0)), # Simple ruin check
+                # Return on Investment
+                "mean_roi_pct": float((np.mean(final_equities) - start_cap) / start_cap * 100),
+                "max_roi_pct": float((np.max(final_equities) - start_cap) / start_cap * 100),
+            }
+            
+            # 2. Time Series Percentiles (for plotting)
+            # We don't want to send 100k lines. Send percentiles: 5th, 25th, 50th, 75th, 95th
+            # The sketch works in log equity; exp is monotonic, so percentiles map across
+            percentile_curves = np.exp(result["sketch"].percentiles(PERCENTILES))
+            
+            # Structure for response
+            time_series_data = {}
+            for i, p in enumerate(PERCENTILES):
+                time_series_data[f"p{p}"] = percentile_curves[i]
+                
+            # Add 'best' and 'worst' specific paths for reference
+            time_series_data["best_case"] = result["best_case"]
+            time_series_data["worst_case"] = result["worst_case"]
 
-        # 2. Drawdown Analysis
-        # Calculate running maximum for each simulation
-        running_max = np.maximum.accumulate(equity_curves, axis=1)
-        # Calculate drawdown percentage
-        drawdowns = (equity_curves - running_max) / running_max
-        # Max drawdown for each simulation (min value since drawdowns are negative)
-        max_drawdowns = np.min(drawdowns, axis=1)
-        
+        # 3. Drawdown Analysis
         stats["mean_max_drawdown_pct"] = float(np.mean(max_drawdowns) * 100)
         stats["worst_max_drawdown_pct"] = float(np.min(max_drawdowns) * 100) # The worst of the worst
         stats["median_max_drawdown_pct"] = float(np.median(max_drawdowns) * 100)
 
-        # 3. Time Series Percentiles (for plotting)
-        # We don't want to send 100k lines. Send percentiles: 5th, 25th, 50th, 75th, 95th
-        percentiles = [5, 25, 50, 75, 95]
-        percentile_curves = np.percentile(equity_curves, percentiles, axis=0)
-        
-        # Structure for response
-        time_series_data = {}
-        for i, p in enumerate(percentiles):
-            time_series_data[f"p{p}"] = percentile_curves[i].tolist()
-            
-        # Add 'best' and 'worst' specific paths for reference
-        best_idx = np.argmax(final_equities)
-        worst_idx = np.argmin(final_equities)
-        time_series_data["best_case"] = equity_curves[best_idx].tolist()
-        time_series_data["worst_case"] = equity_curves[worst_idx].tolist()
-
         response_payload = {
             "input_parameters": {
                 "n_simulations": n_sims,
@@ -123,14 +550,22 @@ def run_simulation():
                 "risk_per_trade_pct": risk_pct * 100,
                 "risk_reward_ratio": rr_ratio,
                 "win_rate": win_rate,
-                "num_trades": n_trades
+                "num_trades": n_trades,
+                "mode": mode,
+                "seed": seed
             },
             "statistics": stats,
             "equity_curve_percentiles": time_series_data,
             "note": "equity_curve_percentiles contains lists of equity values over trade count (0 to num_trades)."
         }
+        if mode == 'trades':
+            response_payload["input_parameters"]["trades"] = trades
+        if mode == 'analytic':
+            response_payload["final_distribution"] = exact["distribution"]
+            response_payload["drawdown_simulations"] = drawdown_sims
 
-        return jsonify(response_payload)
+        # The curves stay numpy arrays: encode_response serializes them in the negotiated format
+        return encode_response(response_payload)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
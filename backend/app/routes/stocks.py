@@ -1,7 +1,9 @@
 from flask import Blueprint, jsonify, request
-import yfinance as yf
 import pandas as pd
 
+from app import market_data
+from app.encoding import encode_response
+
 stocks_bp = Blueprint('stocks', __name__)
 
 @stocks_bp.route('/stock/<ticker>/info', methods=['GET'])
@@ -10,7 +12,7 @@ def get_stock_info(ticker):
     Get complete data (fundamentals) for a single stock.
     """
     try:
-        stock = yf.Ticker(ticker)
+        stock = market_data.ticker(ticker)
         info = stock.info
         return jsonify({'status': 'success', 'data': info})
     except Exception as e:
@@ -23,11 +25,15 @@ def get_stock_history(ticker):
     Query params:
     - period: 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max (default: max)
     - interval: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo (default: 1d)
+    - format: json (default), columnar or arrow; also negotiated from the Accept header
+      (see app.encoding). Responses are gzip/zstd-compressed per Accept-Encoding.
+    
+    curl "http://localhost:3001/stock/AAPL/history?period=max&format=columnar" -H "Accept-Encoding: gzip" -o history.json.gz
     """
     period = request.args.get('period', 'max')
     interval = request.args.get('interval', '1d')
     try:
-        stock = yf.Ticker(ticker)
+        stock = market_data.ticker(ticker)
         hist = stock.history(period=period, interval=interval)
         
         if hist.empty:
@@ -36,10 +42,8 @@ def get_stock_history(ticker):
         # Reset index to include Date/Datetime in the records
         hist.reset_index(inplace=True)
         
-        # Convert to dict
-        data = hist.to_dict(orient='records')
-        
-        return jsonify({'status': 'success', 'data': data})
+        # encode_response turns the frame into records, columns or an Arrow table
+        return encode_response({'status': 'success', 'data': hist})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -66,7 +70,7 @@ def get_multiple_stocks_history():
         # Fetch each ticker individually to get currency info
         for ticker in ticker_list:
             try:
-                stock = yf.Ticker(ticker)
+                stock = market_data.ticker(ticker)
                 hist = stock.history(period=period, interval=interval)
                 
                 if hist.empty:
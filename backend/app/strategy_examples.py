@@ -0,0 +1,350 @@
+"""
+Local few-shot example bank for strategy generation.
+
+Each example is embedded once with a hashed bag-of-words vector (unigrams
+and bigrams of its title, tags and code identifiers), so retrieval needs
+no network call. select_examples() returns the top-k examples most similar
+to the user's query that fit in a token budget.
+"""
+
+import re
+import zlib
+import numpy as np
+from typing import Dict, List
+
+EMBEDDING_DIM = 1024
+DEFAULT_TOP_K = 2
+DEFAULT_TOKEN_BUDGET = 900  # Approximate tokens for the examples section
+
+EXAMPLES_HEADER = """=== BACKTESTING.PY STRATEGY EXAMPLES ===
+IMPORTANT: self.buy() ONLY accepts these parameters: sl (stop-loss price), tp (take-profit price), size (position size)
+DO NOT use trail_sl, trailing_stop, or any other parameters - they will cause errors!
+"""
+
+EXAMPLES: List[Dict[str, str]] = [
+    {
+        "title": "MACD Strategy with Signal Line Crossover",
+        "tags": "macd signal line crossover momentum trend ema 50 trend filter",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def ema(arr, n):
+            return pd.Series(arr).ewm(span=n).mean().values
+        
+        def macd_line(close):
+            ema12 = pd.Series(close).ewm(span=12).mean()
+            ema26 = pd.Series(close).ewm(span=26).mean()
+            return (ema12 - ema26).values
+        
+        def signal_line(close):
+            macd = pd.Series(close).ewm(span=12).mean() - pd.Series(close).ewm(span=26).mean()
+            return macd.ewm(span=9).mean().values
+        
+        self.ema50 = self.I(ema, self.data.Close, 50)
+        self.macd = self.I(macd_line, self.data.Close)
+        self.signal = self.I(signal_line, self.data.Close)
+    
+    def next(self):
+        if len(self.data.Close) < 50:
+            return
+        
+        price = self.data.Close[-1]
+        
+        if not self.position:
+            macd_cross_up = self.macd[-1] > self.signal[-1] and self.macd[-2] <= self.signal[-2]
+            above_ema = price > self.ema50[-1]
+            if macd_cross_up and above_ema:
+                self.buy(tp=price*1.05, sl=price*0.98)  # Only sl and tp allowed
+        elif self.position:
+            macd_cross_down = self.macd[-1] < self.signal[-1] and self.macd[-2] >= self.signal[-2]
+            if macd_cross_down:
+                self.position.close()""",
+    },
+    {
+        "title": "RSI Mean Reversion Strategy",
+        "tags": "rsi oversold overbought mean reversion pullback sma 200 long-term trend filter",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def rsi(arr, period=14):
+            delta = pd.Series(arr).diff()
+            gain = delta.where(delta > 0, 0).rolling(period).mean()
+            loss = -delta.where(delta < 0, 0).rolling(period).mean()
+            rs = gain / loss
+            return (100 - 100/(1 + rs)).fillna(50).values
+        
+        def sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().bfill().values
+        
+        self.rsi = self.I(rsi, self.data.Close, 14)
+        self.sma200 = self.I(sma, self.data.Close, 200)
+    
+    def next(self):
+        if len(self.data.Close) < 200:
+            return
+        
+        price = self.data.Close[-1]
+        
+        if not self.position:
+            if self.rsi[-1] < 30 and price > self.sma200[-1]:
+                self.buy(tp=price*1.08, sl=price*0.96)  # Only sl and tp allowed
+        elif self.position:
+            if self.rsi[-1] > 70:
+                self.position.close()""",
+    },
+    {
+        "title": "Bollinger Bands Breakout",
+        "tags": "bollinger bands lower band upper band volatility mean reversion bounce standard deviation",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().values
+        
+        def bb_upper(arr, n=20, std_dev=2):
+            s = pd.Series(arr)
+            return (s.rolling(n).mean() + std_dev * s.rolling(n).std()).values
+        
+        def bb_lower(arr, n=20, std_dev=2):
+            s = pd.Series(arr)
+            return (s.rolling(n).mean() - std_dev * s.rolling(n).std()).values
+        
+        self.sma20 = self.I(sma, self.data.Close, 20)
+        self.bb_upper = self.I(bb_upper, self.data.Close, 20, 2)
+        self.bb_lower = self.I(bb_lower, self.data.Close, 20, 2)
+    
+    def next(self):
+        if len(self.data.Close) < 30:
+            return
+        
+        price = self.data.Close[-1]
+        prev_price = self.data.Close[-2]
+        
+        if not self.position:
+            if prev_price <= self.bb_lower[-2] and price > self.bb_lower[-1]:
+                self.buy(sl=price*0.97, tp=price*1.06)  # Only sl and tp allowed
+        elif self.position:
+            if price >= self.bb_upper[-1]:
+                self.position.close()""",
+    },
+    {
+        "title": "EMA Crossover with Volume Confirmation",
+        "tags": "ema crossover golden cross moving average fast slow volume confirmation spike",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def ema(arr, n):
+            return pd.Series(arr).ewm(span=n).mean().values
+        
+        def vol_sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().values
+        
+        self.ema9 = self.I(ema, self.data.Close, 9)
+        self.ema21 = self.I(ema, self.data.Close, 21)
+        self.vol_avg = self.I(vol_sma, self.data.Volume, 20)
+    
+    def next(self):
+        if len(self.data.Close) < 30:
+            return
+        
+        price = self.data.Close[-1]
+        volume = self.data.Volume[-1]
+        
+        if not self.position:
+            ema_cross_up = self.ema9[-1] > self.ema21[-1] and self.ema9[-2] <= self.ema21[-2]
+            high_volume = volume > self.vol_avg[-1] * 1.5
+            if ema_cross_up and high_volume:
+                self.buy(tp=price*1.06, sl=price*0.97)  # Only sl and tp allowed
+        elif self.position:
+            ema_cross_down = self.ema9[-1] < self.ema21[-1] and self.ema9[-2] >= self.ema21[-2]
+            if ema_cross_down:
+                self.position.close()""",
+    },
+    {
+        "title": "ATR-Based Volatility Breakout",
+        "tags": "atr average true range volatility breakout dynamic stop loss take profit sma 20",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def atr(high, low, close, period=14):
+            h = pd.Series(high)
+            l = pd.Series(low)
+            c = pd.Series(close)
+            tr1 = h - l
+            tr2 = abs(h - c.shift())
+            tr3 = abs(l - c.shift())
+            tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+            return tr.rolling(period).mean().values
+        
+        def sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().values
+        
+        self.sma20 = self.I(sma, self.data.Close, 20)
+        self.atr = self.I(atr, self.data.High, self.data.Low, self.data.Close, 14)
+    
+    def next(self):
+        if len(self.data.Close) < 50:
+            return
+        
+        price = self.data.Close[-1]
+        
+        if not self.position:
+            breakout = price > self.sma20[-1] and self.data.Close[-2] <= self.sma20[-2]
+            if breakout:
+                atr_val = self.atr[-1]
+                # Use ATR for dynamic sl/tp - ONLY sl and tp parameters allowed
+                self.buy(tp=price + 2*atr_val, sl=price - 1.5*atr_val)
+        elif self.position:
+            if price < self.sma20[-1]:
+                self.position.close()""",
+    },
+    {
+        "title": "Stochastic Oscillator Oversold Cross",
+        "tags": "stochastic oscillator %k %d oversold overbought cross momentum reversal",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def stoch_k(high, low, close, n=14):
+            h = pd.Series(high).rolling(n).max()
+            l = pd.Series(low).rolling(n).min()
+            return (100 * (pd.Series(close) - l) / (h - l)).fillna(50).values
+
+        def stoch_d(high, low, close, n=14, d=3):
+            h = pd.Series(high).rolling(n).max()
+            l = pd.Series(low).rolling(n).min()
+            k = 100 * (pd.Series(close) - l) / (h - l)
+            return k.rolling(d).mean().fillna(50).values
+
+        self.k = self.I(stoch_k, self.data.High, self.data.Low, self.data.Close, 14)
+        self.d = self.I(stoch_d, self.data.High, self.data.Low, self.data.Close, 14, 3)
+
+    def next(self):
+        if len(self.data.Close) < 20:
+            return
+
+        price = self.data.Close[-1]
+
+        if not self.position:
+            cross_up = self.k[-1] > self.d[-1] and self.k[-2] <= self.d[-2]
+            if cross_up and self.k[-1] < 20:
+                self.buy(sl=price*0.97, tp=price*1.06)  # Only sl and tp allowed
+        elif self.position:
+            if self.k[-1] > 80:
+                self.position.close()""",
+    },
+    {
+        "title": "Donchian Channel Breakout",
+        "tags": "donchian channel breakout new high 20 day high low turtle trend following",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def upper(high, n=20):
+            return pd.Series(high).rolling(n).max().shift(1).bfill().values
+
+        def lower(low, n=10):
+            return pd.Series(low).rolling(n).min().shift(1).bfill().values
+
+        self.upper = self.I(upper, self.data.High, 20)
+        self.lower = self.I(lower, self.data.Low, 10)
+
+    def next(self):
+        if len(self.data.Close) < 25:
+            return
+
+        price = self.data.Close[-1]
+
+        if not self.position:
+            if price > self.upper[-1]:
+                self.buy(sl=price*0.95, tp=price*1.10)  # Only sl and tp allowed
+        elif self.position:
+            if price < self.lower[-1]:
+                self.position.close()""",
+    },
+    {
+        "title": "Rate-of-Change Momentum with Trend Filter",
+        "tags": "momentum rate of change roc price change percent trend sma 100",
+        "code": """class UserStrategy(Strategy):
+    def init(self):
+        def roc(arr, n=20):
+            s = pd.Series(arr)
+            return (s.pct_change(n) * 100).fillna(0).values
+
+        def sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().bfill().values
+
+        self.roc = self.I(roc, self.data.Close, 20)
+        self.sma100 = self.I(sma, self.data.Close, 100)
+
+    def next(self):
+        if len(self.data.Close) < 100:
+            return
+
+        price = self.data.Close[-1]
+
+        if not self.position:
+            if self.roc[-1] > 5 and self.roc[-2] <= 5 and price > self.sma100[-1]:
+                self.buy(sl=price*0.96, tp=price*1.08)  # Only sl and tp allowed
+        elif self.position:
+            if self.roc[-1] < 0:
+                self.position.close()""",
+    },
+]
+
+
+# ----------------- Embeddings -----------------
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def _tokens(text: str) -> List[str]:
+    words = re.findall(r"[a-z]+|\d+", text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def embed(text: str) -> np.ndarray:
+    """L2-normalized hashed bag-of-words vector"""
+    vec = np.zeros(EMBEDDING_DIM)
+    for token in _tokens(text):
+        vec[zlib.crc32(token.encode()) % EMBEDDING_DIM] += 1.0
+    vec = np.log1p(vec)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+def _example_text(example: Dict[str, str]) -> str:
+    # Title and tags carry the intent; weight them above the code identifiers
+    return " ".join([example["title"], example["tags"]] * 3 + [example["code"]])
+
+
+_EMBEDDINGS = np.vstack([embed(_example_text(e)) for e in EXAMPLES])
+
+
+# ----------------- Retrieval -----------------
+
+
+def select_examples(
+    query: str, k: int = DEFAULT_TOP_K, token_budget: int = DEFAULT_TOKEN_BUDGET
+) -> List[Dict[str, str]]:
+    """
+    Top-k examples by cosine similarity to the query, skipping any that
+    would overflow the token budget. The best match is always included.
+    """
+    scores = _EMBEDDINGS @ embed(query)
+    selected = []
+    used = 0
+    for idx in np.argsort(-scores, kind="stable"):
+        example = EXAMPLES[idx]
+        cost = estimate_tokens(example["code"])
+        if selected and used + cost > token_budget:
+            continue
+        selected.append(example)
+        used += cost
+        if len(selected) >= k:
+            break
+    return selected
+
+
+def build_few_shot_examples(
+    query: str, k: int = DEFAULT_TOP_K, token_budget: int = DEFAULT_TOKEN_BUDGET
+) -> str:
+    """Format the retrieved examples as the prompt's reference section"""
+    sections = [EXAMPLES_HEADER]
+    for i, example in enumerate(select_examples(query, k, token_budget), 1):
+        sections.append(f"EXAMPLE {i}: {example['title']}\n{example['code']}\n")
+    return "\n".join(sections)
@@ -0,0 +1,132 @@
+"""
+Historical stress scenarios: replay named crash windows on many portfolios.
+
+A scenario is a named date window (STRESS_SCENARIOS, or custom windows per
+request). Replaying it multiplies the stored daily return panel from the
+window start onwards by the (K portfolios x N assets) weight matrix in one
+matrix product. Every path statistic is then computed column-wise for all K
+portfolios together: drawdown path, worst drawdown and its date, return over
+the window, and the trading days the portfolio took after its trough to get
+back to its pre-crash peak. The window only bounds the drawdown statistics;
+the recovery search runs to the end of the stored history.
+
+Portfolios hold constant weights (rebalanced daily), like the rest of the
+optimize reports.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+STRESS_SCENARIOS = {
+    "gfc_2008": {"name": "Global financial crisis", "start": "2008-09-01", "end": "2009-03-31"},
+    "covid_2020": {"name": "COVID-19 crash", "start": "2020-02-19", "end": "2020-03-23"},
+    "rate_hikes_2022": {"name": "2022 rate-hike selloff", "start": "2022-01-03", "end": "2022-10-31"},
+}
+
+
+def resolve_scenarios(requested=None) -> Dict[str, Dict]:
+    """
+    Scenario windows for a request: a list of STRESS_SCENARIOS keys and/or
+    custom {"name", "start", "end"} objects (all stored scenarios if None);
+    a single key or object is accepted too. Raises ValueError for unknown
+    keys or malformed windows.
+    """
+    if requested is None:
+        return dict(STRESS_SCENARIOS)
+    if isinstance(requested, (str, dict)):
+        requested = [requested]
+    if not isinstance(requested, list) or not requested:
+        raise ValueError("scenarios must be a non-empty list of stored names or custom windows.")
+    scenarios = {}
+    for item in requested:
+        if isinstance(item, str):
+            if item not in STRESS_SCENARIOS:
+                raise ValueError(f"Unknown stress scenario: {item}. Choose from {sorted(STRESS_SCENARIOS)}")
+            scenarios[item] = STRESS_SCENARIOS[item]
+        elif isinstance(item, dict) and item.get("start") and item.get("end"):
+            start, end = pd.Timestamp(item["start"]), pd.Timestamp(item["end"])
+            if end <= start:
+                raise ValueError(f"Stress scenario {item.get('name')!r} ends before it starts.")
+            name = item.get("name") or f"{start.date()} to {end.date()}"
+            scenarios[name] = {"name": name, "start": str(start.date()), "end": str(end.date())}
+        else:
+            raise ValueError('Stress scenarios must be stored names or {"name", "start", "end"} objects.')
+    return scenarios
+
+
+def replay_scenario(returns: pd.DataFrame, weights: np.ndarray, start, end) -> Optional[Dict]:
+    """
+    Replay one window of the (dates x assets) daily returns, which may be
+    NaN before an asset started trading, on every row of the weight matrix.
+    Returns None when the panel has no data in the window, and the
+    uncovered assets under "missing" when some of them have none.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    tail = returns.loc[returns.index >= start]
+    in_window = int((tail.index <= end).sum())
+    if in_window < 2:
+        return None
+    missing = tail.columns[tail.iloc[:in_window].isna().any()].tolist()
+    if missing:
+        return {"missing": missing}
+
+    W = np.atleast_2d(weights)
+    # One product for every portfolio; later gaps (delistings) count as flat days
+    paths = np.nan_to_num(tail.values) @ W.T
+    wealth = np.vstack([np.ones(len(W)), np.cumprod(1 + paths, axis=0)])
+    peak = np.maximum.accumulate(wealth, axis=0)
+    drawdown = wealth / peak - 1
+
+    window_drawdown = drawdown[1:in_window + 1]
+    trough = window_drawdown.argmin(axis=0) + 1
+    columns = np.arange(len(W))
+    trough_peak = peak[trough, columns]
+    # First day from the trough on back at the pre-trough peak (argmax of a boolean);
+    # a portfolio that never fell below its starting value "recovers" on day 0
+    after = np.arange(len(wealth))[:, None] >= trough
+    recovered = (wealth >= trough_peak) & after
+    recovery = np.where(recovered.any(axis=0), recovered.argmax(axis=0), -1)
+
+    dates = tail.index
+    return {
+        "dates": dates[:in_window],
+        "total_return": wealth[in_window] - 1,
+        "max_drawdown": window_drawdown.min(axis=0),
+        "trough_dates": dates[trough - 1],
+        "recovery_days": np.where(recovery >= 0, recovery - trough, -1),
+        "recovery_dates": [dates[r - 1] if r >= 0 else None for r in recovery],
+        "drawdown": window_drawdown,
+    }
+
+
+def stress_test(returns: pd.DataFrame, weights: np.ndarray, names, scenarios: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    JSON-ready replay of every scenario on the named portfolios (rows of
+    weights). Scenarios outside the stored history, or predating some
+    assets, are reported with an "error" instead of results.
+    """
+    report = {}
+    for key, scenario in scenarios.items():
+        entry = {"name": scenario["name"], "start": scenario["start"], "end": scenario["end"]}
+        replay = replay_scenario(returns, weights, scenario["start"], scenario["end"])
+        if replay is None:
+            entry["error"] = "No price history in this window."
+        elif "missing" in replay:
+            entry["error"] = f"No price history in this window for: {', '.join(replay['missing'])}"
+        else:
+            entry["dates"] = replay["dates"].strftime('%Y-%m-%d').tolist()
+            entry["portfolios"] = {
+                name: {
+                    "total_return": float(replay["total_return"][k]),
+                    "max_drawdown": float(replay["max_drawdown"][k]),
+                    "trough_date": replay["trough_dates"][k].strftime('%Y-%m-%d'),
+                    "recovery_days": int(replay["recovery_days"][k]) if replay["recovery_days"][k] >= 0 else None,
+                    "recovery_date": (replay["recovery_dates"][k].strftime('%Y-%m-%d')
+                                      if replay["recovery_dates"][k] is not None else None),
+                    "drawdown": replay["drawdown"][:, k].tolist(),
+                }
+                for k, name in enumerate(names)
+            }
+        report[key] = entry
+    return report
@@ -0,0 +1,291 @@
+"""
+Synthetic market data for offline load testing and benchmarks.
+
+SyntheticMarket generates correlated multi-ticker OHLCV panels from a seed.
+Every ticker's series lives on one fixed business-day calendar ending at
+SYNTHETIC_END_DATE, and requests slice that calendar, so a ticker's prices
+are identical whatever basket, period or date range it is requested with.
+
+Return models:
+- "gbm": geometric Brownian motion with K common factors plus idiosyncratic noise
+- "jump": GBM plus Merton jumps (idiosyncratic and market-wide)
+- "bootstrap": block bootstrap of a stored price history (SYNTHETIC_HISTORY,
+  a CSV or parquet file with a date index and one price column per ticker).
+  Blocks are drawn jointly across tickers, preserving cross-correlation.
+
+Configuration (environment):
+- SYNTHETIC_MODEL: gbm | jump | bootstrap (default gbm)
+- SYNTHETIC_SEED: integer seed (default 0)
+- SYNTHETIC_END_DATE: last calendar date (default 2024-12-31)
+- SYNTHETIC_HISTORY: path to stored history for the bootstrap model
+"""
+
+import os
+import zlib
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, Optional, Sequence, Union
+
+TRADING_DAYS = 252
+MAX_BARS = 30 * TRADING_DAYS  # Calendar length: ~30 years of business days
+
+PERIOD_BARS = {
+    "1d": 1,
+    "5d": 5,
+    "1mo": 21,
+    "3mo": 63,
+    "6mo": 126,
+    "1y": 252,
+    "2y": 504,
+    "5y": 1260,
+    "10y": 2520,
+    "max": MAX_BARS,
+}
+
+
+def period_to_bars(period: str, calendar: pd.DatetimeIndex) -> int:
+    """Number of trailing bars a yfinance-style period covers"""
+    if period == "ytd":
+        year_start = pd.Timestamp(calendar[-1].year, 1, 1)
+        return int((calendar >= year_start).sum())
+    if period not in PERIOD_BARS:
+        raise ValueError(f"Unsupported period: {period}")
+    return min(PERIOD_BARS[period], len(calendar))
+
+
+def _ticker_seed(ticker: str) -> int:
+    return zlib.crc32(ticker.upper().encode())
+
+
+def load_history(path: str) -> pd.DataFrame:
+    """Load a stored price history (date index, one column per ticker)"""
+    if path.endswith(".parquet"):
+        prices = pd.read_parquet(path)
+    else:
+        prices = pd.read_csv(path, index_col=0, parse_dates=True)
+    return prices.sort_index().ffill().dropna(axis=1, how="all")
+
+
+class SyntheticMarket:
+    """Deterministic, seeded generator of correlated OHLCV data"""
+
+    def __init__(
+        self,
+        seed: int = 0,
+        model: str = "gbm",
+        end_date: str = "2024-12-31",
+        n_factors: int = 3,
+        factor_share: float = 0.35,
+        mean_drift: float = 0.08,
+        mean_vol: float = 0.28,
+        jump_intensity: float = 3.0,
+        jump_mean: float = -0.02,
+        jump_std: float = 0.05,
+        market_jump_intensity: float = 0.5,
+        market_jump_mean: float = -0.06,
+        market_jump_std: float = 0.04,
+        history: Optional[pd.DataFrame] = None,
+        block_size: int = 20,
+    ):
+        if model not in ("gbm", "jump", "bootstrap"):
+            raise ValueError(f"Unknown synthetic model: {model}")
+        if model == "bootstrap" and history is None:
+            raise ValueError("The bootstrap model needs a stored price history")
+
+        self.seed = seed
+        self.model = model
+        self.calendar = pd.bdate_range(end=end_date, periods=MAX_BARS, name="Date")
+        self.n_factors = n_factors
+        self.factor_share = factor_share
+        self.mean_drift = mean_drift
+        self.mean_vol = mean_vol
+        self.jump_intensity = jump_intensity
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+        self.market_jump_intensity = market_jump_intensity
+        self.market_jump_mean = market_jump_mean
+        self.market_jump_std = market_jump_std
+        self.block_size = block_size
+
+        # Shared state: factor shocks, market jumps and bootstrap row indices
+        # are common to every ticker, which is what correlates them
+        common = np.random.default_rng([seed, 0])
+        self._factors = common.standard_normal((MAX_BARS, n_factors))
+        dt = 1.0 / TRADING_DAYS
+        market_jumps = common.poisson(market_jump_intensity * dt, MAX_BARS)
+        self._market_jumps = market_jumps * market_jump_mean + np.sqrt(
+            market_jumps
+        ) * market_jump_std * common.standard_normal(MAX_BARS)
+
+        if model == "bootstrap":
+            log_prices = np.log(history.astype(float))
+            self._history = log_prices.diff().iloc[1:].fillna(0.0)
+            self._history_columns = {c.upper(): i for i, c in enumerate(self._history.columns)}
+            self._bootstrap_rows = self._block_indices(common, len(self._history))
+
+    def _block_indices(self, rng: np.random.Generator, n_rows: int) -> np.ndarray:
+        """Row indices of a circular block bootstrap covering the calendar"""
+        block = min(self.block_size, n_rows)
+        n_blocks = -(-MAX_BARS // block)
+        starts = rng.integers(0, n_rows, n_blocks)
+        rows = (starts[:, None] + np.arange(block)[None, :]) % n_rows
+        return rows.ravel()[:MAX_BARS]
+
+    # ----------------- Returns -----------------
+
+    def _log_returns(self, ticker: str) -> np.ndarray:
+        """Daily log returns of one ticker over the full calendar"""
+        rng = np.random.default_rng([self.seed, _ticker_seed(ticker)])
+
+        if self.model == "bootstrap":
+            col = self._history_columns.get(ticker.upper())
+            if col is None:
+                # Unknown tickers borrow a stored column chosen by name hash
+                col = _ticker_seed(ticker) % self._history.shape[1]
+            return self._history.values[self._bootstrap_rows, col]
+
+        dt = 1.0 / TRADING_DAYS
+        vol = self.mean_vol * rng.lognormal(0.0, 0.35)
+        drift = self.mean_drift + rng.normal(0.0, 0.05)
+        loadings = rng.normal(0.0, 1.0, self.n_factors)
+        loadings[0] = abs(loadings[0]) + 1.0  # Everyone loads on the market factor
+        loadings /= np.linalg.norm(loadings)
+
+        shocks = np.sqrt(self.factor_share) * (self._factors @ loadings) + np.sqrt(
+            1.0 - self.factor_share
+        ) * rng.standard_normal(MAX_BARS)
+        log_ret = (drift - 0.5 * vol**2) * dt + vol * np.sqrt(dt) * shocks
+
+        if self.model == "jump":
+            beta = loadings[0]
+            n_jumps = rng.poisson(self.jump_intensity * dt, MAX_BARS)
+            log_ret += n_jumps * self.jump_mean + np.sqrt(n_jumps) * self.jump_std * rng.standard_normal(MAX_BARS)
+            log_ret += beta * self._market_jumps
+
+        return log_ret
+
+    def _window(self, period: Optional[str], start=None, end=None) -> slice:
+        if start is not None or end is not None:
+            lo = 0 if start is None else self.calendar.searchsorted(pd.Timestamp(start))
+            hi = len(self.calendar) if end is None else self.calendar.searchsorted(pd.Timestamp(end))
+            return slice(lo, hi)
+        bars = period_to_bars(period or "max", self.calendar)
+        return slice(len(self.calendar) - bars, len(self.calendar))
+
+    # ----------------- Panels -----------------
+
+    def ohlcv(self, ticker: str, period: str = "max", start=None, end=None) -> pd.DataFrame:
+        """OHLCV frame for one ticker, shaped like yf.download(ticker)"""
+        window = self._window(period, start, end)
+        log_ret = self._log_returns(ticker)
+        base = 20.0 + _ticker_seed(ticker) % 480
+        close = base * np.exp(np.cumsum(log_ret))
+
+        rng = np.random.default_rng([self.seed, _ticker_seed(ticker), 1])
+        open_ = np.empty_like(close)
+        open_[0] = base
+        open_[1:] = close[:-1] * np.exp(rng.normal(0.0, 0.004, MAX_BARS - 1))
+        spread = np.abs(rng.normal(0.0, 0.008, MAX_BARS))
+        high = np.maximum(open_, close) * (1 + spread)
+        low = np.minimum(open_, close) * (1 - spread)
+        volume = rng.lognormal(13.0, 0.5, MAX_BARS).round()
+
+        frame = pd.DataFrame(
+            {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume},
+            index=self.calendar,
+        )
+        return frame.iloc[window]
+
+    def close_panel(self, tickers: Sequence[str], period: str = "max", start=None, end=None) -> pd.DataFrame:
+        """Close prices (dates x tickers)"""
+        window = self._window(period, start, end)
+        closes = {}
+        for ticker in tickers:
+            base = 20.0 + _ticker_seed(ticker) % 480
+            closes[ticker] = base * np.exp(np.cumsum(self._log_returns(ticker)))[window]
+        return pd.DataFrame(closes, index=self.calendar[window])
+
+    def iter_close_panels(
+        self, tickers: Sequence[str], period: str = "max", chunk_size: int = 500
+    ) -> Iterator[pd.DataFrame]:
+        """Close panels in ticker chunks, for universes too big to hold at once"""
+        for i in range(0, len(tickers), chunk_size):
+            yield self.close_panel(tickers[i : i + chunk_size], period)
+
+    # ----------------- yfinance-compatible API -----------------
+
+    def download(
+        self,
+        tickers: Union[str, Sequence[str]],
+        period: Optional[str] = None,
+        start=None,
+        end=None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Mimic yf.download: flat OHLCV columns for a single ticker, (field,
+        ticker) MultiIndex columns for several.
+        """
+        if isinstance(tickers, str):
+            tickers = tickers.replace(",", " ").split()
+        if period is None and start is None and end is None:
+            period = "1mo"
+        if len(tickers) == 1:
+            return self.ohlcv(tickers[0], period, start, end)
+
+        frames = {t: self.ohlcv(t, period, start, end) for t in tickers}
+        panel = pd.concat(frames, axis=1)  # (ticker, field)
+        panel = panel.swaplevel(0, 1, axis=1).sort_index(axis=1, level=0)
+        panel.columns.names = ["Price", "Ticker"]
+        return panel
+
+    def history(self, ticker: str, period: str = "1mo", interval: str = "1d") -> pd.DataFrame:
+        """Mimic yf.Ticker.history (daily bars only; interval is ignored)"""
+        frame = self.ohlcv(ticker, period).copy()
+        frame["Dividends"] = 0.0
+        frame["Stock Splits"] = 0.0
+        return frame
+
+    def info(self, ticker: str) -> Dict:
+        """Minimal stand-in for yf.Ticker.info"""
+        close = self.ohlcv(ticker, "5d")["Close"]
+        return {
+            "symbol": ticker.upper(),
+            "shortName": f"Synthetic {ticker.upper()}",
+            "currency": "INR" if ticker.upper().endswith((".NS", ".BO")) else "USD",
+            "regularMarketPrice": float(close.iloc[-1]),
+            "previousClose": float(close.iloc[-2]),
+            "synthetic": True,
+        }
+
+
+class SyntheticTicker:
+    """yf.Ticker look-alike backed by a SyntheticMarket"""
+
+    def __init__(self, market: SyntheticMarket, ticker: str):
+        self.market = market
+        self.ticker = ticker
+
+    def history(self, period: str = "1mo", interval: str = "1d", **kwargs) -> pd.DataFrame:
+        return self.market.history(self.ticker, period, interval)
+
+    @property
+    def info(self) -> Dict:
+        return self.market.info(self.ticker)
+
+
+_market: Optional[SyntheticMarket] = None
+
+
+def get_market() -> SyntheticMarket:
+    """Process-wide SyntheticMarket configured from the environment"""
+    global _market
+    if _market is None:
+        history_path = os.environ.get("SYNTHETIC_HISTORY")
+        _market = SyntheticMarket(
+            seed=int(os.environ.get("SYNTHETIC_SEED", "0")),
+            model=os.environ.get("SYNTHETIC_MODEL", "gbm"),
+            end_date=os.environ.get("SYNTHETIC_END_DATE", "2024-12-31"),
+            history=load_history(history_path) if history_path else None,
+        )
+    return _market
@@ -0,0 +1,28 @@
+"""
+Shared process pool for CPU-bound work: /optimize/batch, resampling,
+walk-forward, and large /simulate and projection runs.
+
+OPTIMIZE_WORKERS (environment, default the CPU count) sets its size. Tasks
+are pickled by reference, so a spawned worker imports only the modules that
+define the tasks it runs.
+"""
+
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+OPTIMIZE_WORKERS = int(os.environ.get("OPTIMIZE_WORKERS", "0")) or os.cpu_count() or 1
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """The shared process pool, started on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: forking a threaded server process can deadlock the children
+            _process_pool = ProcessPoolExecutor(max_workers=OPTIMIZE_WORKERS, mp_context=mp.get_context("spawn"))
+        return _process_pool
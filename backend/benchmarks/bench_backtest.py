@@ -0,0 +1,340 @@
+"""
+Offline benchmark for the /backtest pipeline.
+
+Runs the full backtest_route through Flask's test client with a
+deterministic stand-in for Gemini (canned strategies) and seeded OHLCV
+from app.synthetic_data, so no network access or API key is needed. Each
+scenario runs in a fresh process so its peak RSS is measured in isolation.
+
+Usage (from backend/):
+    python -m benchmarks.bench_backtest --output bench_backtest.json
+    python -m benchmarks.bench_backtest --quick --compare old.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from queue import Empty
+from unittest import mock
+
+# ----------------- Deterministic LLM Stand-in -----------------
+
+CANNED_STRATEGIES = {
+    "simple": """class UserStrategy(Strategy):
+    def init(self):
+        def sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().bfill().values
+
+        self.fast = self.I(sma, self.data.Close, 10)
+        self.slow = self.I(sma, self.data.Close, 30)
+
+    def next(self):
+        if len(self.data.Close) < 30:
+            return
+
+        price = self.data.Close[-1]
+
+        if not self.position:
+            if self.fast[-1] > self.slow[-1] and self.fast[-2] <= self.slow[-2]:
+                self.buy(sl=price * 0.95, tp=price * 1.10)
+        elif self.position:
+            if self.fast[-1] < self.slow[-1]:
+                self.position.close()
+""",
+    "medium": """class UserStrategy(Strategy):
+    def init(self):
+        def rsi(arr, period=14):
+            delta = pd.Series(arr).diff()
+            gain = delta.where(delta > 0, 0).rolling(period).mean()
+            loss = -delta.where(delta < 0, 0).rolling(period).mean()
+            rs = gain / loss
+            return (100 - 100/(1 + rs)).fillna(50).values
+
+        def sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().bfill().values
+
+        self.rsi = self.I(rsi, self.data.Close, 14)
+        self.sma200 = self.I(sma, self.data.Close, 200)
+
+    def next(self):
+        if len(self.data.Close) < 200:
+            return
+
+        price = self.data.Close[-1]
+
+        if not self.position:
+            if self.rsi[-1] < 35 and price > self.sma200[-1]:
+                self.buy(sl=price * 0.97, tp=price * 1.06)
+        elif self.position:
+            if self.rsi[-1] > 65:
+                self.position.close()
+""",
+    "complex": """class UserStrategy(Strategy):
+    def init(self):
+        def ema(arr, n):
+            return pd.Series(arr).ewm(span=n).mean().values
+
+        def macd_line(close):
+            return (pd.Series(close).ewm(span=12).mean() - pd.Series(close).ewm(span=26).mean()).values
+
+        def signal_line(close):
+            macd = pd.Series(close).ewm(span=12).mean() - pd.Series(close).ewm(span=26).mean()
+            return macd.ewm(span=9).mean().values
+
+        def atr(high, low, close, period=14):
+            h = pd.Series(high)
+            l = pd.Series(low)
+            c = pd.Series(close)
+            tr = pd.concat([h - l, abs(h - c.shift()), abs(l - c.shift())], axis=1).max(axis=1)
+            return tr.rolling(period).mean().bfill().values
+
+        def vol_sma(arr, n):
+            return pd.Series(arr).rolling(n).mean().bfill().values
+
+        self.ema50 = self.I(ema, self.data.Close, 50)
+        self.macd = self.I(macd_line, self.data.Close)
+        self.signal = self.I(signal_line, self.data.Close)
+        self.atr = self.I(atr, self.data.High, self.data.Low, self.data.Close, 14)
+        self.vol_avg = self.I(vol_sma, self.data.Volume, 20)
+
+    def next(self):
+        if len(self.data.Close) < 60:
+            return
+
+        price = self.data.Close[-1]
+
+        if not self.position:
+            cross_up = self.macd[-1] > self.signal[-1] and self.macd[-2] <= self.signal[-2]
+            if cross_up and price > self.ema50[-1] and self.data.Volume[-1] > self.vol_avg[-1] * 0.8:
+                atr_val = self.atr[-1]
+                self.buy(sl=price - 1.5 * atr_val, tp=price + 3 * atr_val)
+        elif self.position:
+            if self.macd[-1] < self.signal[-1]:
+                self.position.close()
+""",
+}
+
+CANNED_ANALYSIS = "Benchmark analysis text."
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Mimics genai.GenerativeModel.generate_content with canned output"""
+
+    def __init__(self, complexity: str, latency: float = 0.0):
+        self.strategy = CANNED_STRATEGIES[complexity]
+        self.latency = latency
+
+    def generate_content(self, prompt, request_options=None):
+        if self.latency:
+            time.sleep(self.latency)
+        if "UserStrategy" in prompt and "USER REQUEST" in prompt:
+            return _FakeResponse(self.strategy)
+        return _FakeResponse(CANNED_ANALYSIS)
+
+
+# ----------------- Scenarios -----------------
+
+FULL_GRID = {
+    "tickers": [1, 5, 20],
+    "bars": [250, 1000, 2500],
+    "complexity": ["simple", "medium", "complex"],
+}
+QUICK_GRID = {
+    "tickers": [1, 5],
+    "bars": [500],
+    "complexity": ["simple", "complex"],
+}
+# Seconds before an isolated scenario is killed and recorded as failed
+SCENARIO_TIMEOUT = 1800
+
+
+def run_scenario(tickers: int, bars: int, complexity: str, repeats: int, llm_latency: float) -> dict:
+    """Run one scenario in the current process and return its measurements"""
+    from app import create_app
+    from app.synthetic_data import SyntheticMarket
+    import app.llm_providers as llm_providers
+    import app.routes.backtest as backtest
+
+    # Per-ticker logging would dominate the timings
+    backtest.logger.setLevel(logging.WARNING)
+    llm_providers.logger.setLevel(logging.WARNING)
+
+    app = create_app()
+    client = app.test_client()
+    market = SyntheticMarket(seed=0)
+    symbols = [f"SYN{i:04d}" for i in range(tickers)]
+    payload = {"query": f"benchmark {complexity} strategy", "tickers": symbols}
+
+    latencies = []
+    with mock.patch.object(backtest, "get_llm", lambda: FakeModel(complexity, llm_latency)), \
+            mock.patch.object(backtest, "get_groq_provider", lambda: None), \
+            mock.patch.object(backtest, "fetch_data", lambda t, period: market.ohlcv(t).iloc[-bars:]):
+        # Warm-up request (imports, strategy compile caches)
+        response = client.post("/backtest", json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"/backtest returned {response.status_code}: {response.get_data(as_text=True)[:300]}")
+
+        for _ in range(repeats):
+            start = time.perf_counter()
+            client.post("/backtest", json=payload)
+            latencies.append(time.perf_counter() - start)
+
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "tickers": tickers,
+        "bars": bars,
+        "complexity": complexity,
+        "repeats": repeats,
+        "latency_s": {
+            "mean": round(total / repeats, 4),
+            "median": round(statistics.median(latencies), 4),
+            "p95": round(latencies[min(repeats - 1, int(0.95 * repeats))], 4),
+            "min": round(latencies[0], 4),
+        },
+        "throughput": {
+            "requests_per_s": round(repeats / total, 3),
+            "ticker_backtests_per_s": round(repeats * tickers / total, 3),
+            "bars_per_s": round(repeats * tickers * bars / total, 1),
+        },
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            / (1024 * 1024 if sys.platform == "darwin" else 1024),
+            1,
+        ),
+    }
+
+
+def _scenario_worker(args, queue):
+    try:
+        queue.put(run_scenario(*args))
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+
+def run_isolated(args, timeout: float = SCENARIO_TIMEOUT) -> dict:
+    """
+    Run a scenario in a fresh process so peak RSS is per-scenario. A child
+    that dies without a result (crash, OOM kill) or runs past `timeout`
+    seconds is recorded as a failed scenario.
+    """
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_scenario_worker, args=(args, queue))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            if not proc.is_alive():
+                # The result may have been queued just before the exit
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    result = {"error": f"scenario process exited with code {proc.exitcode} without a result"}
+            elif time.monotonic() > deadline:
+                proc.terminate()
+                result = {"error": f"scenario timed out after {timeout:g}s"}
+    proc.join()
+    return result
+
+
+# ----------------- Report -----------------
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def scenario_key(s: dict) -> tuple:
+    return (s["tickers"], s["bars"], s["complexity"])
+
+
+def compare(report: dict, baseline: dict):
+    """Print median-latency and peak-RSS deltas against a previous report"""
+    old = {scenario_key(s): s for s in baseline.get("scenarios", []) if "error" not in s}
+    print(f"\nComparison vs {baseline.get('git_commit', '?')}:")
+    print(f"{'tickers':>7} {'bars':>6} {'complexity':>10} {'median_s':>10} {'delta':>8} {'rss_mb':>8} {'delta':>8}")
+    for s in report["scenarios"]:
+        if "error" in s or scenario_key(s) not in old:
+            continue
+        prev = old[scenario_key(s)]
+        lat, prev_lat = s["latency_s"]["median"], prev["latency_s"]["median"]
+        rss, prev_rss = s["peak_rss_mb"], prev["peak_rss_mb"]
+        print(
+            f"{s['tickers']:>7} {s['bars']:>6} {s['complexity']:>10} {lat:>10.4f} "
+            f"{(lat / prev_lat - 1) * 100:>+7.1f}% {rss:>8.1f} {(rss / prev_rss - 1) * 100:>+7.1f}%"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline /backtest benchmark")
+    parser.add_argument("--quick", action="store_true", help="Run a small scenario grid")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed requests per scenario")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated LLM latency per call (s)")
+    parser.add_argument("--no-isolate", action="store_true", help="Run all scenarios in this process")
+    parser.add_argument("--timeout", type=float, default=SCENARIO_TIMEOUT, help="Seconds per isolated scenario")
+    parser.add_argument("--output", default="bench_backtest.json", help="JSON report path")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    grid = QUICK_GRID if args.quick else FULL_GRID
+    scenarios = []
+    for tickers, bars, complexity in itertools.product(grid["tickers"], grid["bars"], grid["complexity"]):
+        scenario_args = (tickers, bars, complexity, args.repeats, args.llm_latency)
+        result = run_scenario(*scenario_args) if args.no_isolate else run_isolated(scenario_args, args.timeout)
+        result.update({"tickers": tickers, "bars": bars, "complexity": complexity})
+        scenarios.append(result)
+        if "error" in result:
+            print(f"✗ tickers={tickers} bars={bars} {complexity}: {result['error']}")
+        else:
+            print(
+                f"✓ tickers={tickers:<3} bars={bars:<5} {complexity:<8} "
+                f"median={result['latency_s']['median']:.3f}s "
+                f"bars/s={result['throughput']['bars_per_s']:.0f} "
+                f"rss={result['peak_rss_mb']}MB"
+            )
+
+    report = {
+        "benchmark": "backtest_route",
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "llm_latency_s": args.llm_latency,
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()